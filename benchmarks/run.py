@@ -0,0 +1,283 @@
+"""
+Benchmark sphinx-git's directives against synthetic repositories.
+
+Repositories are generated with ``git fast-import`` (so even a million
+commits only takes a minute or two) and kept in a cache directory between
+runs.  Each benchmark case runs a directive several times with a fresh build
+context and reports the median wall-clock time and the peak Python memory
+allocated during a run.
+
+Run ``python benchmarks/run.py --help`` for the available options.  This
+script needs Python 3.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from mock import Mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# pylint: disable=wrong-import-position
+from sphinx_git import GitChangelog, GitCommitDetail  # noqa: E402
+from sphinx_git.config import BACKENDS, BuildSettings  # noqa: E402
+from sphinx_git.context import BuildContext, set_context  # noqa: E402
+
+# Commits between the lightweight tags v1, v2, ... in generated histories.
+TAG_INTERVAL = 1000
+# Number of top-level directories files are spread over.
+DIRECTORIES = 50
+
+
+def _data(text):
+    data = text.encode('utf-8')
+    return b'data ' + str(len(data)).encode('ascii') + b'\n' + data + b'\n'
+
+
+class HistoryWriter(object):
+    """Write a fast-import stream describing a synthetic history."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.mark = 0
+        self.timestamp = 1400000000
+
+    def commit(self, ref, message, parents, paths):
+        self.mark += 1
+        self.timestamp += 60
+        out = [b'commit ' + ref.encode('ascii'),
+               b'mark :' + str(self.mark).encode('ascii'),
+               'author Bench Author <bench@example.com> {0} +0000'.format(
+                   self.timestamp).encode('ascii'),
+               'committer Bench Author <bench@example.com> {0} +0000'.format(
+                   self.timestamp).encode('ascii')]
+        self.stream.write(b'\n'.join(out) + b'\n')
+        self.stream.write(_data(message))
+        if parents:
+            self.stream.write(b'from :' + str(parents[0]).encode('ascii') +
+                              b'\n')
+        for parent in parents[1:]:
+            self.stream.write(b'merge :' + str(parent).encode('ascii') +
+                              b'\n')
+        for path in paths:
+            self.stream.write(b'M 644 inline ' + path.encode('utf-8') + b'\n')
+            self.stream.write(_data('{0} {1}\n'.format(path, self.mark)))
+        self.stream.write(b'\n')
+        return self.mark
+
+    def tag(self, name, mark):
+        self.stream.write('reset refs/tags/{0}\nfrom :{1}\n\n'.format(
+            name, mark).encode('ascii'))
+
+
+def _path(n):
+    return 'dir{0:02d}/sub{1}/file{2}.txt'.format(
+        n % DIRECTORIES, n % 7, n % 1000)
+
+
+def write_history(stream, commits, shape):
+    """
+    Write ``commits`` commits of the given ``shape`` to ``stream``.
+
+    ``linear`` is a straight line of small commits; ``wide`` starts from a
+    root commit adding 20000 files; ``merges`` merges a two-commit side
+    branch every ten commits.
+    """
+    writer = HistoryWriter(stream)
+    tip = None
+    count = 0
+    next_tag = TAG_INTERVAL
+    if shape == 'wide':
+        tip = writer.commit('refs/heads/master', 'Add a wide tree', [],
+                            [_path(n) + '.{0}'.format(n)
+                             for n in range(20000)])
+        count = 1
+    while count < commits:
+        if shape == 'merges' and count % 10 == 9 and tip is not None:
+            side = writer.commit('refs/heads/side', 'Side commit', [tip],
+                                 [_path(count) + '.side'])
+            side = writer.commit('refs/heads/side', 'Side commit', [side],
+                                 [_path(count + 1) + '.side'])
+            tip = writer.commit('refs/heads/master', 'Merge side branch',
+                                [tip, side], [])
+            count += 3
+        else:
+            tip = writer.commit(
+                'refs/heads/master',
+                'Commit number {0}\n\nTouching {1}.\n'.format(
+                    count, _path(count)),
+                [tip] if tip is not None else [], [_path(count)])
+            count += 1
+        if count >= next_tag:
+            writer.tag('v{0}'.format(next_tag // TAG_INTERVAL), tip)
+            next_tag += TAG_INTERVAL
+
+
+def make_repository(cache_dir, commits, shape):
+    path = os.path.join(cache_dir, '{0}-{1}'.format(shape, commits))
+    if os.path.isdir(os.path.join(path, '.git')):
+        return path
+    subprocess.check_call(['git', 'init', '-q', path])
+    proc = subprocess.Popen(['git', 'fast-import', '--quiet'], cwd=path,
+                            stdin=subprocess.PIPE)
+    write_history(proc.stdin, commits, shape)
+    proc.stdin.close()
+    if proc.wait() != 0:
+        raise RuntimeError('git fast-import failed for ' + path)
+    subprocess.check_call(['git', 'checkout', '-q', 'master'], cwd=path)
+    return path
+
+
+def _directive(directive_class, root, options):
+    directive = directive_class.__new__(directive_class)
+    directive.lineno = 1
+    directive.options = dict(options)
+    directive.state = Mock()
+    directive.state.document.settings.env.srcdir = root
+    return directive
+
+
+def cases(commits):
+    """Return (name, directive class, options) for each benchmark case."""
+    last_tag = commits // TAG_INTERVAL
+    tag_range = 'v{0}..v{1}'.format(last_tag - 1, last_tag)
+    return [
+        ('changelog-default', GitChangelog, {}),
+        ('changelog-revisions-1000', GitChangelog, {'revisions': 1000}),
+        ('changelog-tag-range', GitChangelog, {'rev-list': tag_range}),
+        ('changelog-filter-prefix', GitChangelog,
+         {'rev-list': tag_range, 'filename_filter': r'dir07/.*'}),
+        ('changelog-filter-regex', GitChangelog,
+         {'rev-list': tag_range, 'filename_filter': r'.*/file7\.txt'}),
+        ('changelog-filter-full-history', GitChangelog,
+         {'rev-list': 'HEAD', 'filename_filter': r'dir07/sub3/'}),
+        ('changelog-filter-max-matches', GitChangelog,
+         {'rev-list': 'HEAD', 'filename_filter': r'.*/file7\.txt',
+          'max-matches': 2}),
+        ('changelog-first-parent', GitChangelog,
+         {'rev-list': 'HEAD', 'first-parent': None,
+          'filename_filter': r'dir07/sub3/'}),
+        ('changelog-merges-only', GitChangelog,
+         {'rev-list': 'HEAD', 'merges-only': None, 'collapse-after': 100}),
+        ('changelog-group-by-tag', GitChangelog,
+         {'rev-list': 'HEAD', 'group-by-tag': None, 'collapse-after': 1000}),
+        ('commit-detail', GitCommitDetail,
+         {'branch': True, 'commit': True, 'uncommitted': True,
+          'untracked': True, 'no_github_link': True}),
+    ]
+
+
+def _run_once(directive_class, root, options, settings):
+    directive = _directive(directive_class, root, options)
+    context = BuildContext(settings)
+    set_context(directive.state.document.settings.env, context)
+    try:
+        directive.run()
+    finally:
+        context.close()
+
+
+def measure(directive_class, root, options, repeat, settings):
+    """
+    Return the median time and the peak traced memory of running a directive.
+
+    Memory is measured in a separate run, so that tracing overhead doesn't
+    distort the timings.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        _run_once(directive_class, root, options, settings)
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        _run_once(directive_class, root, options, settings)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return statistics.median(times), peak
+
+
+def build_settings(args, root):
+    doctreedir = None
+    if args.path_index:
+        doctreedir = os.path.join(root, '.git', 'sphinx-git')
+    return BuildSettings(doctreedir=doctreedir,
+                         commit_graph=args.commit_graph,
+                         path_index=args.path_index,
+                         backend_class=BACKENDS[args.backend],
+                         diff_jobs=args.diff_jobs)
+
+
+def _history_size(value):
+    commits = int(value)
+    # The tag-range cases compare the last two tags.
+    if commits < 2 * TAG_INTERVAL:
+        raise argparse.ArgumentTypeError(
+            'histories need at least {0} commits (two tags)'.format(
+                2 * TAG_INTERVAL))
+    return commits
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--commits', type=_history_size, nargs='+',
+                        default=[10000, 100000],
+                        help='history sizes to test (default: 10000 100000;'
+                        ' add 1000000 for the full suite)')
+    parser.add_argument('--shapes', nargs='+',
+                        default=['linear', 'wide', 'merges'],
+                        choices=['linear', 'wide', 'merges'])
+    parser.add_argument('--cases', nargs='+',
+                        help='only run cases whose names contain any of'
+                        ' these strings')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--cache-dir', default=os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), '.repos'))
+    parser.add_argument('--json', help='also write results to this file')
+    parser.add_argument('--commit-graph', action='store_true',
+                        help='write and use commit-graphs (as with the'
+                        ' sphinx_git_commit_graph option)')
+    parser.add_argument('--path-index', action='store_true',
+                        help='keep changed-path indexes (as with the'
+                        ' sphinx_git_path_index option); the first run of'
+                        ' each case builds them')
+    parser.add_argument('--backend', default='git', choices=list(BACKENDS),
+                        help='how repositories are read (as with the'
+                        ' sphinx_git_backend option)')
+    parser.add_argument('--diff-jobs', type=int, default=1,
+                        help='diff processes to run at once (as with the'
+                        ' sphinx_git_diff_jobs option)')
+    args = parser.parse_args(argv)
+
+    results = []
+    print('{0:<16} {1:<32} {2:>12} {3:>12}'.format(
+        'repository', 'case', 'median ms', 'peak KiB'))
+    for shape in args.shapes:
+        for commits in args.commits:
+            root = make_repository(args.cache_dir, commits, shape)
+            for name, directive_class, options in cases(commits):
+                if args.cases and not any(c in name for c in args.cases):
+                    continue
+                seconds, peak = measure(
+                    directive_class, root, options, args.repeat,
+                    build_settings(args, root))
+                repository = '{0}-{1}'.format(shape, commits)
+                results.append({'repository': repository, 'case': name,
+                                'median_seconds': seconds,
+                                'peak_bytes': peak})
+                print('{0:<16} {1:<32} {2:>12.1f} {3:>12.0f}'.format(
+                    repository, name, seconds * 1000, peak / 1024.0))
+                sys.stdout.flush()
+    if args.json:
+        with open(args.json, 'w') as json_file:
+            json.dump(results, json_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -12,6 +12,7 @@ setup(
     author='Daniel Watkins',
     author_email='daniel@daniel-watkins.co.uk',
     install_requires=['six', 'sphinx', 'GitPython>=0.3.6'],
+    extras_require={'pygit2': ['pygit2']},
     url="https://github.com/OddBloke/sphinx-git",
     packages=['sphinx_git'],
 )
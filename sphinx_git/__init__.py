@@ -13,21 +13,52 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-import re
+import os
 from datetime import datetime
 
-import six
 from docutils import nodes
 from docutils.parsers.rst import Directive, directives
-from git import Repo
 
+from . import prefetch, stats, tags, tracking
+from .config import TEXT_TYPE
+from .context import (
+    build_finished,
+    builder_inited,
+    env_merge_info,
+    get_context,
+)
+from .deferred import doctree_resolved, make_placeholder
+from .markup import changelog_markup
+from .process import repo_name, work_dir
+from .query import ChangelogQuery
+from .repos import find_repos
+from .tracking import (
+    ChangelogInput,
+    CommitDetailInput,
+    LastUpdatedInput,
+    TagsInput,
+    note_input,
+)
+from .version import __version__
 
-# pylint: disable=too-few-public-methods, abstract-method
+
+# pylint: disable=too-few-public-methods
 class GitDirectiveBase(Directive):
+    def run(self):
+        env = self.state.document.settings.env
+        with get_context(env).timing(type(self).__name__, env.docname,
+                                     self.lineno):
+            return self._run()
+
+    def _run(self):
+        """Return the directive's nodes; subclasses override this."""
+        return []
+
     def _find_repo(self):
         env = self.state.document.settings.env
         repo_dir = self.options.get('repo-dir', env.srcdir)
-        repo = Repo(repo_dir, search_parent_directories=True)
+        with stats.phase('open'):
+            repo = get_context(env).find_repo(repo_dir)
         return repo
 
 
@@ -45,15 +76,26 @@ class GitCommitDetail(GitDirectiveBase):
     }
 
     # pylint: disable=attribute-defined-outside-init
-    def run(self):
+    def _run(self):
         self.repo = self._find_repo()
-        self.branch_name = None
-        if not self.repo.head.is_detached:
-            self.branch_name = self.repo.head.ref.name
-        self.commit = self.repo.commit()
+        env = self.state.document.settings.env
+        context = get_context(env)
+        self.backend = context.backend(self.repo)
+        head = self.backend.head()
+        self.branch_name = head.branch
+        self.hexsha = head.hexsha
         self.sha_length = self.options.get('sha_length',
                                            self.default_sha_length)
-        markup = self._build_markup()
+        self.status = None
+        if 'uncommitted' in self.options or 'untracked' in self.options:
+            self.status = context.working_tree_status(
+                self.repo, 'untracked' in self.options)
+        if context.settings.track_changes:
+            note_input(env, CommitDetailInput.create(
+                context, self.repo, 'uncommitted' in self.options,
+                'untracked' in self.options))
+        with stats.phase('markup'):
+            markup = self._build_markup()
         return markup
 
     def _build_markup(self):
@@ -77,33 +119,87 @@ class GitCommitDetail(GitDirectiveBase):
             field = nodes.field()
             field += [name, body]
             field_list.append(field)
-        if 'uncommitted' in self.options and self.repo.is_dirty():
+        if 'uncommitted' in self.options and self.status.dirty:
             item.append(nodes.warning('', nodes.inline(
                 text="There were uncommitted changes when this was compiled."
             )))
-        if 'untracked' in self.options and self.repo.untracked_files:
+        if 'untracked' in self.options and self.status.untracked:
             item.append(nodes.warning('', nodes.inline(
                 text="There were untracked files when this was compiled."
             )))
         return [item]
 
     def _github_link(self):
-        try:
-            url = self.repo.remotes.origin.url
-            url = url.replace('.git/', '').replace('.git', '')
-            if 'github' in url:
-                commit_url = url + '/commit/' + self.commit.hexsha
-                ref = nodes.reference('', self.commit.hexsha[:self.sha_length],
-                                      refuri=commit_url)
-                par = nodes.paragraph('', '', ref)
-                return par
-            return self._commit_text_node()
-        except AttributeError as error:
-            print("ERROR: ", error)
+        url = self.backend.remote_url('origin')
+        if url is None:
             return self._commit_text_node()
+        url = url.replace('.git/', '').replace('.git', '')
+        if 'github' in url:
+            commit_url = url + '/commit/' + self.hexsha
+            ref = nodes.reference('', self.hexsha[:self.sha_length],
+                                  refuri=commit_url)
+            par = nodes.paragraph('', '', ref)
+            return par
+        return self._commit_text_node()
 
     def _commit_text_node(self):
-        return nodes.emphasis(text=self.commit.hexsha[:self.sha_length])
+        return nodes.emphasis(text=self.hexsha[:self.sha_length])
+
+
+def _text(argument):
+    # Option conversion only happens when a directive is run, so loading the
+    # extension doesn't import six.
+    import six  # pylint: disable=import-outside-toplevel
+    return six.text_type(argument)
+
+
+# pylint: disable=too-few-public-methods
+class GitLastUpdated(GitDirectiveBase):
+    default_sha_length = 7
+
+    option_spec = {
+        'file': _text,
+        'repo-dir': _text,
+        'hide_author': bool,
+        'commit': bool,
+        'sha_length': int,
+    }
+
+    def _run(self):
+        env = self.state.document.settings.env
+        context = get_context(env)
+        repo = self._find_repo()
+        if 'file' in self.options:
+            source = env.relfn2path(self.options['file'], env.docname)[1]
+        else:
+            source = env.doc2path(env.docname)
+        path = os.path.relpath(os.path.realpath(source),
+                               os.path.realpath(work_dir(repo)))
+        path = path.replace(os.sep, '/')
+        change = context.last_changes(repo).get(path)
+        if context.settings.track_changes:
+            note_input(env, LastUpdatedInput.create(repo, path, change))
+        if change is None:
+            # The file has never been committed.
+            return []
+        with stats.phase('markup'):
+            markup = self._build_markup(change)
+        return markup
+
+    def _build_markup(self, change):
+        date_str = datetime.fromtimestamp(change.authored_date)
+        par = nodes.paragraph(classes=['sphinx-git-last-updated'])
+        par += [nodes.inline(text='Last updated at '),
+                nodes.emphasis(text=str(date_str))]
+        if 'hide_author' not in self.options:
+            par += [nodes.inline(text=' by '),
+                    nodes.emphasis(text=change.author)]
+        if 'commit' in self.options:
+            sha_length = self.options.get('sha_length',
+                                          self.default_sha_length)
+            par += [nodes.inline(text=' in '),
+                    nodes.emphasis(text=change.hexsha[:sha_length])]
+        return [par]
 
 
 # pylint: disable=too-few-public-methods
@@ -111,96 +207,139 @@ class GitChangelog(GitDirectiveBase):
 
     option_spec = {
         'revisions': directives.nonnegative_int,
-        'rev-list': six.text_type,
+        'rev-list': _text,
         'detailed-message-pre': bool,
         'detailed-message-strong': bool,
-        'filename_filter': six.text_type,
+        'filename_filter': _text,
         'hide_author': bool,
         'hide_date': bool,
         'hide_details': bool,
-        'repo-dir': six.text_type,
+        'repo-dir': _text,
+        'collapse-after': directives.nonnegative_int,
+        'deferred': directives.flag,
+        'since': _text,
+        'until': _text,
+        'max-scan': directives.nonnegative_int,
+        'max-matches': directives.nonnegative_int,
+        'extra-repo-dirs': _text,
+        'submodules': directives.flag,
+        'group-by-tag': directives.flag,
+        'first-parent': directives.flag,
+        'merges-only': directives.flag,
     }
 
-    def run(self):
+    def _run(self):
         if 'rev-list' in self.options and 'revisions' in self.options:
             self.state.document.reporter.warning(
                 'Both rev-list and revisions options given; proceeding using'
                 ' only rev-list.',
                 line=self.lineno
             )
-        commits = self._commits_to_display()
-        markup = self._build_markup(commits)
+        repos = self._find_repos()
+        query = ChangelogQuery.from_options(self.options)
+        commits = self._commits_to_display(repos, query)
+        self._warn_if_truncated(commits)
+        stats.count('displayed', len(commits))
+        with stats.phase('markup'):
+            if 'deferred' in self.options:
+                context = get_context(self.state.document.settings.env)
+                # Relative dates would select different commits by the time
+                # the placeholder is rendered.
+                since, until = context.dates(query, repos[0])
+                markup = [make_placeholder(
+                    repos, query._replace(since=since, until=until),
+                    [context.resolve(query, repo) for repo in repos],
+                    self.options)]
+            else:
+                markup = self._build_markup(repos, commits)
         return markup
 
-    def _commits_to_display(self):
-        repo = self._find_repo()
-        commits = self._filter_commits(repo)
-        return commits
+    def _find_repos(self):
+        env = self.state.document.settings.env
+        repo_dir = self.options.get('repo-dir', env.srcdir)
+        extra_repo_dirs = self.options.get('extra-repo-dirs', '').split()
+        with stats.phase('open'):
+            repos = find_repos(get_context(env), repo_dir, extra_repo_dirs,
+                               'submodules' in self.options)
+        return repos
 
-    def _filter_commits(self, repo):
-        if 'rev-list' in self.options:
-            commits = repo.iter_commits(rev=self.options['rev-list'])
+    def _commits_to_display(self, repos, query):
+        env = self.state.document.settings.env
+        context = get_context(env)
+        changelogs = []
+        for repo in repos:
+            commits = context.find_commits(query, repo)
+            if context.settings.track_changes:
+                note_input(env, ChangelogInput.create(
+                    context, repo.working_dir, query, commits))
+                if 'group-by-tag' in self.options:
+                    note_input(env, TagsInput.create(context, repo))
+            changelogs.append((repo_name(repo), commits))
+        return query.merge(changelogs)
+
+    def _warn_if_truncated(self, commits):
+        truncated = getattr(commits, 'truncated', None)
+        if truncated == 'max-scan':
+            message = ('Only the {0} most recent commits were searched'
+                       ' (max-scan); older commits may also match.')
+        elif truncated == 'max-matches':
+            message = ('Only the {0} most recent matching commits are shown'
+                       ' (max-matches); older commits may also match.')
         else:
-            commits = repo.iter_commits()
-            revisions_to_display = self.options.get('revisions', 10)
-            commits = list(commits)[:revisions_to_display]
-        if 'filename_filter' in self.options:
-            return self._filter_commits_on_filenames(commits)
-        return commits
-
-    def _filter_commits_on_filenames(self, commits):
-        filtered_commits = []
-        filter_exp = re.compile(self.options.get('filename_filter', r'.*'))
-        for commit in commits:
-            # SHA of an empty tree found at
-            # http://stackoverflow.com/questions/33916648/get-the-diff-details-of-first-commit-in-gitpython
-            # will be used to get the list of files of initial commit
-            compared_with = '4b825dc642cb6eb9a060e54bf8d69288fbee4904'
-            if len(commit.parents) > 0:  # pylint: disable=len-as-condition
-                compared_with = commit.parents[0].hexsha
-            for diff in commit.diff(compared_with):
-                if filter_exp.match(diff.a_path) or \
-                        filter_exp.match(diff.b_path):
-                    filtered_commits.append(commit)
-                    break
-        return filtered_commits
-
-    def _build_markup(self, commits):
-        list_node = nodes.bullet_list()
-        for commit in commits:
-            date_str = datetime.fromtimestamp(commit.authored_date)
-            if '\n' in commit.message:
-                message, detailed_message = commit.message.split('\n', 1)
-            else:
-                message = commit.message
-                detailed_message = None
-
-            item = nodes.list_item()
-            par = nodes.paragraph()
-            # choose detailed message style by detailed-message-strong option
-            if self.options.get('detailed-message-strong', True):
-                par += nodes.strong(text=message)
-            else:
-                par += nodes.inline(text=message)
-
-            if not self.options.get('hide_author'):
-                par += [nodes.inline(text=" by "),
-                        nodes.emphasis(text=six.text_type(commit.author))]
-            if not self.options.get('hide_date'):
-                par += [nodes.inline(text=" at "),
-                        nodes.emphasis(text=str(date_str))]
-            item.append(par)
-            if detailed_message and not self.options.get('hide_details'):
-                detailed_message = detailed_message.strip()
-                if self.options.get('detailed-message-pre', False):
-                    item.append(
-                        nodes.literal_block(text=detailed_message))
-                else:
-                    item.append(nodes.paragraph(text=detailed_message))
-            list_node.append(item)
-        return [list_node]
+            return
+        self.state.document.reporter.warning(
+            message.format(self.options[truncated]), line=self.lineno)
+
+    def _build_markup(self, repos, commits):
+        releases = None
+        if 'group-by-tag' in self.options:
+            context = get_context(self.state.document.settings.env)
+            releases = tags.releases(
+                [context.tag_index(repo) for repo in repos], commits)
+        return changelog_markup(commits, self.options, releases)
+
+
+DIRECTIVES = {
+    'git_changelog': GitChangelog,
+    'git_commit_detail': GitCommitDetail,
+    'git_last_updated': GitLastUpdated,
+}
+
+
+def env_before_read_docs(app, env, docnames):
+    prefetch.prefetch(app, env, docnames, dict(
+        (name, directive.option_spec)
+        for name, directive in DIRECTIVES.items()))
 
 
 def setup(app):
-    app.add_directive('git_changelog', GitChangelog)
-    app.add_directive('git_commit_detail', GitCommitDetail)
+    for name, directive in sorted(DIRECTIVES.items()):
+        app.add_directive(name, directive)
+    app.add_config_value('sphinx_git_cache', True, '')
+    app.add_config_value('sphinx_git_cache_size', 50000, '')
+    app.add_config_value('sphinx_git_track_changes', True, '')
+    app.add_config_value('sphinx_git_timing', False, '')
+    app.add_config_value('sphinx_git_timing_json', None, '')
+    app.add_config_value('sphinx_git_commit_graph', False, '')
+    app.add_config_value('sphinx_git_path_index', False, '')
+    app.add_config_value('sphinx_git_prefetch', True, '')
+    app.add_config_value('sphinx_git_backend', 'git', '')
+    # A callable default, so that -D passes 'auto' through rather than
+    # insisting on an int.
+    app.add_config_value('sphinx_git_diff_jobs', lambda config: 1, '',
+                         (int, str, TEXT_TYPE))
+    app.connect('builder-inited', builder_inited)
+    app.connect('builder-inited', tracking.builder_inited)
+    app.connect('env-get-outdated', tracking.env_get_outdated)
+    app.connect('env-purge-doc', tracking.env_purge_doc)
+    app.connect('env-before-read-docs', env_before_read_docs)
+    app.connect('env-merge-info', env_merge_info)
+    app.connect('env-merge-info', tracking.env_merge_info)
+    app.connect('doctree-resolved', doctree_resolved)
+    app.connect('build-finished', build_finished)
+    return {
+        'version': __version__,
+        'env_version': 5,
+        'parallel_read_safe': True,
+        'parallel_write_safe': True,
+    }
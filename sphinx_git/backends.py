@@ -0,0 +1,295 @@
+# Copyright 2012-2013 (C) Daniel Watkins <daniel@daniel-watkins.co.uk>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import itertools
+import os
+from collections import namedtuple
+from multiprocessing.pool import ThreadPool
+
+from . import stats
+from .commits import CommitRecord, iter_commit_records
+from .process import BatchCheck, iter_git_records, work_dir
+from .query import WalkOptions
+from .status import WorkingTreeStatus, probe_status
+
+# The fewest commits worth giving a diff process of their own.
+MIN_DIFF_CHUNK = 500
+
+
+class HeadInfo(namedtuple('HeadInfo', ['hexsha', 'branch'])):
+    """The commit HEAD points at, and its branch (``None`` if detached)."""
+
+    __slots__ = ()
+
+
+class GitPythonBackend(object):
+    """
+    Reads a repository through GitPython's objects.
+
+    Every backend offers the methods below, and must give the same answers
+    as this one; the build context creates one backend per repository.
+    """
+
+    name = 'gitpython'
+    # Whether prefetching threads may share the backend.
+    thread_safe = False
+
+    def __init__(self, repo, diff_jobs=1):
+        self.repo = repo
+        # How many diffs may run at once, for backends which can run them in
+        # parallel.
+        self.diff_jobs = diff_jobs
+
+    @classmethod
+    def available(cls):
+        """Return whether the libraries this backend needs are installed."""
+        return True
+
+    def head(self):
+        """Return the ``HeadInfo`` for the repository's HEAD."""
+        head = self.repo.head
+        branch = None
+        if not head.is_detached:
+            branch = head.ref.name
+        return HeadInfo(head.commit.hexsha, branch)
+
+    def remote_url(self, name):
+        """Return the URL of the remote ``name``, or ``None``."""
+        try:
+            return self.repo.remote(name).url
+        except ValueError:
+            return None
+
+    def rev_parse(self, rev_list):
+        """Return the object ids ``git rev-parse rev_list`` prints."""
+        return tuple(self.repo.git.rev_parse(rev_list).split())
+
+    def log(self, rev_list, options=WalkOptions()):
+        """
+        Yield a ``CommitRecord`` for each commit in ``rev_list``, newest first,
+        walking history as the ``WalkOptions`` ``options`` say.
+
+        ``rev_list`` is a revision range, or a tuple of the object ids (some
+        prefixed with ``^``) that ``rev_parse`` gives for one.
+        """
+        kwargs = {}
+        if options.max_count is not None:
+            kwargs['max_count'] = options.max_count
+        if options.since is not None:
+            kwargs['since'] = options.since
+        if options.until is not None:
+            kwargs['until'] = options.until
+        if options.pathspecs:
+            kwargs['full_history'] = True
+        if options.first_parent:
+            kwargs['first_parent'] = True
+        if options.merges_only:
+            kwargs['merges'] = True
+        for commit in self.repo.iter_commits(rev_list,
+                                             options.pathspecs or '',
+                                             **kwargs):
+            yield CommitRecord(commit.hexsha,
+                               tuple(parent.hexsha
+                                     for parent in commit.parents),
+                               commit.author.name, commit.authored_date,
+                               commit.committed_date, commit.message)
+
+    def changed_paths(self, commits, pathspecs=None):
+        """
+        Yield each of ``commits``' SHAs, in order, with the paths it changes.
+
+        Paths are relative to the commit's first parent, or to the empty tree
+        for root commits, and limited to ``pathspecs`` if given.
+        """
+        from git import NULL_TREE  # pylint: disable=import-outside-toplevel
+        paths_arg = pathspecs or None
+        for record in commits:
+            commit = self.repo.commit(record.hexsha)
+            if commit.parents:
+                diffs = commit.parents[0].diff(commit, paths_arg)
+            else:
+                diffs = commit.diff(NULL_TREE, paths_arg)
+            paths = set()
+            # A rename changes both its paths.
+            for diff in diffs:
+                paths.update(path for path in (diff.a_path, diff.b_path)
+                             if path is not None)
+            yield record.hexsha, sorted(paths)
+
+    def status(self, untracked):
+        """Return the ``WorkingTreeStatus`` of the repository."""
+        has_untracked = None
+        if untracked:
+            has_untracked = bool(self.repo.untracked_files)
+        return WorkingTreeStatus(
+            self.repo.is_dirty(index=True, working_tree=True,
+                               untracked_files=False),
+            has_untracked)
+
+    def close(self):
+        pass
+
+
+class GitBackend(GitPythonBackend):
+    """
+    Reads a repository by streaming many objects through few git processes.
+
+    History comes from one ``git log`` per walk and diffs from one ``git
+    diff-tree --stdin`` per batch of commits (split between up to
+    ``diff_jobs`` processes running at once, for large batches), and
+    revisions are resolved through one long-lived ``git cat-file
+    --batch-check``, HEAD included; remotes are read with ``git config``.
+    It never reads through GitPython's object database, whose persistent
+    ``cat-file`` process isn't safe to share between threads.
+    """
+
+    name = 'git'
+    thread_safe = True
+
+    def __init__(self, repo, diff_jobs=1):
+        super(GitBackend, self).__init__(repo, diff_jobs)
+        self.cwd = work_dir(repo)
+        self._batch_check = BatchCheck(self.cwd)
+
+    def head(self):
+        hexsha = self._object_id('HEAD')
+        if hexsha is None:
+            # As GitPython does on an unborn branch.
+            raise ValueError('Reference at HEAD does not exist')
+        with open(os.path.join(self.repo.git_dir, 'HEAD')) as head_file:
+            ref = head_file.read().strip()
+        branch = None
+        if ref.startswith('ref: refs/heads/'):
+            branch = ref[len('ref: refs/heads/'):]
+        return HeadInfo(hexsha, branch)
+
+    def remote_url(self, name):
+        # pylint: disable=import-outside-toplevel
+        from git.exc import GitCommandError
+        try:
+            urls = list(iter_git_records(
+                self.cwd, ['config', '--get', 'remote.{0}.url'.format(name)],
+                separator=b'\n'))
+        except GitCommandError:
+            # git config exits non-zero when the key isn't set.
+            return None
+        return urls[0] if urls else None
+
+    def rev_parse(self, rev_list):
+        resolved = None
+        if '...' not in rev_list:
+            if '..' in rev_list:
+                start, end = rev_list.split('..', 1)
+                resolved = (self._object_id(end or 'HEAD'),
+                            self._caret(start or 'HEAD'))
+            elif rev_list.startswith('^'):
+                resolved = (self._caret(rev_list[1:]),)
+            else:
+                resolved = (self._object_id(rev_list),)
+        if resolved is None or None in resolved:
+            # Leave anything else (including errors) to git rev-parse.
+            return tuple(iter_git_records(self.cwd, ['rev-parse', rev_list],
+                                          separator=b'\n'))
+        return resolved
+
+    def _object_id(self, revision):
+        return self._batch_check.object_id(revision)
+
+    def _caret(self, revision):
+        object_id = self._object_id(revision)
+        return None if object_id is None else '^' + object_id
+
+    def log(self, rev_list, options=WalkOptions()):
+        args = []
+        if options.max_count is not None:
+            args.append('--max-count={0}'.format(options.max_count))
+        # Both are applied by git as it walks, so the parents of merges
+        # aren't visited, and non-merges aren't even read.
+        if options.first_parent:
+            args.append('--first-parent')
+        if options.merges_only:
+            args.append('--merges')
+        # git stops walking once it reaches commits older than --since.
+        if options.since is not None:
+            args.append('--since={0}'.format(options.since))
+        if options.until is not None:
+            args.append('--until={0}'.format(options.until))
+        if isinstance(rev_list, tuple):
+            args.extend(rev_list)
+        else:
+            args.append(rev_list)
+        if options.pathspecs:
+            args += ['--full-history', '--'] + list(options.pathspecs)
+        else:
+            args.append('--')
+        return iter_commit_records(self.cwd, args)
+
+    def changed_paths(self, commits, pathspecs=None):
+        commits = list(commits)
+        jobs = min(self.diff_jobs, len(commits) // MIN_DIFF_CHUNK)
+        if jobs <= 1:
+            return self._diff_tree(commits, pathspecs)
+        # Each process diffs a contiguous run of the commits, so joining
+        # their results in turn keeps the commits' order.
+        size = -(-len(commits) // jobs)
+        chunks = [commits[start:start + size]
+                  for start in range(0, len(commits), size)]
+        timing = stats.active()
+
+        def diff_chunk(chunk):
+            with stats.attribute(timing):
+                return list(self._diff_tree(chunk, pathspecs))
+
+        pool = ThreadPool(len(chunks))
+        try:
+            results = pool.map(diff_chunk, chunks)
+        finally:
+            pool.terminate()
+            pool.join()
+        return itertools.chain.from_iterable(results)
+
+    def _diff_tree(self, commits, pathspecs):
+        if not commits:
+            return
+        shas = [commit.hexsha for commit in commits]
+        # Naming only the first parent makes git diff merges against it.
+        lines = [' '.join((commit.hexsha,) + tuple(commit.parents[:1]))
+                 for commit in commits]
+        args = ['diff-tree', '--stdin', '-r', '-z', '--name-only', '--root',
+                '--always', '--no-renames']
+        if pathspecs:
+            args += ['--'] + list(pathspecs)
+        current = None
+        paths = []
+        position = 0
+        for record in iter_git_records(self.cwd, args, lines):
+            # --always makes git echo every commit id we feed it, in order,
+            # before the paths changed by that commit.
+            if position < len(shas) and record == shas[position]:
+                if current is not None:
+                    yield current, paths
+                current = record
+                paths = []
+                position += 1
+            else:
+                paths.append(record)
+        if current is not None:
+            yield current, paths
+
+    def status(self, untracked):
+        return probe_status(self.cwd, untracked)
+
+    def close(self):
+        self._batch_check.close()
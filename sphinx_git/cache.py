@@ -0,0 +1,152 @@
+# Copyright 2012-2013 (C) Daniel Watkins <daniel@daniel-watkins.co.uk>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import pickle
+import tempfile
+from collections import OrderedDict
+
+from .commits import CommitList, CommitRecord
+
+
+def load_pickle(path, version):
+    """
+    Return the dict pickled at ``path``, if it has the given ``version``.
+
+    Returns ``None`` if the file is missing, unreadable or out of date.
+    """
+    try:
+        with open(path, 'rb') as pickle_file:
+            data = pickle.load(pickle_file)
+    # What a damaged pickle raises varies between Python versions.
+    except (IOError, OSError, EOFError, ValueError, TypeError, KeyError,
+            IndexError, AttributeError, ImportError, pickle.UnpicklingError):
+        return None
+    if not isinstance(data, dict) or data.get('version') != version:
+        return None
+    return data
+
+
+def dump_pickle(path, data):
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    # Write to a temporary file first, so that an interrupted build can never
+    # leave a truncated file behind.
+    fd, temp_path = tempfile.mkstemp(dir=directory)
+    replaced = False
+    try:
+        with os.fdopen(fd, 'wb') as pickle_file:
+            pickle.dump(data, pickle_file, pickle.HIGHEST_PROTOCOL)
+        # mkstemp makes the file private to its owner; give it the mode
+        # open() would have, as Sphinx's own pickles get.
+        os.chmod(temp_path, 0o666 & ~_umask())
+        _replace(temp_path, path)
+        replaced = True
+    finally:
+        if not replaced and os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def _umask():
+    # The umask can only be read by setting it.
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+def _replace(source, destination):
+    replace = getattr(os, 'replace', None)
+    if replace is not None:
+        replace(source, destination)
+        return
+    # Python 2 has no os.replace, and its os.rename won't overwrite a file
+    # on Windows.
+    if os.name == 'nt' and os.path.exists(destination):
+        os.remove(destination)
+    os.rename(source, destination)
+
+
+class ChangelogCache(object):
+    """
+    A persistent cache of the commits displayed by changelog directives.
+
+    Entries are keyed on the fully resolved query (the repository, the SHAs
+    that its revision range resolves to and the filtering options), so when a
+    ref moves the old entry simply stops being used.  The cache holds at most
+    ``max_commits`` commits in total; the least recently used entries are
+    evicted first.
+    """
+
+    version = 3
+
+    def __init__(self, path, max_commits):
+        self.path = path
+        self.max_commits = max_commits
+        self._entries = OrderedDict()
+        self._size = 0
+        self._dirty = False
+
+    @classmethod
+    def load(cls, path, max_commits):
+        cache = cls(path, max_commits)
+        data = load_pickle(path, cls.version)
+        if data is None:
+            return cache
+        for key, rows, truncated in data['entries']:
+            cache._store(key, CommitList(
+                (CommitRecord(*row) for row in rows), truncated))
+        cache._dirty = False
+        return cache
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key):
+        commits = self._entries.pop(key, None)
+        if commits is not None:
+            self._entries[key] = commits
+        return commits
+
+    def put(self, key, commits):
+        commits = CommitList(commits, getattr(commits, 'truncated', None))
+        if key in self._entries:
+            self._size -= len(self._entries.pop(key))
+        self._store(key, commits)
+        self._dirty = True
+
+    def _store(self, key, commits):
+        if len(commits) > self.max_commits:
+            # It would only be evicted along with every other entry.
+            return
+        self._entries[key] = commits
+        self._size += len(commits)
+        while self._size > self.max_commits and self._entries:
+            _, evicted = self._entries.popitem(last=False)
+            self._size -= len(evicted)
+
+    def save(self):
+        if not self._dirty:
+            return
+        dump_pickle(self.path, {
+            'version': self.version,
+            'entries': [(key, [tuple(commit) for commit in commits],
+                         commits.truncated)
+                        for key, commits in self._entries.items()],
+        })
+        self._dirty = False
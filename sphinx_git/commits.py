@@ -0,0 +1,81 @@
+# Copyright 2012-2013 (C) Daniel Watkins <daniel@daniel-watkins.co.uk>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from collections import namedtuple
+
+from .process import iter_git_records
+
+_LOG_FIELDS = ['%H', '%P', '%an', '%at', '%ct', '%B']
+
+
+class CommitRecord(namedtuple('CommitRecord', ['hexsha', 'parents', 'author',
+                                               'authored_date',
+                                               'committed_date', 'message'])):
+    """The details of a commit needed to filter it and render it."""
+
+    __slots__ = ()
+
+
+class CommitList(list):
+    """
+    A list of ``CommitRecord``s.
+
+    ``truncated`` names the option (``max-scan`` or ``max-matches``) that
+    stopped the search for commits early, if any.  ``repos``, in a list
+    merged from several repositories, names the repository of each commit.
+    """
+
+    repos = None
+
+    def __init__(self, commits=(), truncated=None):
+        super(CommitList, self).__init__(commits)
+        self.truncated = truncated
+
+
+def iter_commit_records(cwd, args):
+    """
+    Lazily yield a ``CommitRecord`` for each commit ``git log args`` lists.
+
+    Every field of every commit comes from a single ``git log`` process, with
+    fields and commits separated by NULs, rather than from a separate object
+    lookup per commit.  ``log.follow`` is turned off, as a user's setting
+    would otherwise make git follow renames for a single pathspec.
+    """
+    command = ['-c', 'log.follow=false', 'log', '-z', '--no-show-signature',
+               '--format=' + '%x00'.join(_LOG_FIELDS)] + list(args)
+    fields = []
+    for record in iter_git_records(cwd, command):
+        fields.append(record)
+        if len(fields) == len(_LOG_FIELDS):
+            yield _commit_record(fields)
+            fields = []
+    if fields:
+        raise ValueError('Incomplete git log record: {0!r}'.format(fields))
+
+
+def _commit_record(fields):
+    # A NUL within a commit message would shift every later field along.
+    hexsha, parents, author, authored_date, committed_date, message = (
+        fields[:len(_LOG_FIELDS)])
+    if not (_is_sha(hexsha) and all(_is_sha(sha) for sha in parents.split())
+            and authored_date.isdigit() and committed_date.isdigit()):
+        raise ValueError('Malformed git log record: {0!r}'.format(fields))
+    return CommitRecord(hexsha, tuple(parents.split()), author,
+                        int(authored_date), int(committed_date), message)
+
+
+def _is_sha(text):
+    return len(text) in (40, 64) and all(char in '0123456789abcdef'
+                                         for char in text)
@@ -0,0 +1,104 @@
+# Copyright 2012-2013 (C) Daniel Watkins <daniel@daniel-watkins.co.uk>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import multiprocessing
+from collections import OrderedDict, namedtuple
+
+from sphinx.errors import ConfigError
+from sphinx.util import logging
+
+from .backends import GitBackend, GitPythonBackend
+from .pygit2backend import Pygit2Backend
+
+BACKENDS = OrderedDict((backend.name, backend)
+                       for backend in [GitBackend, Pygit2Backend,
+                                       GitPythonBackend])
+
+# unicode on Python 2, where Sphinx 1.x reads conf.py with unicode_literals,
+# and str on Python 3.
+TEXT_TYPE = type(b''.decode('ascii'))
+
+logger = logging.getLogger(__name__)
+
+
+def backend_class(name):
+    """
+    Return the backend class ``sphinx_git_backend`` names.
+
+    A backend whose library isn't installed is replaced by the git backend,
+    with a warning.
+    """
+    if name not in BACKENDS:
+        raise ConfigError(
+            'Unknown sphinx_git_backend {0!r}; choose from {1}.'.format(
+                name, ', '.join(BACKENDS)))
+    backend = BACKENDS[name]
+    if not backend.available():
+        logger.warning('sphinx_git_backend %r is not available (is its '
+                       'library installed?); using %r instead.',
+                       name, GitBackend.name)
+        backend = GitBackend
+    return backend
+
+
+def diff_jobs(value):
+    """Return the number of diff processes ``sphinx_git_diff_jobs`` allows
+    each backend."""
+    if value == 'auto':
+        return multiprocessing.cpu_count()
+    if not isinstance(value, int):
+        # Only builds which set the option import six.
+        import six  # pylint: disable=import-outside-toplevel
+        if isinstance(value, six.string_types) and value.isdigit():
+            # As given by -D.
+            value = int(value)
+    if not isinstance(value, int) or value < 1:
+        raise ConfigError(
+            "sphinx_git_diff_jobs must be a positive number or 'auto', not "
+            "{0!r}.".format(value))
+    return value
+
+
+class BuildSettings(namedtuple('BuildSettings', [
+        'doctreedir', 'cache', 'cache_size', 'track_changes', 'timing',
+        'commit_graph', 'path_index', 'prefetch', 'backend_class',
+        'diff_jobs'])):
+    """
+    The ``sphinx_git_*`` configuration of a build, checked and converted.
+
+    Caches and indexes are kept in ``doctreedir``; without one, as outside
+    of a Sphinx build, nothing is kept between builds.  The defaults turn
+    every optional feature off.
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def from_app(cls, app):
+        config = app.config
+        return cls(app.doctreedir, config.sphinx_git_cache,
+                   config.sphinx_git_cache_size,
+                   config.sphinx_git_track_changes,
+                   bool(config.sphinx_git_timing or
+                        config.sphinx_git_timing_json),
+                   config.sphinx_git_commit_graph,
+                   config.sphinx_git_path_index,
+                   config.sphinx_git_prefetch,
+                   backend_class(config.sphinx_git_backend),
+                   diff_jobs(config.sphinx_git_diff_jobs))
+
+
+BuildSettings.__new__.__defaults__ = (None, False, 50000, False, False, False,
+                                      False, False, GitBackend, 1)
@@ -0,0 +1,467 @@
+# Copyright 2012-2013 (C) Daniel Watkins <daniel@daniel-watkins.co.uk>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import multiprocessing
+import os
+import weakref
+from contextlib import contextmanager
+from multiprocessing.pool import ThreadPool
+
+from sphinx.util import logging
+
+from . import config, state, stats
+from .cache import ChangelogCache
+from .graph import update_commit_graph
+from .lastchange import LastChangeIndex
+from .pathindex import ChangedPathIndex, index_path
+from .process import work_dir
+from .query import absolute_dates
+from .repos import submodule_dirs
+from .tags import TagIndex
+
+CACHE_FILENAME = 'sphinx_git.cache'
+
+_CONTEXTS = weakref.WeakKeyDictionary()
+
+logger = logging.getLogger(__name__)
+
+
+class BuildContext(object):
+    """State shared by all of the git directives in a single Sphinx build."""
+
+    def __init__(self, settings=None):
+        if settings is None:
+            settings = config.BuildSettings()
+        self.settings = settings
+        # A list of DirectiveTimings if timing is enabled, otherwise None.
+        self.timings = [] if settings.timing else None
+        self.pid = os.getpid()
+        self.indexes = state.Indexes()
+        self._repos = state.Repositories()
+        self._memo = state.Memo()
+        self._prefetch = state.PrefetchQueue()
+
+    @classmethod
+    def from_app(cls, app):
+        return cls(config.BuildSettings.from_app(app))
+
+    def for_worker(self, env):
+        """
+        Return a context for a process forked from this context's process.
+
+        The forked process inherits the parent's repository objects, but their
+        persistent git processes still belong to the parent, so the worker
+        gets a pool of its own.  The inherited objects are deliberately not
+        closed, as that would terminate the parent's git processes.  Workers
+        leave commit-graphs alone, so that they don't race to write them, and
+        are never closed, so save nothing themselves.
+        """
+        context = BuildContext(self.settings._replace(commit_graph=False,
+                                                      prefetch=False))
+        self.changelog_cache()
+        context.indexes = self.indexes.for_worker()
+        context.indexes.changelog_updates = env.sphinx_git_cache_updates = {}
+        if self.settings.path_index:
+            context.indexes.path_updates = env.sphinx_git_index_updates = {}
+        if self.timings is not None:
+            context.timings = env.sphinx_git_timings = []
+        return context
+
+    def changelog_cache(self):
+        """Return the build's ``ChangelogCache``, if the cache is enabled."""
+        settings = self.settings
+        if (self.indexes.changelog is None and settings.cache and
+                settings.doctreedir is not None):
+            self.indexes.changelog = ChangelogCache.load(
+                os.path.join(settings.doctreedir, CACHE_FILENAME),
+                settings.cache_size)
+        return self.indexes.changelog
+
+    @contextmanager
+    def timing(self, directive, docname, lineno):
+        """Record timings for the directive run in this block, if enabled."""
+        if self.timings is None:
+            yield
+            return
+        timing = stats.DirectiveTiming.create(directive, docname, lineno)
+        with stats.activate(timing):
+            yield
+        self.timings.append(timing)
+
+    def resolve(self, query, repo):
+        """
+        Return the SHAs ``query`` resolves to in ``repo``.
+
+        Refs are assumed not to move during a build, so each distinct revision
+        range is only resolved once.
+        """
+        key = (repo.git_dir, query.rev_list)
+        resolved = self._memo.resolved.get(key)
+        if resolved is None:
+            with stats.phase('resolve'):
+                resolved = self._memo.resolved[key] = query.resolve(
+                    self.backend(repo))
+        return resolved
+
+    def dates(self, query, repo):
+        """
+        Return ``query``'s ``since`` and ``until`` as absolute dates.
+
+        Commits are found and cached for the absolute dates, as relative
+        ones select different commits as time passes.  As with ``resolve``,
+        each pair of dates is only converted once per build.
+        """
+        key = (query.since, query.until)
+        if key == (None, None):
+            return key
+        memo = self._memo.dates
+        dates = memo.get(key)
+        if dates is None:
+            dates = memo[key] = absolute_dates(work_dir(repo), *key)
+        return dates
+
+    def _absolute(self, query, repo):
+        since, until = self.dates(query, repo)
+        return query._replace(since=since, until=until)
+
+    def find_commits(self, query, repo, resolved=None):
+        """
+        Return the commits selected by ``query``, using the cache.
+
+        Identical queries are only answered once per build, whether or not
+        the cache is enabled; as with ``resolve``, refs are assumed not to
+        move during a build.  If ``resolved`` is given, the commits ``query``
+        selected when its revisions resolved to those SHAs are returned,
+        whether or not its revisions have since moved.
+        """
+        query = self._absolute(query, repo)
+        if resolved is not None:
+            resolved = tuple(resolved)
+            if resolved != self.resolve(query, repo):
+                return self._find_resolved(query, repo, resolved)
+        found_key = (repo.git_dir, query)
+        commits = self._memo.found.get(found_key)
+        if commits is not None:
+            return commits
+        changelog_cache = self.changelog_cache()
+        if changelog_cache is None:
+            commits = self._load(query, repo)
+        else:
+            key = self._cache_key(query, repo)
+            commits = changelog_cache.get(key)
+            if commits is None:
+                commits = self._load(query, repo)
+                self._cache_commits(key, commits)
+        self._memo.found[found_key] = commits
+        return commits
+
+    def _find_resolved(self, query, repo, resolved):
+        found_key = (repo.git_dir, query, resolved)
+        commits = self._memo.found.get(found_key)
+        if commits is not None:
+            return commits
+        changelog_cache = self.changelog_cache()
+        key = (os.path.abspath(repo.git_dir), resolved, tuple(query))
+        if changelog_cache is not None:
+            commits = changelog_cache.get(key)
+        if commits is None:
+            commits = query.load(self.backend(repo), self.path_index(repo),
+                                 resolved)
+            if changelog_cache is not None:
+                self._cache_commits(key, commits)
+        self._memo.found[found_key] = commits
+        return commits
+
+    def _cache_key(self, query, repo):
+        return (os.path.abspath(repo.git_dir), self.resolve(query, repo),
+                tuple(query))
+
+    def _load(self, query, repo):
+        pending = self._prefetch.pending.pop(
+            ('commits', repo.git_dir, query), None)
+        if pending is not None:
+            with stats.phase('prefetch'):
+                return pending.get()
+        return query.load(*self._load_args(query, repo))
+
+    def _load_args(self, query, repo):
+        resolved = None
+        if query.rev_list is None:
+            # Resolved here, rather than by the thread loading the query, so
+            # that HEAD is only ever read from the build's own thread.
+            resolved = self.resolve(query, repo)
+        return self.backend(repo), self.path_index(repo), resolved
+
+    def prefetch_commits(self, query, repo):
+        """Queue ``query`` to be loaded by ``start_prefetching``."""
+        query = self._absolute(query, repo)
+        changelog_cache = self.changelog_cache()
+        if (changelog_cache is not None and
+                self._cache_key(query, repo) in changelog_cache):
+            return
+        self._queue(('commits', repo.git_dir, query), query.load,
+                    self._load_args(query, repo))
+
+    def prefetch_status(self, repo, untracked):
+        """Queue a probe of ``repo``'s working tree status."""
+        self._queue(('status', repo.git_dir, untracked),
+                    self.backend(repo).status, (untracked,))
+
+    def _queue(self, key, func, args):
+        if key not in self._prefetch.pending:
+            self._prefetch.pending[key] = None
+            self._prefetch.queued.append((key, func, args))
+
+    def start_prefetching(self):
+        """Run the queued work in a pool of threads."""
+        prefetch = self._prefetch
+        if not prefetch.queued:
+            return
+        if prefetch.pool is None:
+            prefetch.pool = ThreadPool(min(len(prefetch.queued),
+                                           multiprocessing.cpu_count()))
+        for key, func, args in prefetch.queued:
+            prefetch.pending[key] = prefetch.pool.apply_async(func, args)
+        del prefetch.queued[:]
+
+    def _cache_commits(self, key, commits):
+        self.changelog_cache().put(key, commits)
+        updates = self.indexes.changelog_updates
+        if updates is not None:
+            updates[key] = commits
+
+    def merge_cache_updates(self, updates):
+        changelog_cache = self.changelog_cache()
+        if changelog_cache is None:
+            return
+        for key, commits in updates.items():
+            changelog_cache.put(key, commits)
+
+    def backend(self, repo):
+        """Return the backend reading ``repo``, shared for the build."""
+        git_dir = os.path.abspath(repo.git_dir)
+        backends = self._repos.backends
+        backend = backends.get(git_dir)
+        if backend is None:
+            backend = backends[git_dir] = self.settings.backend_class(
+                repo, diff_jobs=self.settings.diff_jobs)
+        return backend
+
+    def path_index(self, repo):
+        """Return ``repo``'s ``ChangedPathIndex``, if indexes are in use."""
+        if not self._keeps_path_indexes():
+            return None
+        return self._path_index(os.path.abspath(repo.git_dir))
+
+    def _keeps_path_indexes(self):
+        return (self.settings.path_index and
+                self.settings.doctreedir is not None)
+
+    def _path_index(self, git_dir):
+        index = self.indexes.paths.get(git_dir)
+        if index is None:
+            index = self.indexes.paths[git_dir] = ChangedPathIndex.load(
+                index_path(self.settings.doctreedir, git_dir))
+        updates = self.indexes.path_updates
+        if updates is not None and git_dir not in updates:
+            # The index is this process's own copy, so it can safely be told
+            # to record what is added to it.
+            index.journal = updates[git_dir] = []
+        return index
+
+    def last_changes(self, repo):
+        """
+        Return ``repo``'s ``LastChangeIndex``, up to date with its HEAD.
+
+        The index is brought up to date the first time it is asked for in
+        each build.
+        """
+        git_dir = os.path.abspath(repo.git_dir)
+        index = self.indexes.last_changes.get(git_dir)
+        if index is None:
+            index = LastChangeIndex.load(self._index_path(git_dir,
+                                                          'lastchange'))
+            with stats.phase('walk'):
+                index.update(self.backend(repo))
+            self.indexes.last_changes[git_dir] = index
+        return index
+
+    def tag_index(self, repo):
+        """
+        Return ``repo``'s ``TagIndex``, up to date with its tags.
+
+        As with ``last_changes``, the index is brought up to date the first
+        time it is asked for in each build.
+        """
+        git_dir = os.path.abspath(repo.git_dir)
+        index = self.indexes.tags.get(git_dir)
+        if index is None:
+            index = TagIndex.load(self._index_path(git_dir, 'tags'))
+            with stats.phase('walk'):
+                index.update(work_dir(repo))
+            self.indexes.tags[git_dir] = index
+        return index
+
+    def _index_path(self, git_dir, kind):
+        if self.settings.doctreedir is None:
+            return None
+        return index_path(self.settings.doctreedir, git_dir, kind)
+
+    def merge_index_updates(self, updates):
+        if not self._keeps_path_indexes():
+            return
+        for git_dir, additions in updates.items():
+            index = self._path_index(git_dir)
+            for hexsha, paths in additions:
+                index.add(hexsha, paths)
+
+    def find_repo(self, path):
+        """
+        Return the repository containing ``path``.
+
+        Repositories are shared by every directive in the build, keyed on
+        their git directory, so the search for the repository and GitPython's
+        persistent ``cat-file`` processes are only paid for once per
+        repository.
+        """
+        path = os.path.abspath(path)
+        git_dir = self._repos.git_dirs.get(path)
+        if git_dir is None:
+            # GitPython is slow to import, so builds which never look at a
+            # repository don't import it at all.
+            from git import Repo  # pylint: disable=import-outside-toplevel
+            repo = Repo(path, search_parent_directories=True)
+            git_dir = os.path.abspath(repo.git_dir)
+            if git_dir in self._repos.handles:
+                repo.close()
+            else:
+                self._repos.handles[git_dir] = repo
+                if self.settings.commit_graph:
+                    update_commit_graph(work_dir(repo))
+            self._repos.git_dirs[path] = git_dir
+        return self._repos.handles[git_dir]
+
+    def submodules(self, repo):
+        """
+        Return the directories of ``repo``'s checked out submodules.
+
+        Each repository's submodules are only looked up once per build.
+        """
+        git_dir = os.path.abspath(repo.git_dir)
+        dirs = self._repos.submodules.get(git_dir)
+        if dirs is None:
+            dirs = self._repos.submodules[git_dir] = submodule_dirs(
+                work_dir(repo))
+        return dirs
+
+    def working_tree_status(self, repo, untracked):
+        """
+        Return the ``WorkingTreeStatus`` of ``repo``'s working tree.
+
+        The working tree is only examined once per build; a status which
+        includes untracked files also answers requests that don't need them.
+        """
+        git_dir = repo.git_dir
+        status = self._status(git_dir, True)
+        if status is None and not untracked:
+            status = self._status(git_dir, False)
+        if status is None:
+            with stats.phase('status'):
+                status = self.backend(repo).status(untracked)
+            self._memo.statuses[(git_dir, untracked)] = status
+        return status
+
+    def _status(self, git_dir, untracked):
+        pending = self._prefetch.pending.pop(
+            ('status', git_dir, untracked), None)
+        if pending is not None:
+            with stats.phase('prefetch'):
+                self._memo.statuses[(git_dir, untracked)] = pending.get()
+        return self._memo.statuses.get((git_dir, untracked))
+
+    def close(self):
+        self._prefetch.close()
+        self.indexes.save()
+        self._repos.close()
+        self._memo.clear()
+
+
+def get_context(env):
+    """
+    Return the build context for ``env``.
+
+    Directives run outside of a Sphinx build (for example, in tests) get a
+    fresh context with nothing shared or cached.
+    """
+    context = _CONTEXTS.get(env)
+    if context is None:
+        context = BuildContext()
+    elif context.pid != os.getpid():
+        # We are in a process forked by Sphinx for parallel reading.
+        context = context.for_worker(env)
+        set_context(env, context)
+    return context
+
+
+def set_context(env, context):
+    _CONTEXTS[env] = context
+
+
+def builder_inited(app):
+    context = BuildContext.from_app(app)
+    set_context(app.env, context)
+    if context.settings.commit_graph:
+        # Open the documentation's own repository (and so update its
+        # commit-graph) before Sphinx forks any parallel readers.
+        # pylint: disable=import-outside-toplevel
+        from git import InvalidGitRepositoryError
+        try:
+            context.find_repo(app.srcdir)
+        except InvalidGitRepositoryError:
+            pass
+
+
+def env_merge_info(app, env, docnames, other):
+    # pylint: disable=unused-argument
+    context = get_context(env)
+    updates = getattr(other, 'sphinx_git_cache_updates', None)
+    if updates:
+        context.merge_cache_updates(updates)
+    index_updates = getattr(other, 'sphinx_git_index_updates', None)
+    if index_updates:
+        context.merge_index_updates(index_updates)
+    timings = getattr(other, 'sphinx_git_timings', None)
+    if timings and context.timings is not None:
+        context.timings.extend(timings)
+
+
+def build_finished(app, exception):  # pylint: disable=unused-argument
+    context = _CONTEXTS.pop(app.env, None)
+    if context is None:
+        return
+    context.close()
+    if context.timings is not None:
+        report_timings(app, context.timings)
+
+
+def report_timings(app, timings):
+    if app.config.sphinx_git_timing and timings:
+        logger.info('git directive timings (ms):')
+        for line in stats.format_report(timings):
+            logger.info(line)
+    if app.config.sphinx_git_timing_json:
+        stats.write_json(
+            os.path.join(app.outdir, app.config.sphinx_git_timing_json),
+            timings)
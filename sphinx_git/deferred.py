@@ -0,0 +1,71 @@
+# Copyright 2012-2013 (C) Daniel Watkins <daniel@daniel-watkins.co.uk>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from docutils import nodes
+
+from . import tags
+from .context import get_context
+from .markup import DISPLAY_OPTIONS, changelog_markup
+from .process import repo_name, work_dir
+from .query import ChangelogQuery
+
+
+# pylint: disable=invalid-name
+class changelog_placeholder(nodes.General, nodes.Element):
+    """
+    Stands in for a git_changelog's output in the stored doctree.
+
+    It holds only the changelog's query, each of its repositories with the
+    SHAs its revisions resolved to there, and its display options; the
+    commits themselves are looked up again, and rendered, when the doctree
+    is resolved for writing.
+    """
+
+
+def make_placeholder(repos, query, resolved, options):
+    node = changelog_placeholder()
+    node['sources'] = [(work_dir(repo), tuple(shas))
+                       for repo, shas in zip(repos, resolved)]
+    node['query'] = tuple(query)
+    node['options'] = dict((name, options[name]) for name in DISPLAY_OPTIONS
+                           if name in options)
+    return node
+
+
+def _findall(doctree, node_class):
+    # Node.traverse is deprecated in favour of findall in docutils 0.18.
+    findall = getattr(doctree, 'findall', doctree.traverse)
+    return list(findall(node_class))
+
+
+def doctree_resolved(app, doctree, docname):
+    # pylint: disable=unused-argument
+    context = get_context(app.env)
+    for node in _findall(doctree, changelog_placeholder):
+        query = ChangelogQuery(*node['query'])
+        repos = []
+        changelogs = []
+        for repo_dir, resolved in node['sources']:
+            repo = context.find_repo(repo_dir)
+            repos.append(repo)
+            changelogs.append((repo_name(repo), context.find_commits(
+                query, repo, resolved=resolved)))
+        commits = query.merge(changelogs)
+        releases = None
+        if 'group-by-tag' in node['options']:
+            releases = tags.releases(
+                [context.tag_index(repo) for repo in repos], commits)
+        node.replace_self(changelog_markup(commits, node['options'],
+                                           releases))
@@ -0,0 +1,122 @@
+# Copyright 2012-2013 (C) Daniel Watkins <daniel@daniel-watkins.co.uk>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import re
+
+_REGEX_SPECIALS = frozenset('.^$*+?{}[]\\|()')
+_GLOB_SPECIALS = frozenset('*?[\\')
+
+
+def literal_prefix(pattern):
+    """Return the literal text that every match of ``pattern`` starts with.
+
+    Only the leading run of plain characters is considered, so the result is
+    conservative: an empty string means no prefix could be determined.
+    """
+    if '|' in pattern or pattern.startswith('(?'):
+        return ''
+    prefix = []
+    i = 1 if pattern.startswith('^') else 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == '\\':
+            if i + 1 >= len(pattern) or pattern[i + 1].isalnum():
+                # Character classes (\d, \w, ...) and anchors end the prefix.
+                break
+            char = pattern[i + 1]
+            i += 2
+        elif char in _REGEX_SPECIALS:
+            break
+        else:
+            i += 1
+        if i < len(pattern) and pattern[i] in '?*{':
+            # The character we just read is optional.
+            break
+        prefix.append(char)
+        if i < len(pattern) and pattern[i] == '+':
+            break
+    return ''.join(prefix)
+
+
+def _escape_glob(path):
+    return ''.join('\\' + char if char in _GLOB_SPECIALS else char
+                   for char in path)
+
+
+def pathspecs_for(pattern):
+    """Return git pathspecs covering every path ``pattern`` can match.
+
+    Where the pattern's literal prefix names a directory, that directory is
+    used as a plain pathspec, which lets git consult commit-graph changed-path
+    Bloom filters; the expression is applied to the results afterwards.
+    Returns ``None`` if the pattern has no usable literal prefix.
+    """
+    prefix = literal_prefix(pattern)
+    directory = prefix.rpartition('/')[0]
+    if directory:
+        if any(char in _GLOB_SPECIALS for char in directory):
+            return [':(literal){0}'.format(directory)]
+        return [directory]
+    if not prefix:
+        return None
+    escaped = _escape_glob(prefix)
+    return [':(glob){0}*'.format(escaped), ':(glob){0}*/**'.format(escaped)]
+
+
+class FilenameFilter(object):
+    """
+    Select commits which touch files matching a regular expression.
+
+    A commit is selected if any path changed between it and its first parent
+    (or the empty tree, for root commits) matches the expression.  The
+    repository's backend is asked for the diffs of all candidate commits at
+    once (the git backend uses a single ``git diff-tree --stdin`` process),
+    restricted to the expression's literal prefix where one exists, so the
+    expression only has to be run over plausible paths.
+    """
+
+    def __init__(self, pattern):
+        self.pattern = pattern
+        self.regex = re.compile(pattern)
+        self.pathspecs = pathspecs_for(pattern)
+
+    def matches(self, path):
+        return self.regex.match(path) is not None
+
+    def select(self, backend, commits, index=None):
+        """
+        Return the ``CommitRecord``s in ``commits`` that match, in order.
+
+        If a ``ChangedPathIndex`` is given, commits it doesn't know yet are
+        added to it, and it answers for every commit it can.
+        """
+        commits = list(commits)
+        if index is None:
+            matched = self._diff_matches(backend, commits, self.pathspecs)
+        else:
+            unindexed = [commit for commit in commits
+                         if commit.hexsha not in index]
+            # The index needs every changed path, so these are diffed in full.
+            for hexsha, paths in backend.changed_paths(unindexed):
+                index.add(hexsha, paths)
+            matched, unknown = index.lookup(commits, self.matches)
+            matched.update(self._diff_matches(backend, unknown,
+                                              self.pathspecs))
+        return [commit for commit in commits if commit.hexsha in matched]
+
+    def _diff_matches(self, backend, commits, pathspecs):
+        return set(hexsha for hexsha, paths
+                   in backend.changed_paths(commits, pathspecs)
+                   if any(self.matches(path) for path in paths))
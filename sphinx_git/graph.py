@@ -0,0 +1,48 @@
+# Copyright 2012-2013 (C) Daniel Watkins <daniel@daniel-watkins.co.uk>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from sphinx.util import logging
+
+from .process import iter_git_records
+
+logger = logging.getLogger(__name__)
+
+
+def update_commit_graph(cwd):
+    """
+    Bring the commit-graph of the repository in ``cwd`` up to date.
+
+    The commit-graph stores each commit's parents and generation number, so
+    that git can resolve ranges without parsing every commit it passes, and
+    (with ``--changed-paths``) Bloom filters of the paths each commit
+    changes, so that path-limited walks can skip most commits without
+    diffing them.  Split graphs are used, so each build only writes a layer
+    for the commits added since the last one.
+    """
+    # pylint: disable=import-outside-toplevel
+    from git.exc import GitCommandError
+    args = ['commit-graph', 'write', '--reachable', '--split']
+    try:
+        for _ in iter_git_records(cwd, args + ['--changed-paths']):
+            pass
+    except GitCommandError:
+        try:
+            # Git before 2.27 can't write changed-path Bloom filters, but
+            # generation numbers are still worth having.
+            for _ in iter_git_records(cwd, args):
+                pass
+        except GitCommandError as error:
+            logger.warning('could not write commit-graph for %s: %s', cwd,
+                           error.stderr.strip())
@@ -0,0 +1,138 @@
+# Copyright 2012-2013 (C) Daniel Watkins <daniel@daniel-watkins.co.uk>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from collections import namedtuple
+from itertools import islice
+
+from .cache import dump_pickle, load_pickle
+from .query import WalkOptions
+
+# Commits read from the walk, and diffed, at a time.
+BATCH_SIZE = 5000
+
+
+class LastChange(namedtuple('LastChange', ['hexsha', 'author',
+                                           'authored_date',
+                                           'committed_date'])):
+    """The commit which last changed a path."""
+
+    __slots__ = ()
+
+
+def _is_empty(walk):
+    try:
+        return next(walk, None) is None
+    finally:
+        walk.close()
+
+
+class LastChangeIndex(object):
+    """
+    The commit that last changed each path of a repository, as of ``head``.
+
+    The index is built by a single walk back through history, in which the
+    first commit seen changing a path is the one that last changed it.  It is
+    kept between builds, and when HEAD moves on, only the commits added since
+    the last build are walked.  Changes brought in by merges are attributed
+    to the commits that made them, as ``git log --name-only`` does; as a
+    merge can bring in commits older than those already indexed, a path
+    keeps whichever of its changes was committed last.
+    """
+
+    version = 2
+
+    def __init__(self, path):
+        self.path = path
+        self.head = None
+        self._changes = {}
+        self._dirty = False
+
+    @classmethod
+    def load(cls, path):
+        """Load the index from ``path``, or start an empty one."""
+        index = cls(path)
+        data = load_pickle(path, cls.version)
+        if data is not None:
+            index.head = data['head']
+            index._changes = data['changes']
+        return index
+
+    def __len__(self):
+        return len(self._changes)
+
+    def get(self, path):
+        """Return the ``LastChange`` for ``path``, or ``None``."""
+        return self._changes.get(path)
+
+    def update(self, backend):
+        """Bring the index up to date with the HEAD that ``backend`` reads."""
+        head = backend.head().hexsha
+        if head == self.head:
+            return
+        if self.head is not None and self._descends(backend, head):
+            rev_list = '{0}..{1}'.format(self.head, head)
+        else:
+            rev_list = head
+            self._changes = {}
+        changes = {}
+        walk = backend.log(rev_list)
+        try:
+            while True:
+                batch = list(islice(walk, BATCH_SIZE))
+                if not batch:
+                    break
+                self._add_batch(backend, batch, changes)
+        finally:
+            walk.close()
+        for path, change in changes.items():
+            known = self._changes.get(path)
+            if known is None or change.committed_date >= known.committed_date:
+                self._changes[path] = change
+        self.head = head
+        self._dirty = True
+
+    def _descends(self, backend, head):
+        # Whether ``head`` contains every commit the index has seen.
+        from git.exc import GitError  # pylint: disable=import-outside-toplevel
+        try:
+            return _is_empty(backend.log('{0}..{1}'.format(head, self.head),
+                                         WalkOptions(max_count=1)))
+        except GitError:
+            # The old HEAD no longer exists.
+            return False
+
+    @staticmethod
+    def _add_batch(backend, batch, changes):
+        commits = dict((commit.hexsha, commit) for commit in batch
+                       if len(commit.parents) < 2)
+        for hexsha, paths in backend.changed_paths(
+                commit for commit in batch if commit.hexsha in commits):
+            commit = commits[hexsha]
+            for path in paths:
+                if path not in changes:
+                    changes[path] = LastChange(hexsha, commit.author,
+                                               commit.authored_date,
+                                               commit.committed_date)
+
+    def save(self):
+        """Write the index to its file, if it has one and has changed."""
+        if self.path is None or not self._dirty:
+            return
+        dump_pickle(self.path, {
+            'version': self.version,
+            'head': self.head,
+            'changes': self._changes,
+        })
+        self._dirty = False
@@ -0,0 +1,111 @@
+# Copyright 2012-2013 (C) Daniel Watkins <daniel@daniel-watkins.co.uk>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from collections import OrderedDict
+from datetime import datetime
+from itertools import islice, repeat
+
+from docutils import nodes
+
+# The git_changelog options which only affect how commits are displayed.
+DISPLAY_OPTIONS = ('detailed-message-pre', 'detailed-message-strong',
+                   'hide_author', 'hide_date', 'hide_details',
+                   'collapse-after', 'group-by-tag')
+
+
+def changelog_markup(commits, options, releases=None):
+    """
+    Return the nodes displaying ``commits``, given git_changelog options.
+
+    If ``releases`` gives the release of each commit, the commits are listed
+    under a heading for each release instead.
+    """
+    shown = len(commits)
+    if 'collapse-after' in options:
+        shown = min(shown, options['collapse-after'])
+    repos = getattr(commits, 'repos', None) or repeat(None)
+    # Items are built one at a time, so only those displayed in full are
+    # ever created.
+    items = _list_items(islice(commits, shown), repos, options)
+    if releases is None:
+        list_node = nodes.bullet_list()
+        list_node.extend(items)
+        markup = [list_node]
+    else:
+        markup = _release_markup(items, releases)
+    if shown < len(commits):
+        markup.append(_collapsed_markup(len(commits) - shown))
+    return markup
+
+
+def _release_markup(items, releases):
+    # Releases are listed in the order their first commits are.
+    groups = OrderedDict()
+    for item, release in zip(items, releases):
+        groups.setdefault(release, []).append(item)
+    markup = []
+    for release, release_items in groups.items():
+        container = nodes.container(classes=['sphinx-git-release'])
+        container += nodes.rubric(text=release or 'Unreleased')
+        list_node = nodes.bullet_list()
+        list_node.extend(release_items)
+        container += list_node
+        markup.append(container)
+    return markup
+
+
+def _collapsed_markup(count):
+    if count == 1:
+        text = '1 older commit not shown.'
+    else:
+        text = '{0} older commits not shown.'.format(count)
+    return nodes.paragraph(text=text, classes=['sphinx-git-collapsed'])
+
+
+def _list_items(commits, repos, options):
+    for commit, repo in zip(commits, repos):
+        date_str = datetime.fromtimestamp(commit.authored_date)
+        if '\n' in commit.message:
+            message, detailed_message = commit.message.split('\n', 1)
+        else:
+            message = commit.message
+            detailed_message = None
+
+        item = nodes.list_item()
+        par = nodes.paragraph()
+        # choose detailed message style by detailed-message-strong option
+        if options.get('detailed-message-strong', True):
+            par += nodes.strong(text=message)
+        else:
+            par += nodes.inline(text=message)
+
+        if not options.get('hide_author'):
+            par += [nodes.inline(text=" by "),
+                    nodes.emphasis(text=commit.author)]
+        if not options.get('hide_date'):
+            par += [nodes.inline(text=" at "),
+                    nodes.emphasis(text=str(date_str))]
+        if repo is not None:
+            par += [nodes.inline(text=" in "),
+                    nodes.emphasis(text=repo)]
+        item.append(par)
+        if detailed_message and not options.get('hide_details'):
+            detailed_message = detailed_message.strip()
+            if options.get('detailed-message-pre', False):
+                item.append(
+                    nodes.literal_block(text=detailed_message))
+            else:
+                item.append(nodes.paragraph(text=detailed_message))
+        yield item
@@ -0,0 +1,134 @@
+# Copyright 2012-2013 (C) Daniel Watkins <daniel@daniel-watkins.co.uk>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import hashlib
+import os
+import threading
+
+from .cache import dump_pickle, load_pickle
+
+# Commits changing more paths than this aren't indexed; like git's own
+# changed-path filters, they are always treated as possible matches.
+MAX_CHANGED_PATHS = 512
+
+
+def index_path(directory, git_dir, kind='paths'):
+    """Return where the ``kind`` index for the repository at ``git_dir`` is
+    kept."""
+    digest = hashlib.sha1(git_dir.encode('utf-8')).hexdigest()[:16]
+    return os.path.join(directory, 'sphinx_git.{0}.{1}'.format(kind, digest))
+
+
+class ChangedPathIndex(object):
+    """
+    The paths changed by each commit of a repository, kept between builds.
+
+    Each commit maps to the ids of the paths it changes relative to its first
+    parent (or the empty tree, for root commits); the distinct paths are
+    stored once, in a table shared by all commits.  A filename filter then
+    only has to match its expression against that table, after which commits
+    are selected by id alone, without asking git for any diffs.  Commits
+    are added as filters first come across them, so the index grows with the
+    history it is used on.
+    """
+
+    version = 1
+
+    def __init__(self, path):
+        self.path = path
+        self._paths = []
+        self._ids = {}
+        self._commits = {}
+        self._dirty = False
+        # If set to a list, every addition is also appended to it, so that
+        # parallel reading processes can hand their additions back.
+        self.journal = None
+        # Filters may be applied by several prefetching threads at once.
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path):
+        """Load the index from ``path``, or start an empty one."""
+        index = cls(path)
+        data = load_pickle(path, cls.version)
+        if data is not None:
+            index._paths = data['paths']
+            index._ids = dict((changed_path, path_id) for path_id, changed_path
+                              in enumerate(index._paths))
+            index._commits = data['commits']
+        return index
+
+    def __contains__(self, hexsha):
+        return hexsha in self._commits
+
+    def __len__(self):
+        return len(self._commits)
+
+    def add(self, hexsha, paths):
+        """Record that the commit ``hexsha`` changes ``paths``."""
+        with self._lock:
+            self._add(hexsha, paths)
+
+    def _add(self, hexsha, paths):
+        if hexsha in self._commits:
+            return
+        if self.journal is not None:
+            self.journal.append((hexsha, paths))
+        self._dirty = True
+        if len(paths) > MAX_CHANGED_PATHS:
+            self._commits[hexsha] = None
+            return
+        ids = []
+        for changed_path in paths:
+            path_id = self._ids.get(changed_path)
+            if path_id is None:
+                path_id = self._ids[changed_path] = len(self._paths)
+                self._paths.append(changed_path)
+            ids.append(path_id)
+        self._commits[hexsha] = tuple(ids)
+
+    def lookup(self, commits, matches):
+        """
+        Split indexed ``commits`` by whether they change a path ``matches``.
+
+        Returns the set of SHAs of commits known to match, and a list of the
+        commits (changing too many paths to be indexed) that still have to
+        be checked.
+        """
+        with self._lock:
+            paths = list(self._paths)
+            entries = [self._commits[commit.hexsha] for commit in commits]
+        wanted = frozenset(path_id for path_id, changed_path
+                           in enumerate(paths) if matches(changed_path))
+        matched = set()
+        unknown = []
+        for commit, ids in zip(commits, entries):
+            if ids is None:
+                unknown.append(commit)
+            elif not wanted.isdisjoint(ids):
+                matched.add(commit.hexsha)
+        return matched, unknown
+
+    def save(self):
+        """Write the index to its file, if it has changed."""
+        if not self._dirty:
+            return
+        with self._lock:
+            dump_pickle(self.path, {
+                'version': self.version,
+                'paths': self._paths,
+                'commits': self._commits,
+            })
+        self._dirty = False
@@ -0,0 +1,125 @@
+# Copyright 2012-2013 (C) Daniel Watkins <daniel@daniel-watkins.co.uk>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import io
+import re
+
+from sphinx.util import logging
+
+from .context import get_context
+from .query import ChangelogQuery
+from .repos import find_repos
+
+_DIRECTIVE = re.compile(r'^([ \t]*)\.\.[ \t]+([\w-]+)[ \t]*::[ \t]*$')
+_OPTION = re.compile(r'^([ \t]+):([^:\s][^:]*):(?:[ \t]+(.*?))?[ \t]*$')
+
+logger = logging.getLogger(__name__)
+
+
+def scan_source(text, option_specs):
+    """
+    Yield the name and options of each directive in ``option_specs``.
+
+    This is a cheap textual scan of reStructuredText source, so directives
+    reached through ``include`` or generated by other extensions aren't
+    found.  Directives whose options can't be converted are skipped; they
+    will report their errors when they are run.
+    """
+    lines = text.splitlines()
+    for number, line in enumerate(lines):
+        match = _DIRECTIVE.match(line)
+        if match is None or match.group(2) not in option_specs:
+            continue
+        indent, name = match.groups()
+        option_spec = option_specs[name]
+        options = {}
+        try:
+            for option_line in lines[number + 1:]:
+                option = _OPTION.match(option_line)
+                if (option is None or len(option.group(1)) <= len(indent) or
+                        option.group(2) not in option_spec):
+                    break
+                options[option.group(2)] = option_spec[option.group(2)](
+                    option.group(3))
+        except (ValueError, TypeError):
+            continue
+        yield name, options
+
+
+def _read_source(env, docname):
+    try:
+        with io.open(env.doc2path(docname), errors='replace',
+                     encoding=env.config.source_encoding) as source:
+            return source.read()
+    except (IOError, OSError):
+        return ''
+
+
+def _prefetch_changelog(context, repo_dir, options, background):
+    query = ChangelogQuery.from_options(options)
+    for repo in find_repos(context, repo_dir,
+                           options.get('extra-repo-dirs', '').split(),
+                           'submodules' in options):
+        if 'group-by-tag' in options:
+            context.tag_index(repo)
+        if background:
+            context.prefetch_commits(query, repo)
+
+
+def prefetch(app, env, docnames, option_specs):
+    """
+    Start the git work for the directives in ``docnames`` in the background.
+
+    Each distinct changelog query and working tree status is handed to the
+    build context's thread pool, so that git runs while Sphinx parses
+    documents and directives mostly find their results waiting for them.
+
+    In parallel builds nothing is started in the background, but the
+    last-change indexes ``git_last_updated`` needs, and the tag indexes of
+    changelogs grouped by release, are brought up to date here, so that the
+    forked readers don't each have to.
+    """
+    context = get_context(env)
+    # Parallel readers already overlap their git work, and forking while
+    # prefetching threads are running isn't safe.
+    background = (context.settings.prefetch and
+                  context.settings.backend_class.thread_safe and
+                  app.parallel <= 1)
+    if not background and app.parallel <= 1:
+        return
+    for docname in sorted(docnames):
+        for name, options in scan_source(_read_source(env, docname),
+                                         option_specs):
+            # Only import GitPython once there is some git work to do.
+            # pylint: disable=import-outside-toplevel
+            from git.exc import GitError
+            repo_dir = options.get('repo-dir', env.srcdir)
+            try:
+                repo = context.find_repo(repo_dir)
+                if name == 'git_last_updated':
+                    context.last_changes(repo)
+                elif name == 'git_changelog':
+                    _prefetch_changelog(context, repo_dir, options,
+                                        background)
+                elif background and ('uncommitted' in options or
+                                     'untracked' in options):
+                    context.prefetch_status(repo, 'untracked' in options)
+            except (GitError, ValueError) as exc:
+                # The directive will fail the same way, and report it, when
+                # it is run.
+                logger.debug('not prefetching git data for %s: %s',
+                             docname, exc)
+    if background:
+        context.start_prefetching()
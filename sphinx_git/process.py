@@ -0,0 +1,157 @@
+# Copyright 2012-2013 (C) Daniel Watkins <daniel@daniel-watkins.co.uk>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import subprocess
+import tempfile
+import threading
+from contextlib import contextmanager
+
+from . import stats
+
+
+def work_dir(repo):
+    """Return the directory git commands for ``repo`` should be run in."""
+    return repo.working_tree_dir or repo.git_dir
+
+
+def repo_name(repo):
+    """Return the name shown for ``repo`` in a merged changelog."""
+    return os.path.basename(os.path.normpath(work_dir(repo)))
+
+
+def _feed(stream, lines):
+    try:
+        for line in lines:
+            stream.write(line.encode('utf-8') + b'\n')
+    except (IOError, OSError):
+        # git stopped reading (e.g. it was terminated early); nothing more
+        # to feed it.
+        pass
+    finally:
+        try:
+            stream.close()
+        except (IOError, OSError):
+            pass
+
+
+def iter_git_records(cwd, args, stdin_lines=None, separator=b'\0'):
+    """Run ``git args`` in ``cwd`` and lazily yield its output records.
+
+    Output is split on ``separator`` and decoded as UTF-8.  ``stdin_lines``,
+    if given, is fed to the process from a separate thread so that commands
+    like ``diff-tree --stdin`` can stream in both directions.  If iteration
+    stops early, the git process is terminated.
+    """
+    with _git_process(cwd, args, stdin_lines) as proc:
+        for record in _read_records(proc.stdout, separator):
+            yield record
+
+
+@contextmanager
+def _git_process(cwd, args, stdin_lines):
+    # Run git for the duration of the block, then wait for it and raise a
+    # GitCommandError if it failed.  If the block is left early, git is
+    # killed instead.
+    command = ['git'] + list(args)
+    stats.count('processes')
+    stderr = tempfile.TemporaryFile()
+    proc = subprocess.Popen(command, cwd=cwd, stdin=subprocess.PIPE,
+                            stdout=subprocess.PIPE, stderr=stderr)
+    feeder = None
+    if stdin_lines is None:
+        proc.stdin.close()
+    else:
+        feeder = threading.Thread(target=_feed, args=(proc.stdin, stdin_lines))
+        feeder.daemon = True
+        feeder.start()
+    finished = False
+    try:
+        yield proc
+        finished = True
+    finally:
+        if not finished and proc.poll() is None:
+            proc.kill()
+        proc.stdout.close()
+        status = proc.wait()
+        if feeder is not None:
+            feeder.join()
+        stderr.seek(0)
+        error = stderr.read()
+        stderr.close()
+    if status != 0:
+        # pylint: disable=import-outside-toplevel
+        from git.exc import GitCommandError
+        raise GitCommandError(command, status, error)
+
+
+def _read_records(stream, separator):
+    # Yield each record of ``stream`` as soon as it has been read in full.
+    fd = stream.fileno()
+    buf = b''
+    while True:
+        chunk = os.read(fd, 65536)
+        if not chunk:
+            break
+        buf += chunk
+        records = buf.split(separator)
+        buf = records.pop()
+        for record in records:
+            yield record.decode('utf-8', 'replace')
+    if buf:
+        yield buf.decode('utf-8', 'replace')
+
+
+class BatchCheck(object):
+    """
+    A long-lived ``git cat-file --batch-check`` process.
+
+    It names the object each revision refers to, as ``git rev-parse`` would,
+    but any number of revisions can be looked up through its one pipe.  The
+    process is started on first use, and may be shared between threads.
+    """
+
+    def __init__(self, cwd):
+        self.cwd = cwd
+        self._proc = None
+        self._lock = threading.Lock()
+
+    def object_id(self, revision):
+        """Return the id of the object ``revision`` names, or ``None``."""
+        if '\n' in revision:
+            return None
+        with self._lock:
+            if self._proc is None:
+                stats.count('processes')
+                self._proc = subprocess.Popen(
+                    ['git', 'cat-file', '--batch-check'], cwd=self.cwd,
+                    stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+            self._proc.stdin.write(revision.encode('utf-8') + b'\n')
+            self._proc.stdin.flush()
+            line = self._proc.stdout.readline().decode('utf-8', 'replace')
+        # Found objects are reported as "<id> <type> <size>"; anything else
+        # ("<revision> missing", "<revision> ambiguous") is a failure.
+        fields = line.split()
+        if len(fields) != 3 or not fields[2].isdigit():
+            return None
+        return fields[0]
+
+    def close(self):
+        with self._lock:
+            if self._proc is not None:
+                self._proc.stdin.close()
+                self._proc.stdout.close()
+                self._proc.wait()
+                self._proc = None
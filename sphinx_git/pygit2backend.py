@@ -0,0 +1,346 @@
+# Copyright 2012-2013 (C) Daniel Watkins <daniel@daniel-watkins.co.uk>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import fnmatch
+import heapq
+import itertools
+import re
+
+from .backends import GitBackend, HeadInfo
+from .commits import CommitRecord
+from .query import WalkOptions
+from .status import WorkingTreeStatus
+
+# pygit2 is optional, and slow to import, so it is only imported once its
+# backend is asked for.
+pygit2 = None
+
+
+def _import_pygit2():
+    global pygit2  # pylint: disable=global-statement,invalid-name
+    if pygit2 is None:
+        # pylint: disable=import-outside-toplevel,import-error
+        import pygit2 as module
+        pygit2 = module
+    return pygit2
+
+
+def _glob_regex(pattern):
+    # Translate a git ":(glob)" pattern, where "*" stays within a directory
+    # and "**" crosses directories.
+    parts = []
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith('**/', i):
+            parts.append('(?:.*/)?')
+            i += 3
+        elif pattern.startswith('/**', i) and i + 3 == len(pattern):
+            parts.append('/.*')
+            i += 3
+        elif pattern[i] == '*':
+            parts.append('[^/]*')
+            i += 1
+        elif pattern[i] == '?':
+            parts.append('[^/]')
+            i += 1
+        elif pattern[i] == '\\' and i + 1 < len(pattern):
+            parts.append(re.escape(pattern[i + 1]))
+            i += 2
+        else:
+            parts.append(re.escape(pattern[i]))
+            i += 1
+    return re.compile(''.join(parts) + r'\Z')
+
+
+def _literal_prefix(pathspec):
+    # Return the text every path matching ``pathspec`` starts with.
+    if pathspec.startswith(':(literal)'):
+        return pathspec[len(':(literal)'):]
+    glob = pathspec.startswith(':(glob)')
+    if glob:
+        pathspec = pathspec[len(':(glob)'):]
+    prefix = []
+    i = 0
+    while i < len(pathspec) and pathspec[i] not in '*?[':
+        if glob and pathspec[i] == '\\' and i + 1 < len(pathspec):
+            i += 1
+        elif pathspec[i] == '\\':
+            break
+        prefix.append(pathspec[i])
+        i += 1
+    return ''.join(prefix)
+
+
+class _Pathspecs(object):
+    """
+    Matches paths against the pathspecs sphinx-git passes to git.
+
+    The plain, ``:(literal)`` and ``:(glob)`` pathspecs sphinx-git uses are
+    understood; as in git, a pathspec naming a directory matches everything
+    beneath it.
+    """
+
+    def __init__(self, pathspecs):
+        self._tests = []
+        self._roots = []
+        for pathspec in pathspecs:
+            directory, _, name_prefix = _literal_prefix(
+                pathspec).rpartition('/')
+            self._roots.append((directory, name_prefix))
+            if pathspec.startswith(':(glob)'):
+                self._tests.append(
+                    _glob_regex(pathspec[len(':(glob)'):]).match)
+                continue
+            literal = pathspec.startswith(':(literal)')
+            if literal:
+                pathspec = pathspec[len(':(literal)'):]
+            pathspec = pathspec.rstrip('/')
+            if not literal and any(char in '*?[' for char in pathspec):
+                self._tests.append(lambda path, spec=pathspec:
+                                   fnmatch.fnmatchcase(path, spec))
+            self._tests.append(lambda path, spec=pathspec:
+                               path == spec or path.startswith(spec + '/'))
+
+    def matches(self, path):
+        return any(test(path) for test in self._tests)
+
+    def summary(self, tree):
+        """
+        Return a value that differs between trees whose matching paths do.
+
+        Only the tree entries the pathspecs' literal prefixes lead to are
+        looked at, so the trees of commits which don't change any matching
+        path can be compared without diffing them.
+        """
+        summary = []
+        for directory, name_prefix in self._roots:
+            entries = ()
+            try:
+                subtree = tree[directory] if directory else tree
+            except (KeyError, TypeError):
+                subtree = None
+            if isinstance(subtree, pygit2.Tree):
+                entries = tuple((entry.name, entry.id) for entry in subtree
+                                if entry.name.startswith(name_prefix))
+            elif subtree is not None:
+                entries = ((None, subtree.id),)
+            summary.append(entries)
+        return summary
+
+
+def _diff_trees(old_tree, new_tree, prefix, paths):
+    """
+    Add to ``paths`` the path of every file that differs between two trees.
+
+    libgit2's own tree diffs visit every entry of both trees, so this only
+    descends into subtrees whose ids differ; ``None`` stands for the empty
+    tree.
+    """
+    old = dict((entry.name, entry) for entry in old_tree or ())
+    new = dict((entry.name, entry) for entry in new_tree or ())
+    for name in set(old) | set(new):
+        old_entry = old.get(name)
+        new_entry = new.get(name)
+        if (old_entry is not None and new_entry is not None and
+                old_entry.id == new_entry.id and
+                old_entry.filemode == new_entry.filemode):
+            continue
+        old_subtree, new_subtree = [
+            entry if isinstance(entry, pygit2.Tree) else None
+            for entry in (old_entry, new_entry)]
+        if old_subtree is not None or new_subtree is not None:
+            _diff_trees(old_subtree, new_subtree, prefix + name + '/', paths)
+        if ((old_entry is not None and old_subtree is None) or
+                (new_entry is not None and new_subtree is None)):
+            paths.add(prefix + name)
+    return paths
+
+
+class Pygit2Backend(GitBackend):
+    """
+    Reads a repository in-process through libgit2, using pygit2.
+
+    History is walked, commits are diffed and the working tree is checked
+    without starting any processes.  Walks limited by date are left to
+    ``git log``, which understands every date format the options accept.
+    """
+
+    name = 'pygit2'
+    # pygit2 repositories mustn't be shared between threads.
+    thread_safe = False
+
+    def __init__(self, repo, diff_jobs=1):
+        super(Pygit2Backend, self).__init__(repo, diff_jobs)
+        self.git_repo = _import_pygit2().Repository(repo.git_dir)
+
+    @classmethod
+    def available(cls):
+        try:
+            _import_pygit2()
+        except ImportError:
+            return False
+        return True
+
+    def head(self):
+        branch = None
+        if not self.git_repo.head_is_detached:
+            branch = self.git_repo.head.shorthand
+        return HeadInfo(str(self.git_repo.head.target), branch)
+
+    def remote_url(self, name):
+        try:
+            return self.git_repo.remotes[name].url
+        except KeyError:
+            return None
+
+    def _object_id(self, revision):
+        if '\n' in revision:
+            return None
+        try:
+            return str(self.git_repo.revparse_single(revision).id)
+        except (KeyError, ValueError, pygit2.GitError):
+            return None
+
+    def _commit(self, object_id):
+        return self.git_repo[object_id].peel(pygit2.Commit)
+
+    def log(self, rev_list, options=WalkOptions()):
+        if options.since is not None or options.until is not None:
+            return super(Pygit2Backend, self).log(rev_list, options)
+        if not isinstance(rev_list, tuple):
+            rev_list = self.rev_parse(rev_list)
+        return self._walk(rev_list, options)
+
+    def _walk(self, object_ids, options):
+        starts = []
+        hidden = []
+        for object_id in object_ids:
+            if object_id.startswith('^'):
+                hidden.append(self._commit(object_id[1:]))
+            else:
+                starts.append(self._commit(object_id))
+        members = None
+        if hidden:
+            # libgit2 works out which commits a range holds, but orders
+            # commits with equal dates differently from git, so they are
+            # listed in git's order below.
+            walker = self.git_repo.walk(None, pygit2.GIT_SORT_NONE)
+            for commit in starts:
+                walker.push(commit.id)
+            for commit in hidden:
+                walker.hide(commit.id)
+            members = set(commit.id for commit in walker)
+        spec = None
+        if options.pathspecs:
+            spec = _Pathspecs(options.pathspecs)
+        count = 0
+        for commit in self._by_date(starts, members, options.first_parent):
+            if options.max_count is not None and count >= options.max_count:
+                return
+            if options.merges_only and len(commit.parent_ids) < 2:
+                continue
+            parent_trees = self._parent_trees(commit)
+            if options.first_parent:
+                parent_trees = parent_trees[:1]
+            # As with --full-history, a merge is listed if it differs from
+            # any of the parents followed.
+            if spec is not None and not any(
+                    self._changes(parent_tree, commit.tree, spec)
+                    for parent_tree in parent_trees):
+                continue
+            count += 1
+            yield CommitRecord(str(commit.id),
+                               tuple(str(parent_id)
+                                     for parent_id in commit.parent_ids),
+                               commit.author.name, commit.author.time,
+                               commit.commit_time, commit.message)
+
+    @staticmethod
+    def _by_date(starts, members, first_parent=False):
+        # Like git, list the newest commit waiting to be shown, then queue
+        # its parents (only the first, with first_parent); commits with
+        # equal dates are shown in the order they were queued.  A range's
+        # members come from a walk of every parent, as git also excludes
+        # everything the hidden commits can reach.
+        queue = []
+        queued = set()
+        order = itertools.count()
+
+        def push(commit):
+            if commit.id not in queued and (members is None or
+                                            commit.id in members):
+                queued.add(commit.id)
+                heapq.heappush(queue,
+                               (-commit.commit_time, next(order), commit))
+
+        for commit in starts:
+            push(commit)
+        while queue:
+            commit = heapq.heappop(queue)[2]
+            yield commit
+            parents = commit.parents
+            if first_parent:
+                parents = parents[:1]
+            for parent in parents:
+                push(parent)
+
+    @staticmethod
+    def _parent_trees(commit):
+        # Root commits are compared with the empty tree, given as None.
+        return [parent.tree for parent in commit.parents] or [None]
+
+    def _changes(self, old_tree, new_tree, spec=None):
+        """Return the paths matching ``spec`` which differ between trees."""
+        if spec is not None:
+            if old_tree is None:
+                if not any(spec.summary(new_tree)):
+                    return []
+            elif spec.summary(old_tree) == spec.summary(new_tree):
+                return []
+        paths = _diff_trees(old_tree, new_tree, '', set())
+        if spec is not None:
+            paths = [path for path in paths if spec.matches(path)]
+        return sorted(paths)
+
+    def changed_paths(self, commits, pathspecs=None):
+        spec = _Pathspecs(pathspecs) if pathspecs else None
+        for record in commits:
+            commit = self.git_repo[record.hexsha]
+            yield record.hexsha, self._changes(
+                self._parent_trees(commit)[0], commit.tree, spec)
+
+    def status(self, untracked):
+        dirty = has_untracked = False
+        # Untracked files are only listed if asked for, and then without
+        # descending into untracked directories, as git status does.
+        try:
+            statuses = self.git_repo.status(
+                untracked_files='normal' if untracked else 'no')
+        except TypeError:
+            # Older pygit2 releases always list every untracked file.
+            statuses = self.git_repo.status()
+        for flags in statuses.values():
+            if flags & pygit2.GIT_STATUS_WT_NEW:
+                has_untracked = True
+            elif not flags & pygit2.GIT_STATUS_IGNORED:
+                dirty = True
+        return WorkingTreeStatus(dirty, has_untracked if untracked else None)
+
+    def close(self):
+        super(Pygit2Backend, self).close()
+        # Older pygit2 releases free repositories only when collected.
+        free = getattr(self.git_repo, 'free', None)
+        if free is not None:
+            free()
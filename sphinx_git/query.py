@@ -0,0 +1,228 @@
+# Copyright 2012-2013 (C) Daniel Watkins <daniel@daniel-watkins.co.uk>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import heapq
+from collections import namedtuple
+from itertools import islice
+
+from . import stats
+from .commits import CommitList
+from .filters import FilenameFilter
+from .process import iter_git_records
+
+# Commits examined before the filename filter is first applied, when a limit
+# on the number of matches may stop the walk early; each later batch doubles.
+_FIRST_BATCH = 64
+
+
+def absolute_dates(cwd, since, until):
+    """
+    Return ``since`` and ``until`` as the ``@<timestamp>`` dates git reads
+    them as now (``None`` stays ``None``).
+
+    git reads dates like "6 months ago" relative to the current time, and
+    fills in the current time of day for a plain date, so the commits a
+    query selects can change with nothing but time passing.
+    """
+    args = ['rev-parse']
+    if since is not None:
+        args.append('--since=' + since)
+    if until is not None:
+        args.append('--until=' + until)
+    ages = dict(record.split('=', 1) for record in iter_git_records(
+        cwd, args, separator=b'\n'))
+    return tuple(None if age not in ages else '@' + ages[age]
+                 for age in ('--max-age', '--min-age'))
+
+
+class WalkOptions(namedtuple('WalkOptions', [
+        'max_count', 'since', 'until', 'pathspecs', 'first_parent',
+        'merges_only'])):
+    """
+    How a backend's ``log`` walks history.
+
+    ``max_count``, ``since`` and ``until`` limit the walk as ``git log``'s
+    options of the same names do.  If ``pathspecs`` are given, only commits
+    changing a matching path (compared with any parent followed, as with
+    ``--full-history``) are listed.  ``first_parent`` follows only the first
+    parent of merges, and ``merges_only`` lists only merges, as
+    ``--first-parent`` and ``--merges`` do; ``max_count`` counts the commits
+    listed.
+    """
+
+    __slots__ = ()
+
+
+# Any option not given leaves the walk unrestricted.
+WalkOptions.__new__.__defaults__ = (None, None, None, None, False, False)
+
+
+class ChangelogQuery(namedtuple('ChangelogQuery', [
+        'rev_list', 'revisions', 'filename_filter', 'since', 'until',
+        'max_scan', 'max_matches', 'first_parent', 'merges_only'])):
+    """
+    The commits a git_changelog directive asks for, independent of markup.
+
+    Queries are normalised (``revisions`` is ``None`` whenever a ``rev_list``
+    is given, as it is then ignored), so equal queries select equal commits
+    from equal history.
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def from_options(cls, options):
+        rev_list = options.get('rev-list')
+        revisions = None
+        if rev_list is None:
+            revisions = options.get('revisions', 10)
+        return cls(rev_list, revisions, options.get('filename_filter'),
+                   options.get('since'), options.get('until'),
+                   options.get('max-scan'), options.get('max-matches'),
+                   'first-parent' in options, 'merges-only' in options)
+
+    def resolve(self, backend):
+        """Return the SHAs that this query's revisions currently refer to."""
+        if self.rev_list is None:
+            return (backend.head().hexsha,)
+        return backend.rev_parse(self.rev_list)
+
+    def _walk(self, backend, filename_filter, resolved):
+        if self.rev_list is None:
+            head = backend.head().hexsha if resolved is None else resolved[0]
+            # Let git stop the walk once enough commits have been produced,
+            # rather than materialising the whole history and slicing it.
+            return backend.log(head, WalkOptions(
+                max_count=self.revisions, since=self.since, until=self.until,
+                first_parent=self.first_parent,
+                merges_only=self.merges_only))
+        pathspecs = None
+        if self.max_scan is None and filename_filter is not None:
+            # Only commits touching the filter's prefix can match, so let git
+            # prune the rest of the range while walking it.  With max-scan
+            # the walk must stop after the range's most recent commits
+            # instead, which pruning would hide from us.
+            pathspecs = filename_filter.pathspecs
+        rev_list = self.rev_list if resolved is None else tuple(resolved)
+        return backend.log(rev_list, WalkOptions(
+            since=self.since, until=self.until, pathspecs=pathspecs,
+            first_parent=self.first_parent, merges_only=self.merges_only))
+
+    def load(self, backend, path_index=None, resolved=None):
+        """
+        Return a ``CommitList`` of the ``CommitRecord``s this query selects.
+
+        ``path_index``, if given, is the repository's ``ChangedPathIndex``,
+        which is used (and extended) to apply the filename filter.
+        ``resolved``, if given, holds the SHAs (as ``resolve`` returns them)
+        to walk from, in place of the query's revisions.
+        """
+        filename_filter = None
+        if self.filename_filter is not None:
+            filename_filter = FilenameFilter(self.filename_filter)
+        walk = self._walk(backend, filename_filter, resolved)
+        commits = CommitList()
+        try:
+            scanned = self._collect(walk, commits, filename_filter, backend,
+                                    path_index)
+        finally:
+            # Stop git if the walk was cut short.
+            walk.close()
+        stats.count('scanned', scanned)
+        return commits
+
+    def _collect(self, walk, commits, filename_filter, backend, path_index):
+        """
+        Add the commits that match from ``walk`` to ``commits``.
+
+        The walk is consumed in batches, stopping as soon as a limit is
+        reached.  Returns the number of commits scanned.
+        """
+        max_matches = self.max_matches
+        batch_size = None
+        if max_matches is not None:
+            # Without a filter every commit scanned matches.
+            batch_size = _FIRST_BATCH if filename_filter else max_matches
+        scanned = 0
+        while True:
+            limit = batch_size
+            if self.max_scan is not None:
+                remaining = self.max_scan - scanned
+                limit = remaining if limit is None else min(limit, remaining)
+            with stats.phase('walk'):
+                batch = list(islice(walk, limit))
+            scanned += len(batch)
+            exhausted = limit is None or len(batch) < limit
+            if filename_filter is not None:
+                with stats.phase('filter'):
+                    batch = filename_filter.select(backend, batch,
+                                                   path_index)
+            commits.extend(batch)
+            if max_matches is not None and len(commits) >= max_matches:
+                if len(commits) > max_matches or not self._at_end(walk):
+                    commits.truncated = 'max-matches'
+                del commits[max_matches:]
+                return scanned
+            if self.max_scan is not None and scanned >= self.max_scan:
+                if not self._at_end(walk):
+                    commits.truncated = 'max-scan'
+                return scanned
+            if exhausted:
+                return scanned
+            batch_size *= 2
+
+    @staticmethod
+    def _at_end(walk):
+        with stats.phase('walk'):
+            return next(walk, None) is None
+
+    def merge(self, changelogs):
+        """
+        Merge the commits this query selected from several repositories.
+
+        ``changelogs`` holds a ``(name, commits)`` pair for each repository.
+        The lists are merged newest first by a streaming k-way merge, which
+        stops as soon as the ``revisions`` or ``max-matches`` limit is
+        reached, and the result's ``repos`` names each commit's repository.
+        A single repository's commits are returned as they are.
+        """
+        if len(changelogs) == 1:
+            return changelogs[0][1]
+        limits = [limit for limit in (self.revisions, self.max_matches)
+                  if limit is not None]
+        limit = min(limits) if limits else None
+        merged = CommitList()
+        merged.repos = []
+        streams = [_by_date(index, commits)
+                   for index, (_, commits) in enumerate(changelogs)]
+        for _, index, _, commit in heapq.merge(*streams):
+            if len(merged) == limit:
+                if limit != self.revisions:
+                    merged.truncated = 'max-matches'
+                break
+            merged.append(commit)
+            merged.repos.append(changelogs[index][0])
+        if merged.truncated is None:
+            merged.truncated = next((commits.truncated
+                                     for _, commits in changelogs
+                                     if commits.truncated), None)
+        return merged
+
+
+def _by_date(index, commits):
+    # Sort keys for heapq.merge that never fall back to comparing commits.
+    # git lists commits by committer date, so that is what they're merged by.
+    for position, commit in enumerate(commits):
+        yield -commit.committed_date, index, position, commit
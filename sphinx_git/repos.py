@@ -0,0 +1,67 @@
+# Copyright 2012-2013 (C) Daniel Watkins <daniel@daniel-watkins.co.uk>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+
+from .process import iter_git_records
+
+
+def find_repos(context, path, extra_paths=(), submodules=False):
+    """
+    Return the repositories containing ``path`` and ``extra_paths``.
+
+    Repositories come from ``context``'s pool.  If ``submodules`` is true,
+    each repository is followed by its checked out submodules, and theirs in
+    turn.  Each repository is only returned once.
+    """
+    repos = []
+
+    def add(repo_dir):
+        repo = context.find_repo(repo_dir)
+        if any(found is repo for found in repos):
+            return
+        repos.append(repo)
+        if submodules:
+            for submodule_dir in context.submodules(repo):
+                add(submodule_dir)
+
+    add(path)
+    for extra in extra_paths:
+        add(extra)
+    return repos
+
+
+def submodule_dirs(directory):
+    """Return the directories of the checked out submodules of the
+    repository whose working tree is ``directory``."""
+    if not os.path.isfile(os.path.join(directory, '.gitmodules')):
+        return []
+    # pylint: disable=import-outside-toplevel
+    from git.exc import GitCommandError
+    try:
+        records = list(iter_git_records(directory, [
+            'config', '-z', '--file', '.gitmodules', '--get-regexp',
+            r'^submodule\..*\.path$']))
+    except GitCommandError:
+        # .gitmodules names no paths.
+        return []
+    dirs = []
+    for record in records:
+        # Each record is the key, a newline, then the path.
+        path = os.path.join(directory, record.split('\n', 1)[-1])
+        # Submodules which haven't been initialised are empty directories.
+        if os.path.exists(os.path.join(path, '.git')):
+            dirs.append(path)
+    return dirs
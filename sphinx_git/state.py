@@ -0,0 +1,113 @@
+# Copyright 2012-2013 (C) Daniel Watkins <daniel@daniel-watkins.co.uk>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# pylint: disable=too-few-public-methods
+class Indexes(object):
+    """The caches and indexes kept between builds."""
+
+    def __init__(self):
+        # The ChangelogCache, loaded when first asked for.
+        self.changelog = None
+        # Each repository's ChangedPathIndex, LastChangeIndex and TagIndex.
+        self.paths = {}
+        self.last_changes = {}
+        self.tags = {}
+        # Cache entries added by a parallel reading process, which are handed
+        # back to the main process through its pickled environment.
+        self.changelog_updates = None
+        # Likewise for additions to the changed-path indexes.
+        self.path_updates = None
+
+    def for_worker(self):
+        """
+        Return the indexes of a process forked from this one.
+
+        They are shared with this process, which merges in what the worker
+        adds to them.  Last-change and tag indexes are normally brought up
+        to date before workers are forked.
+        """
+        indexes = Indexes()
+        indexes.changelog = self.changelog
+        indexes.paths = self.paths
+        indexes.last_changes = self.last_changes
+        indexes.tags = self.tags
+        return indexes
+
+    def save(self):
+        if self.changelog is not None:
+            self.changelog.save()
+        for kind in [self.paths, self.last_changes, self.tags]:
+            for index in kind.values():
+                index.save()
+            kind.clear()
+
+
+# pylint: disable=too-few-public-methods
+class Repositories(object):
+    """The repositories a build has opened, and how they are read."""
+
+    def __init__(self):
+        # Keyed on git directory.
+        self.handles = {}
+        self.backends = {}
+        # The checked out submodules of each repository.
+        self.submodules = {}
+        # The git directory of each path looked up.
+        self.git_dirs = {}
+
+    def close(self):
+        for backend in self.backends.values():
+            backend.close()
+        self.backends.clear()
+        for repo in self.handles.values():
+            repo.close()
+        self.handles.clear()
+        self.submodules.clear()
+        self.git_dirs.clear()
+
+
+# pylint: disable=too-few-public-methods
+class Memo(object):
+    """What has been worked out about each repository during the build."""
+
+    def __init__(self):
+        self.resolved = {}
+        self.dates = {}
+        # The commits found for each query, so that a changelog repeated
+        # across documents only does its work once per build.
+        self.found = {}
+        self.statuses = {}
+
+    def clear(self):
+        for memo in [self.resolved, self.dates, self.found, self.statuses]:
+            memo.clear()
+
+
+# pylint: disable=too-few-public-methods
+class PrefetchQueue(object):
+    """Work queued by the prefetch stage, then its results as they arrive."""
+
+    def __init__(self):
+        self.queued = []
+        self.pending = {}
+        self.pool = None
+
+    def close(self):
+        if self.pool is not None:
+            # Anything still running was never asked for.
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+        self.pending.clear()
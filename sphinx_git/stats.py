@@ -0,0 +1,149 @@
+# Copyright 2012-2013 (C) Daniel Watkins <daniel@daniel-watkins.co.uk>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import threading
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
+from timeit import default_timer
+
+PHASES = ['open', 'resolve', 'prefetch', 'walk', 'filter', 'status',
+          'markup']
+
+_ACTIVE = threading.local()
+# Counts may be added to by threads working on behalf of a directive.
+_COUNT_LOCK = threading.Lock()
+
+
+class DirectiveTiming(namedtuple('DirectiveTiming', [
+        'directive', 'docname', 'lineno', 'phases', 'counts'])):
+    """
+    Where the time went in a single git directive invocation.
+
+    ``phases`` maps each phase to the seconds spent in it, and ``counts``
+    holds the directive's total seconds along with its other tallies.
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def create(cls, directive, docname, lineno):
+        return cls(directive, docname, lineno, OrderedDict(),
+                   {'total': 0.0, 'scanned': 0, 'displayed': 0,
+                    'processes': 0})
+
+    @property
+    def total(self):
+        return self.counts['total']
+
+    def as_dict(self):
+        return OrderedDict([
+            ('directive', self.directive),
+            ('docname', self.docname),
+            ('lineno', self.lineno),
+            ('total', self.total),
+            ('phases', self.phases),
+            ('scanned', self.counts['scanned']),
+            ('displayed', self.counts['displayed']),
+            ('processes', self.counts['processes']),
+        ])
+
+
+@contextmanager
+def activate(timing):
+    """Attribute the phases and counts in this block to ``timing``."""
+    previous = getattr(_ACTIVE, 'timing', None)
+    _ACTIVE.timing = timing
+    start = default_timer()
+    try:
+        yield timing
+    finally:
+        timing.counts['total'] += default_timer() - start
+        _ACTIVE.timing = previous
+
+
+def active():
+    """Return the timing phases and counts are attributed to, if any."""
+    return getattr(_ACTIVE, 'timing', None)
+
+
+@contextmanager
+def attribute(timing):
+    """
+    Attribute the counts in this block to ``timing``, without timing it.
+
+    This is for threads doing part of the work of the directive that
+    started them, whose time is already counted by that directive.
+    """
+    previous = getattr(_ACTIVE, 'timing', None)
+    _ACTIVE.timing = timing
+    try:
+        yield
+    finally:
+        _ACTIVE.timing = previous
+
+
+@contextmanager
+def phase(name):
+    """Time this block as ``name`` in the active timing, if there is one."""
+    timing = getattr(_ACTIVE, 'timing', None)
+    if timing is None:
+        yield
+        return
+    start = default_timer()
+    try:
+        yield
+    finally:
+        timing.phases[name] = (timing.phases.get(name, 0.0) +
+                               default_timer() - start)
+
+
+def count(name, amount=1):
+    """Add ``amount`` to the active timing's ``name`` counter."""
+    timing = getattr(_ACTIVE, 'timing', None)
+    if timing is not None:
+        with _COUNT_LOCK:
+            timing.counts[name] += amount
+
+
+def format_report(timings):
+    """Return a table of ``timings``, slowest first, as a list of lines."""
+    columns = ['location', 'directive', 'total'] + PHASES + [
+        'scanned', 'displayed', 'git']
+    rows = []
+    for timing in sorted(timings, key=lambda t: t.total, reverse=True):
+        rows.append(
+            ['{0}:{1}'.format(timing.docname, timing.lineno),
+             timing.directive,
+             '{0:.1f}'.format(timing.total * 1000)] +
+            ['{0:.1f}'.format(timing.phases[name] * 1000)
+             if name in timing.phases else '-' for name in PHASES] +
+            [str(timing.counts['scanned']),
+             str(timing.counts['displayed']),
+             str(timing.counts['processes'])])
+    widths = [max([len(column)] + [len(row[i]) for row in rows])
+              for i, column in enumerate(columns)]
+    lines = []
+    for row in [columns] + rows:
+        lines.append('  '.join(
+            cell.ljust(width) if i < 2 else cell.rjust(width)
+            for i, (cell, width) in enumerate(zip(row, widths))))
+    return lines
+
+
+def write_json(path, timings):
+    with open(path, 'w') as json_file:
+        json.dump([timing.as_dict() for timing in timings], json_file,
+                  indent=2)
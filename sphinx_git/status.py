@@ -0,0 +1,77 @@
+# Copyright 2012-2013 (C) Daniel Watkins <daniel@daniel-watkins.co.uk>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import subprocess
+from collections import namedtuple
+
+from . import stats
+from .process import iter_git_records
+
+
+class WorkingTreeStatus(namedtuple('WorkingTreeStatus', ['dirty',
+                                                         'untracked'])):
+    """
+    Whether a working tree has uncommitted changes and untracked files.
+
+    ``untracked`` is ``None`` if untracked files were not looked for.
+    """
+
+    __slots__ = ()
+
+
+def _differs(cwd, args):
+    command = ['git', '--no-optional-locks'] + args + ['--quiet']
+    stats.count('processes')
+    proc = subprocess.Popen(command, cwd=cwd, stdin=subprocess.PIPE,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    _, error = proc.communicate()
+    if proc.returncode not in (0, 1):
+        # pylint: disable=import-outside-toplevel
+        from git.exc import GitCommandError
+        raise GitCommandError(command, proc.returncode, error)
+    return proc.returncode == 1
+
+
+def probe_status(cwd, untracked):
+    """
+    Return the ``WorkingTreeStatus`` of the working tree in ``cwd``.
+
+    If untracked files aren't wanted, ``git diff --quiet`` checks the working
+    tree and then the index, each stopping at the first difference.
+    Otherwise a single ``git status`` answers both questions, so git's
+    untracked cache and fsmonitor integration apply and untracked directories
+    are reported as one entry rather than file by file; it prints nothing
+    until its scan is complete, so it is only used when it has to be.
+    """
+    if not untracked:
+        return WorkingTreeStatus(
+            _differs(cwd, ['diff']) or _differs(cwd, ['diff', '--cached']),
+            None)
+    args = ['--no-optional-locks', 'status', '--porcelain', '-z',
+            '--no-renames', '--untracked-files=normal']
+    dirty = False
+    has_untracked = False
+    records = iter_git_records(cwd, args)
+    try:
+        for record in records:
+            if record.startswith('??'):
+                has_untracked = True
+            elif record:
+                dirty = True
+            if dirty and has_untracked:
+                break
+    finally:
+        records.close()
+    return WorkingTreeStatus(dirty, has_untracked)
@@ -0,0 +1,167 @@
+# Copyright 2012-2013 (C) Daniel Watkins <daniel@daniel-watkins.co.uk>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import hashlib
+
+from .cache import dump_pickle, load_pickle
+from .process import iter_git_records
+
+_TAG_FIELDS = ['%(refname)', '%(objecttype)', '%(objectname)',
+               '%(committerdate:raw)', '%(*objecttype)', '%(*objectname)',
+               '%(*committerdate:raw)']
+
+
+def read_tags(directory):
+    """
+    Return ``{name: (date, hexsha)}`` for each tag of a commit.
+
+    ``date`` is the committer date of the tagged commit.  Tags of other
+    objects (trees, blobs) can't contain commits, so are left out.
+    """
+    tags = {}
+    for record in iter_git_records(directory, [
+            'for-each-ref', '--format=' + '%00'.join(_TAG_FIELDS),
+            'refs/tags'], separator=b'\n'):
+        (refname, object_type, hexsha, date, peeled_type, peeled_hexsha,
+         peeled_date) = record.split('\0')
+        if peeled_type:
+            # An annotated tag.
+            object_type, hexsha, date = peeled_type, peeled_hexsha, peeled_date
+        if object_type == 'commit':
+            name = refname[len('refs/tags/'):]
+            tags[name] = (int(date.split()[0]), hexsha)
+    return tags
+
+
+def _in_order(tags):
+    # (date, name, hexsha) for each of ``tags``, oldest first.
+    return sorted((date, name, hexsha)
+                  for name, (date, hexsha) in tags.items())
+
+
+class TagIndex(object):
+    """
+    The release tag that first contains each commit of a repository.
+
+    Tags are ordered by the date of the commit they point at (then by name),
+    and each commit belongs to the oldest tag whose history contains it: the
+    release it first shipped in.  The whole index comes from a single
+    ``git rev-list --topo-order`` walk over the tags' history, in which each
+    commit hands its tag down to its parents.  It is kept between builds, and
+    when tags are only added, only the history they add is walked.
+    """
+
+    version = 1
+
+    def __init__(self, path):
+        self.path = path
+        # {name: (date, hexsha)} for each tag the index has walked.
+        self.tags = {}
+        self._releases = {}
+        self._dirty = False
+
+    @classmethod
+    def load(cls, path):
+        """Load the index from ``path``, or start an empty one."""
+        index = cls(path)
+        data = load_pickle(path, cls.version)
+        if data is not None:
+            index.tags = data['tags']
+            index._releases = data['releases']
+        return index
+
+    def __len__(self):
+        return len(self._releases)
+
+    def release(self, hexsha):
+        """Return the name of the oldest tag containing ``hexsha``, or
+        ``None`` if it hasn't been released."""
+        return self._releases.get(hexsha)
+
+    def digest(self):
+        """Identify the tags the index was built from."""
+        tags = '\n'.join('{0} {1}'.format(self.tags[name][1], name)
+                         for name in sorted(self.tags))
+        return hashlib.sha1(tags.encode('utf-8')).hexdigest()
+
+    def update(self, directory):
+        """Bring the index up to date with the tags of the repository at
+        ``directory``."""
+        tags = read_tags(directory)
+        if tags == self.tags:
+            return
+        old = self.tags
+        new = _in_order(dict((name, tag) for name, tag in tags.items()
+                             if name not in old))
+        if (any(tags.get(name) != tag for name, tag in old.items()) or
+                (new and old and new[0] < _in_order(old)[-1])):
+            # A tag was moved or removed, or a new one is older than those
+            # already walked, so commits may belong to different releases.
+            old = {}
+            new = _in_order(tags)
+            self._releases = {}
+        if new:
+            self._walk(directory, new, old)
+        self.tags = tags
+        self._dirty = True
+
+    def _walk(self, directory, new, old):
+        # The position in ``new`` of the oldest tag known to contain each
+        # commit still to be visited.  --topo-order visits every commit
+        # after all of its children, so its position is final by then.
+        oldest = {}
+        for position, (_, _, hexsha) in enumerate(new):
+            oldest.setdefault(hexsha, position)
+        # History an older tag contains already has its release.
+        revisions = sorted(oldest) + sorted(set(
+            '^' + hexsha for _, hexsha in old.values()))
+        for record in iter_git_records(
+                directory, ['rev-list', '--topo-order', '--parents',
+                            '--stdin'],
+                stdin_lines=revisions, separator=b'\n'):
+            shas = record.split()
+            position = oldest.pop(shas[0])
+            self._releases[shas[0]] = new[position][1]
+            for parent in shas[1:]:
+                if oldest.get(parent, len(new)) > position:
+                    oldest[parent] = position
+
+    def save(self):
+        """Write the index to its file, if it has one and has changed."""
+        if self.path is None or not self._dirty:
+            return
+        dump_pickle(self.path, {
+            'version': self.version,
+            'tags': self.tags,
+            'releases': self._releases,
+        })
+        self._dirty = False
+
+
+def releases(indexes, commits):
+    """
+    Return the release (the oldest tag containing it) of each of
+    ``commits``, from the first of the ``TagIndex``es ``indexes`` to have
+    one, or ``None`` for commits which haven't been released.
+    """
+    found = []
+    for commit in commits:
+        release = None
+        for index in indexes:
+            release = index.release(commit.hexsha)
+            if release is not None:
+                break
+        found.append(release)
+    return found
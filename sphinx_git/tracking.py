@@ -0,0 +1,175 @@
+# Copyright 2012-2013 (C) Daniel Watkins <daniel@daniel-watkins.co.uk>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import hashlib
+from collections import namedtuple
+
+from .context import get_context
+from .query import ChangelogQuery
+
+
+def _digest(commits):
+    shas = '\n'.join(commit.hexsha for commit in commits)
+    return hashlib.sha1(shas.encode('ascii')).hexdigest()
+
+
+class ChangelogInput(namedtuple('ChangelogInput', ['repo_dir', 'query',
+                                                   'resolved', 'dates',
+                                                   'digest'])):
+    """
+    The git state a git_changelog directive's output depends on.
+
+    ``resolved`` holds the SHAs the query's revisions pointed at, ``dates``
+    its ``since`` and ``until`` as absolute dates, and ``digest`` identifies
+    the commits that were displayed.  When the refs move, or relative dates
+    do, the query is re-run and the document is only considered outdated if
+    it would display different commits (e.g. a new commit that doesn't match
+    ``filename_filter`` leaves it untouched).
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def create(cls, context, repo_dir, query, commits):
+        repo = context.find_repo(repo_dir)
+        return cls(repo_dir, tuple(query), context.resolve(query, repo),
+                   context.dates(query, repo), _digest(commits))
+
+    def is_outdated(self, context):
+        repo = context.find_repo(self.repo_dir)
+        query = ChangelogQuery(*self.query)
+        if (context.resolve(query, repo) == self.resolved and
+                context.dates(query, repo) == self.dates):
+            return False
+        return _digest(context.find_commits(query, repo)) != self.digest
+
+
+class CommitDetailInput(namedtuple('CommitDetailInput', ['repo_dir',
+                                                         'uncommitted',
+                                                         'untracked',
+                                                         'state'])):
+    """The git state a git_commit_detail directive's output depends on."""
+
+    __slots__ = ()
+
+    @classmethod
+    def create(cls, context, repo, uncommitted, untracked):
+        return cls(repo.working_dir, uncommitted, untracked,
+                   cls._state(context, repo, uncommitted, untracked))
+
+    @staticmethod
+    def _state(context, repo, uncommitted, untracked):
+        head = context.backend(repo).head()
+        status = None
+        if uncommitted or untracked:
+            status = context.working_tree_status(repo, untracked)
+        return (head.hexsha, head.branch,
+                uncommitted and status.dirty,
+                untracked and status.untracked)
+
+    def is_outdated(self, context):
+        repo = context.find_repo(self.repo_dir)
+        return self.state != self._state(context, repo, self.uncommitted,
+                                         self.untracked)
+
+
+class LastUpdatedInput(namedtuple('LastUpdatedInput', ['repo_dir', 'path',
+                                                       'hexsha'])):
+    """
+    The git state a git_last_updated directive's output depends on.
+
+    Committing a file leaves it unchanged on disk, so Sphinx itself can't
+    tell that a document showing when it was last committed is outdated.
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def create(cls, repo, path, change):
+        return cls(repo.working_dir, path,
+                   None if change is None else change.hexsha)
+
+    def is_outdated(self, context):
+        repo = context.find_repo(self.repo_dir)
+        change = context.last_changes(repo).get(self.path)
+        return (None if change is None else change.hexsha) != self.hexsha
+
+
+class TagsInput(namedtuple('TagsInput', ['repo_dir', 'digest'])):
+    """
+    The tags a git_changelog grouped by release depends on.
+
+    A new tag moves commits out of "Unreleased" without changing the commits
+    displayed, so the tags are tracked separately.
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def create(cls, context, repo):
+        return cls(repo.working_dir, context.tag_index(repo).digest())
+
+    def is_outdated(self, context):
+        repo = context.find_repo(self.repo_dir)
+        return context.tag_index(repo).digest() != self.digest
+
+
+def note_input(env, git_input):
+    """Record that the document being read depends on ``git_input``."""
+    env.sphinx_git_inputs.setdefault(env.docname, set()).add(git_input)
+
+
+def _is_outdated(git_input, context, checked):
+    from git.exc import GitError  # pylint: disable=import-outside-toplevel
+    if git_input not in checked:
+        try:
+            checked[git_input] = git_input.is_outdated(context)
+        except (GitError, ValueError):
+            # The repository or revisions have gone away; re-reading the
+            # document will report the problem.
+            checked[git_input] = True
+    return checked[git_input]
+
+
+def builder_inited(app):
+    if not hasattr(app.env, 'sphinx_git_inputs'):
+        app.env.sphinx_git_inputs = {}
+
+
+def env_get_outdated(app, env, added, changed, removed):
+    # pylint: disable=unused-argument
+    context = get_context(env)
+    if not context.settings.track_changes:
+        return []
+    checked = {}
+    outdated = []
+    for docname, inputs in env.sphinx_git_inputs.items():
+        if docname in added or docname in changed or docname in removed:
+            continue
+        if any(_is_outdated(git_input, context, checked)
+               for git_input in inputs):
+            outdated.append(docname)
+    return outdated
+
+
+def env_purge_doc(app, env, docname):  # pylint: disable=unused-argument
+    env.sphinx_git_inputs.pop(docname, None)
+
+
+def env_merge_info(app, env, docnames, other):
+    # pylint: disable=unused-argument
+    for docname in docnames:
+        if docname in other.sphinx_git_inputs:
+            env.sphinx_git_inputs[docname] = other.sphinx_git_inputs[docname]
@@ -1,9 +1,42 @@
+import os
 from shutil import rmtree
 from tempfile import mkdtemp
 
+from git import Repo
 from mock import Mock
 
 
+def init_repo(path, user_name='Test User'):
+    """
+    Create a repository at ``path``, with an identity to commit as.
+
+    Returns the ``git.Repo``.
+    """
+    repo = Repo.init(path)
+    config_writer = repo.config_writer()
+    config_writer.set_value('user', 'name', user_name)
+    config_writer.set_value('user', 'email', 'test@example.com')
+    config_writer.release()
+    return repo
+
+
+def commit_files(repo, file_names, message=None):
+    """
+    Append a line to each of ``file_names`` in ``repo``'s working tree, and
+    commit them together.
+
+    The message defaults to the first file's name.  Returns the commit.
+    """
+    for file_name in file_names:
+        full_path = os.path.join(repo.working_tree_dir, file_name)
+        if not os.path.isdir(os.path.dirname(full_path)):
+            os.makedirs(os.path.dirname(full_path))
+        with open(full_path, 'a') as f:
+            f.write('change\n')
+        repo.index.add([full_path])
+    return repo.index.commit(message or file_names[0])
+
+
 class TempDirTestCase(object):
     def setup(self):
         self.root = mkdtemp()
@@ -12,6 +45,18 @@ class TempDirTestCase(object):
         rmtree(self.root)
 
 
+class RepoTestCase(TempDirTestCase):
+    """A ``TempDirTestCase`` with a repository, ``self.repo``, at its root."""
+
+    def setup(self):
+        super(RepoTestCase, self).setup()
+        self.repo = init_repo(self.root)
+
+    def teardown(self):
+        self.repo.close()
+        super(RepoTestCase, self).teardown()
+
+
 class MakeTestableMixin(object):
     """
     Define an __init__ with no arguments for sphinx directives.
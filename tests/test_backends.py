@@ -0,0 +1,344 @@
+# -*- coding: utf-8 -*-
+import os
+
+from git.exc import GitCommandError
+from mock import Mock, call, patch
+from nose.tools import (
+    assert_equal,
+    assert_false,
+    assert_is,
+    assert_is_none,
+    assert_raises,
+    assert_true,
+)
+from sphinx.cmd.build import build_main
+from sphinx.errors import ConfigError
+
+from sphinx_git import backends, stats
+from sphinx_git.backends import GitBackend, HeadInfo
+from sphinx_git.commits import iter_commit_records
+from sphinx_git.config import BACKENDS
+from sphinx_git.context import BuildContext
+from sphinx_git.filters import pathspecs_for
+from sphinx_git.pygit2backend import Pygit2Backend, _Pathspecs
+from sphinx_git.query import WalkOptions
+
+from . import RepoTestCase, TempDirTestCase, commit_files
+
+
+class TestBackendsAgree(RepoTestCase):
+    """Every backend must give the same answers as the GitPython one."""
+
+    def setup(self):
+        super(TestBackendsAgree, self).setup()
+        self.root_commit = commit_files(self.repo, ['docs/index.rst'])
+        master = self.repo.active_branch
+        side = self.repo.create_head('side', self.root_commit)
+        side.checkout()
+        commit_files(self.repo, ['docs/side.rst'])
+        master.checkout()
+        commit_files(self.repo, ['setup.py'])
+        self.repo.git.merge('side', '--no-edit', '-m', 'merge side')
+        self.repo.git.mv('setup.py', 'docs/setup.py')
+        self.repo.index.commit('rename')
+        self.repo.create_tag('v1', message='Release 1')
+        self.repo.create_tag('light', 'HEAD~1')
+        # The pygit2 backend is checked too, where pygit2 is installed.
+        self.backends = [backend_class(self.repo)
+                         for backend_class in BACKENDS.values()
+                         if backend_class.available()]
+
+    def teardown(self):
+        for backend in self.backends:
+            backend.close()
+        super(TestBackendsAgree, self).teardown()
+
+    def _answers(self, method, *args, **kwargs):
+        answers = []
+        for backend in self.backends:
+            result = getattr(backend, method)(*args, **kwargs)
+            if result is not None and not isinstance(result, (str, tuple)):
+                result = list(result)
+            answers.append(result)
+        for answer in answers[1:]:
+            assert_equal(answers[0], answer)
+        return answers[0]
+
+    def test_log(self):
+        assert_equal(5, len(self._answers('log', 'HEAD')))
+        assert_equal(2, len(self._answers(
+            'log', 'HEAD', WalkOptions(max_count=2))))
+        assert_equal(3, len(self._answers('log', 'side..HEAD')))
+        after = '@{0}'.format(self.repo.head.commit.committed_date + 1)
+        assert_equal(0, len(self._answers(
+            'log', 'HEAD', WalkOptions(since=after))))
+
+    def test_log_of_resolved_range(self):
+        assert_equal(self._answers('log', 'side..HEAD'),
+                     self._answers('log', tuple(self._answers(
+                         'rev_parse', 'side..HEAD'))))
+
+    def test_log_matches_command_line(self):
+        assert_equal(list(iter_commit_records(self.root, ['HEAD', '--'])),
+                     self._answers('log', 'HEAD'))
+
+    def test_log_with_pathspecs(self):
+        # As with --full-history, the merge differs from its first parent.
+        assert_equal(['merge side', 'docs/side.rst', 'docs/index.rst'],
+                     [record.message.strip() for record in self._answers(
+                         'log', 'HEAD',
+                         WalkOptions(pathspecs=['docs/*.rst']))])
+
+    def _messages(self, rev_list, **kwargs):
+        return [record.message.strip() for record in self._answers(
+            'log', rev_list, WalkOptions(**kwargs))]
+
+    def test_log_first_parent(self):
+        assert_equal(['rename', 'merge side', 'setup.py', 'docs/index.rst'],
+                     self._messages('HEAD', first_parent=True))
+        assert_equal(['rename', 'merge side', 'setup.py'],
+                     self._messages('side..HEAD', first_parent=True))
+        # The merge brought docs/side.rst in, compared with its first parent.
+        assert_equal(['merge side', 'docs/index.rst'],
+                     self._messages('HEAD', first_parent=True,
+                                    pathspecs=['docs/*.rst']))
+
+    def test_log_merges_only(self):
+        assert_equal(['merge side'], self._messages('HEAD', merges_only=True))
+        assert_equal(['merge side'],
+                     self._messages('HEAD', max_count=1, merges_only=True,
+                                    first_parent=True))
+        assert_equal([], self._messages('HEAD', merges_only=True,
+                                        pathspecs=['docs/setup.py']))
+
+    def test_changed_paths(self):
+        commits = self._answers('log', 'HEAD')
+        assert_equal([
+            (commits[0].hexsha, ['docs/setup.py', 'setup.py']),
+            (commits[1].hexsha, ['docs/side.rst']),
+            (commits[2].hexsha, ['setup.py']),
+            (commits[3].hexsha, ['docs/side.rst']),
+            (commits[4].hexsha, ['docs/index.rst']),
+        ], self._answers('changed_paths', commits))
+
+    def test_changed_paths_with_pathspecs(self):
+        commits = self._answers('log', 'HEAD')
+        assert_equal([(commits[0].hexsha, []),
+                      (commits[1].hexsha, ['docs/side.rst']),
+                      (commits[2].hexsha, []),
+                      (commits[3].hexsha, ['docs/side.rst']),
+                      (commits[4].hexsha, [])],
+                     self._answers('changed_paths', commits,
+                                   ['docs/side.rst']))
+
+    def test_rev_parse(self):
+        for rev_list in ['HEAD', 'v1', 'light', 'side..master', '^side',
+                         'master~1', 'master~1^2', 'side...master']:
+            assert_equal(self.repo.git.rev_parse(rev_list).split(),
+                         list(self._answers('rev_parse', rev_list)))
+
+    def test_rev_parse_failures(self):
+        for backend in self.backends:
+            for rev_list in ['nonexistent', 'HEAD..nonexistent', 'HEAD\nv1']:
+                assert_raises(GitCommandError, backend.rev_parse, rev_list)
+
+    def test_status(self):
+        assert_equal((False, False), tuple(self._answers('status', True)))
+        with open(os.path.join(self.root, 'untracked'), 'w') as f:
+            f.write('new\n')
+        assert_equal((False, True), tuple(self._answers('status', True)))
+        with open(os.path.join(self.root, 'docs', 'index.rst'), 'w') as f:
+            f.write('edited\n')
+        assert_equal((True, None), tuple(self._answers('status', False)))
+
+    def test_untracked_files_only_listed_if_asked_for(self):
+        for backend in self.backends:
+            if not isinstance(backend, Pygit2Backend):
+                continue
+            with patch.object(backend, 'git_repo') as git_repo:
+                git_repo.status.return_value = {}
+                backend.status(False)
+                backend.status(True)
+            assert_equal([call(untracked_files='no'),
+                          call(untracked_files='normal')],
+                         git_repo.status.call_args_list)
+
+    def test_head(self):
+        hexsha = self.repo.head.commit.hexsha
+        assert_equal(HeadInfo(hexsha, 'master'), self._answers('head'))
+        self.repo.git.checkout(hexsha)
+        assert_equal(HeadInfo(hexsha, None), self._answers('head'))
+
+    def test_remote_url(self):
+        assert_is_none(self._answers('remote_url', 'origin'))
+        self.repo.create_remote('origin', 'https://github.com/o/r.git')
+        assert_equal('https://github.com/o/r.git',
+                     self._answers('remote_url', 'origin'))
+
+
+class TestGitBackendRevParse(RepoTestCase):
+
+    def setup(self):
+        super(TestGitBackendRevParse, self).setup()
+        self.repo.index.commit('first')
+        self.backend = GitBackend(self.repo)
+
+    def teardown(self):
+        self.backend.close()
+        super(TestGitBackendRevParse, self).teardown()
+
+    def test_revisions_share_one_process(self):
+        for _ in range(3):
+            self.backend.rev_parse('HEAD')
+        process = self.backend._batch_check._proc
+        self.backend.rev_parse('master')
+        assert_equal(process, self.backend._batch_check._proc)
+
+    def test_head_not_read_through_gitpython(self):
+        # GitPython's object database isn't safe to share between threads.
+        with patch.object(self.repo, 'odb') as odb:
+            assert_equal(HeadInfo(self.repo.git.rev_parse('HEAD'), 'master'),
+                         self.backend.head())
+        assert_equal([], odb.mock_calls)
+
+    def test_head_of_unborn_branch(self):
+        self.repo.git.checkout('--orphan', 'unborn')
+        assert_raises(ValueError, self.backend.head)
+
+
+class TestPathspecMatcher(object):
+
+    def test_directory(self):
+        matches = _Pathspecs(['docs']).matches
+        assert_true(matches('docs'))
+        assert_true(matches('docs/sub/index.rst'))
+        assert_false(matches('docs2/index.rst'))
+
+    def test_literal(self):
+        matches = _Pathspecs([':(literal)d*cs']).matches
+        assert_true(matches('d*cs/index.rst'))
+        assert_false(matches('docs/index.rst'))
+
+    def test_plain_wildcards_cross_directories(self):
+        matches = _Pathspecs(['docs/*.rst']).matches
+        assert_true(matches('docs/sub/index.rst'))
+        assert_false(matches('docs/conf.py'))
+
+    def test_glob_prefix(self):
+        matches = _Pathspecs(pathspecs_for('ab[c]')).matches
+        for path in ['ab', 'abc.txt', 'abd/file', 'ab/deep/file']:
+            assert_true(matches(path))
+        for path in ['a', 'sub/ab', 'xab']:
+            assert_false(matches(path))
+
+    def test_escaped_glob_characters(self):
+        matches = _Pathspecs(pathspecs_for(r'a\*b')).matches
+        assert_true(matches('a*b.txt'))
+        assert_false(matches('axb.txt'))
+
+
+class TestBackendConfig(object):
+
+    def _app(self, **config):
+        values = dict(sphinx_git_cache=False, sphinx_git_timing=False,
+                      sphinx_git_timing_json=None, sphinx_git_path_index=False,
+                      sphinx_git_backend='git', sphinx_git_diff_jobs=1)
+        values.update(config)
+        return Mock(config=Mock(**values))
+
+    def test_unavailable_backend_replaced(self):
+        with patch.object(Pygit2Backend, 'available', return_value=False):
+            context = BuildContext.from_app(
+                self._app(sphinx_git_backend='pygit2'))
+        assert_is(GitBackend, context.settings.backend_class)
+
+    def test_available_backend_used(self):
+        with patch.object(Pygit2Backend, 'available', return_value=True):
+            context = BuildContext.from_app(
+                self._app(sphinx_git_backend='pygit2'))
+        assert_is(Pygit2Backend, context.settings.backend_class)
+
+    def test_diff_jobs(self):
+        assert_equal(3, BuildContext.from_app(
+            self._app(sphinx_git_diff_jobs=3)).settings.diff_jobs)
+        with patch('multiprocessing.cpu_count', return_value=6):
+            assert_equal(6, BuildContext.from_app(
+                self._app(sphinx_git_diff_jobs='auto')).settings.diff_jobs)
+        assert_equal(4, BuildContext.from_app(
+            self._app(sphinx_git_diff_jobs='4')).settings.diff_jobs)
+        assert_equal(5, BuildContext.from_app(
+            self._app(sphinx_git_diff_jobs=u'5')).settings.diff_jobs)
+        for value in [0, 'many']:
+            assert_raises(ConfigError, BuildContext.from_app,
+                          self._app(sphinx_git_diff_jobs=value))
+
+
+class TestDiffJobsConfigValue(TempDirTestCase):
+
+    def _warnings(self, conf='', overrides=()):
+        with open(os.path.join(self.root, 'conf.py'), 'w') as conf_file:
+            conf_file.write("extensions = ['sphinx_git']\n"
+                            "master_doc = 'index'\n" + conf)
+        with open(os.path.join(self.root, 'index.rst'), 'w') as index:
+            index.write('Title\n=====\n\nNo git here.\n')
+        warnings = os.path.join(self.root, 'warnings.txt')
+        args = ['-q', '-b', 'dummy', '-w', warnings]
+        for override in overrides:
+            args.extend(['-D', override])
+        assert_equal(0, build_main(
+            args + [self.root, os.path.join(self.root, '_build')]))
+        with open(warnings) as warnings_file:
+            return warnings_file.read()
+
+    def test_auto_in_conf(self):
+        assert_equal('', self._warnings("sphinx_git_diff_jobs = 'auto'\n"))
+
+    def test_number_in_conf(self):
+        assert_equal('', self._warnings('sphinx_git_diff_jobs = 2\n'))
+
+    def test_overrides(self):
+        for value in ['auto', '2']:
+            assert_equal('', self._warnings(
+                overrides=['sphinx_git_diff_jobs=' + value]))
+
+
+class TestParallelDiffs(RepoTestCase):
+
+    def setup(self):
+        super(TestParallelDiffs, self).setup()
+        for number in range(10):
+            file_name = os.path.join(self.root, 'file{0}'.format(number % 3))
+            with open(file_name, 'a') as f:
+                f.write('change\n')
+            self.repo.index.add([file_name])
+            self.repo.index.commit('commit {0}'.format(number))
+        self.commits = list(iter_commit_records(self.root, ['HEAD']))
+        self.backends = []
+
+    def teardown(self):
+        for backend in self.backends:
+            backend.close()
+        super(TestParallelDiffs, self).teardown()
+
+    def _changed_paths(self, diff_jobs, commits, pathspecs=None):
+        backend = GitBackend(self.repo, diff_jobs=diff_jobs)
+        self.backends.append(backend)
+        timing = stats.DirectiveTiming.create('GitChangelog', 'index', 1)
+        with patch.object(backends, 'MIN_DIFF_CHUNK', 2):
+            with stats.activate(timing):
+                changed = list(backend.changed_paths(commits, pathspecs))
+        return changed, timing.counts['processes']
+
+    def test_same_result_as_serial(self):
+        serial, processes = self._changed_paths(1, self.commits)
+        assert_equal(1, processes)
+        for pathspecs in [None, ['file1']]:
+            assert_equal(self._changed_paths(1, self.commits, pathspecs)[0],
+                         self._changed_paths(4, self.commits, pathspecs)[0])
+        assert_equal([commit.hexsha for commit in self.commits],
+                     [hexsha for hexsha, _ in serial])
+
+    def test_one_process_per_chunk(self):
+        assert_equal(4, self._changed_paths(4, self.commits)[1])
+        # Chunks are never smaller than MIN_DIFF_CHUNK commits.
+        assert_equal(2, self._changed_paths(4, self.commits[:5])[1])
@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+import os
+import pickle
+import stat
+
+from mock import patch
+from nose.tools import (
+    assert_equal,
+    assert_in,
+    assert_is_none,
+    assert_not_in,
+    assert_raises,
+)
+
+from sphinx_git import cache as cache_module
+from sphinx_git.cache import ChangelogCache, dump_pickle, load_pickle
+from sphinx_git.commits import CommitList, CommitRecord
+
+from . import TempDirTestCase
+
+
+def make_commits(count, prefix='commit'):
+    return [CommitRecord('{0}{1}'.format(prefix, n), (), u'Test User', n, n,
+                         u'message {0}'.format(n))
+            for n in range(count)]
+
+
+class TestChangelogCache(TempDirTestCase):
+
+    def setup(self):
+        super(TestChangelogCache, self).setup()
+        self.path = os.path.join(self.root, 'doctrees', 'sphinx_git.cache')
+
+    def test_missing_entry(self):
+        cache = ChangelogCache(self.path, 10)
+        assert_is_none(cache.get('key'))
+
+    def test_put_and_get(self):
+        cache = ChangelogCache(self.path, 10)
+        commits = make_commits(3)
+        cache.put('key', commits)
+        assert_equal(commits, cache.get('key'))
+
+    def test_evicts_least_recently_used(self):
+        cache = ChangelogCache(self.path, 5)
+        cache.put('first', make_commits(2))
+        cache.put('second', make_commits(2))
+        cache.get('first')
+        cache.put('third', make_commits(2))
+        assert_in('first', cache)
+        assert_not_in('second', cache)
+        assert_in('third', cache)
+
+    def test_replacing_entry_does_not_leak_size(self):
+        cache = ChangelogCache(self.path, 4)
+        for _ in range(3):
+            cache.put('key', make_commits(4))
+        cache.put('other', make_commits(0))
+        assert_equal(2, len(cache))
+
+    def test_oversized_entry_not_stored(self):
+        cache = ChangelogCache(self.path, 10)
+        cache.put('first', make_commits(3))
+        cache.put('second', make_commits(3))
+        cache.put('second', make_commits(11))
+        assert_in('first', cache)
+        assert_not_in('second', cache)
+        cache.put('third', make_commits(7))
+        assert_equal(2, len(cache))
+
+    def test_round_trip(self):
+        cache = ChangelogCache(self.path, 10)
+        commits = make_commits(3)
+        cache.put(('repo', ('abc',), 10, None), commits)
+        cache.save()
+
+        loaded = ChangelogCache.load(self.path, 10)
+        assert_equal(commits, loaded.get(('repo', ('abc',), 10, None)))
+        assert isinstance(loaded.get(('repo', ('abc',), 10, None))[0],
+                          CommitRecord)
+
+    def test_truncation_round_trip(self):
+        cache = ChangelogCache(self.path, 10)
+        cache.put('key', CommitList(make_commits(2), 'max-scan'))
+        cache.save()
+        loaded = ChangelogCache.load(self.path, 10)
+        assert_equal('max-scan', loaded.get('key').truncated)
+
+    def test_load_applies_size_bound(self):
+        cache = ChangelogCache(self.path, 10)
+        cache.put('first', make_commits(4))
+        cache.put('second', make_commits(4))
+        cache.save()
+        loaded = ChangelogCache.load(self.path, 5)
+        assert_equal(['second'], [key for key in ['first', 'second']
+                                  if key in loaded])
+
+    def test_load_missing_file(self):
+        assert_equal(0, len(ChangelogCache.load(self.path, 10)))
+
+    def test_load_corrupt_file(self):
+        os.makedirs(os.path.dirname(self.path))
+        with open(self.path, 'wb') as cache_file:
+            cache_file.write(b'not a pickle')
+        assert_equal(0, len(ChangelogCache.load(self.path, 10)))
+
+    def test_load_unpicklable_file(self):
+        os.makedirs(os.path.dirname(self.path))
+        with open(self.path, 'wb') as cache_file:
+            cache_file.write(b'data')
+        for error in [KeyError('n'), IndexError(), AttributeError(),
+                      ImportError()]:
+            with patch.object(cache_module.pickle, 'load',
+                              side_effect=error):
+                assert_equal(0, len(ChangelogCache.load(self.path, 10)))
+
+    def test_load_other_version(self):
+        os.makedirs(os.path.dirname(self.path))
+        with open(self.path, 'wb') as cache_file:
+            pickle.dump({'version': -1, 'entries': [('key', [])]}, cache_file)
+        assert_equal(0, len(ChangelogCache.load(self.path, 10)))
+
+
+class TestDumpPickle(TempDirTestCase):
+
+    def setup(self):
+        super(TestDumpPickle, self).setup()
+        self.path = os.path.join(self.root, 'data')
+
+    def test_replaces_existing_file(self):
+        dump_pickle(self.path, {'version': 1})
+        dump_pickle(self.path, {'version': 2})
+        assert_equal({'version': 2}, load_pickle(self.path, 2))
+        assert_equal(['data'], os.listdir(self.root))
+
+    def test_mode_follows_umask(self):
+        umask = os.umask(0o022)
+        try:
+            dump_pickle(self.path, {'version': 1})
+        finally:
+            os.umask(umask)
+        if os.name != 'nt':
+            assert_equal(0o644, stat.S_IMODE(os.stat(self.path).st_mode))
+
+    def test_replaces_existing_file_without_os_replace(self):
+        dump_pickle(self.path, {'version': 1})
+        with patch.object(cache_module.os, 'replace', None, create=True):
+            dump_pickle(self.path, {'version': 2})
+        assert_equal({'version': 2}, load_pickle(self.path, 2))
+
+    def test_temporary_file_removed_on_failure(self):
+        dump_pickle(self.path, {'version': 1})
+        assert_raises(Exception, dump_pickle, self.path,
+                      {'version': 2, 'data': lambda: None})
+        assert_equal({'version': 1}, load_pickle(self.path, 1))
+        assert_equal(['data'], os.listdir(self.root))
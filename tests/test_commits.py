@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+import os
+
+from mock import patch
+from nose.tools import assert_equal, assert_raises
+
+from sphinx_git import commits
+from sphinx_git.commits import CommitRecord, iter_commit_records
+
+from . import TempDirTestCase, init_repo
+
+
+class TestIterCommitRecords(TempDirTestCase):
+
+    def setup(self):
+        super(TestIterCommitRecords, self).setup()
+        self.repo = init_repo(self.root, u'þéßþ  Úßéë')
+
+    def test_matches_gitpython(self):
+        self.repo.index.commit('root')
+        self.repo.index.commit('second\n\nwith\x01details\n')
+        records = list(iter_commit_records(self.root, ['HEAD']))
+        assert_equal(2, len(records))
+        for record, commit in zip(records, self.repo.iter_commits()):
+            assert_equal(commit.hexsha, record.hexsha)
+            assert_equal(tuple(parent.hexsha for parent in commit.parents),
+                         record.parents)
+            assert_equal(commit.author.name, record.author)
+            assert_equal(commit.authored_date, record.authored_date)
+            assert_equal(commit.committed_date, record.committed_date)
+            assert_equal(commit.message.rstrip('\n'),
+                         record.message.rstrip('\n'))
+
+    def test_records_are_tuples(self):
+        self.repo.index.commit('root')
+        record = next(iter_commit_records(self.root, ['HEAD']))
+        assert isinstance(record, CommitRecord)
+        assert isinstance(record, tuple)
+
+    def test_stopping_early(self):
+        for n in range(5):
+            self.repo.index.commit('commit #{0}'.format(n))
+        records = iter_commit_records(self.root, ['HEAD'])
+        assert_equal('commit #4', next(records).message.strip())
+        records.close()
+
+    def test_log_follow_setting_ignored(self):
+        config_writer = self.repo.config_writer()
+        config_writer.set_value('log', 'follow', 'true')
+        config_writer.release()
+        with open(os.path.join(self.root, 'old'), 'w') as f:
+            f.write('content\n' * 10)
+        self.repo.index.add(['old'])
+        self.repo.index.commit('add')
+        self.repo.git.mv('old', 'new')
+        self.repo.index.commit('rename')
+        records = iter_commit_records(self.root,
+                                      ['HEAD', '--full-history', '--', 'new'])
+        assert_equal(['rename'],
+                     [record.message.strip() for record in records])
+
+    def test_malformed_record(self):
+        hexsha = self.repo.index.commit('root').hexsha
+        # A stray NUL splits the message, shifting the next commit's fields.
+        fields = [hexsha, '', 'author', '1', '2', 'one', 'two',
+                  hexsha, '', 'author', '1', '2', 'message']
+        with patch.object(commits, 'iter_git_records',
+                          return_value=iter(fields)):
+            records = iter_commit_records(self.root, ['HEAD'])
+            assert_equal(hexsha, next(records).hexsha)
+            assert_raises(ValueError, next, records)
+
+    def test_incomplete_record(self):
+        with patch.object(commits, 'iter_git_records',
+                          return_value=iter(['a' * 40, ''])):
+            assert_raises(ValueError, list,
+                          iter_commit_records(self.root, ['HEAD']))
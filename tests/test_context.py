@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+import os
+
+from git import InvalidGitRepositoryError, Repo
+from mock import Mock, patch
+from nose.tools import (
+    assert_equal,
+    assert_in,
+    assert_is,
+    assert_is_not,
+    assert_raises,
+)
+
+from sphinx_git import context as context_module
+from sphinx_git.config import BuildSettings
+from sphinx_git.context import (
+    BuildContext,
+    env_merge_info,
+    get_context,
+    set_context,
+)
+from sphinx_git.query import ChangelogQuery
+
+from . import TempDirTestCase, init_repo
+
+
+class TestGetContext(object):
+
+    def test_outside_a_build(self):
+        env = Mock()
+        assert_is_not(get_context(env), get_context(env))
+
+    def test_registered_context(self):
+        env = Mock()
+        context = BuildContext()
+        set_context(env, context)
+        assert_is(context, get_context(env))
+
+
+class TestQueryMemo(TempDirTestCase):
+
+    def setup(self):
+        super(TestQueryMemo, self).setup()
+        repo = init_repo(self.root)
+        repo.index.commit('first')
+        repo.create_tag('v1')
+        repo.close()
+
+    def _load_count(self, context, queries):
+        repo = context.find_repo(self.root)
+        with patch.object(ChangelogQuery, 'load', return_value=[]) as load:
+            for query in queries:
+                context.find_commits(query, repo)
+        context.close()
+        return load.call_count
+
+    def _cached(self):
+        return BuildSettings(doctreedir=os.path.join(self.root, 'doctrees'),
+                             cache=True, cache_size=100)
+
+    def test_identical_queries_loaded_once(self):
+        query = ChangelogQuery.from_options({'filename_filter': 'docs/'})
+        assert_equal(1, self._load_count(BuildContext(), [query, query]))
+
+    def test_identical_queries_loaded_once_with_cache(self):
+        query = ChangelogQuery.from_options({'rev-list': 'v1'})
+        assert_equal(1, self._load_count(BuildContext(self._cached()),
+                                         [query, query]))
+
+    def test_different_queries_loaded_separately(self):
+        assert_equal(2, self._load_count(BuildContext(), [
+            ChangelogQuery.from_options({}),
+            ChangelogQuery.from_options({'revisions': 3}),
+        ]))
+
+    def test_not_shared_between_builds(self):
+        query = ChangelogQuery.from_options({})
+        assert_equal(1, self._load_count(BuildContext(), [query]))
+        assert_equal(1, self._load_count(BuildContext(), [query]))
+
+    def test_dates_made_absolute(self):
+        context = BuildContext()
+        query = ChangelogQuery.from_options({'since': '@1577836800',
+                                             'until': '1 day ago'})
+        since, until = context.dates(query, context.find_repo(self.root))
+        context.close()
+        assert_equal('@1577836800', since)
+        assert_equal('@', until[0])
+
+    def test_cached_under_absolute_dates(self):
+        query = ChangelogQuery.from_options({'rev-list': 'v1',
+                                             'since': '1 week ago'})
+        counts = []
+        for now in ['@100', '@200', '@200']:
+            with patch.object(context_module, 'absolute_dates',
+                              return_value=(now, None)):
+                counts.append(self._load_count(
+                    BuildContext(self._cached()), [query]))
+        assert_equal([1, 1, 0], counts)
+
+
+class TestRepositoryPool(TempDirTestCase):
+
+    def setup(self):
+        super(TestRepositoryPool, self).setup()
+        Repo.init(self.root).close()
+        os.makedirs(os.path.join(self.root, 'docs', 'api'))
+        self.context = BuildContext()
+
+    def teardown(self):
+        self.context.close()
+        super(TestRepositoryPool, self).teardown()
+
+    def test_same_path_shares_repo(self):
+        repo = self.context.find_repo(self.root)
+        assert_is(repo, self.context.find_repo(self.root))
+
+    def test_subdirectories_share_repo(self):
+        repo = self.context.find_repo(os.path.join(self.root, 'docs'))
+        assert_is(repo, self.context.find_repo(
+            os.path.join(self.root, 'docs', 'api')))
+        assert_equal(1, len(self.context._repos.handles))
+
+    def test_separate_repositories(self):
+        other = os.path.join(self.root, 'other')
+        Repo.init(other).close()
+        assert_is_not(self.context.find_repo(self.root),
+                      self.context.find_repo(other))
+
+    def test_not_a_repository(self):
+        assert_raises(InvalidGitRepositoryError, self.context.find_repo,
+                      os.path.dirname(self.root))
+
+    def test_close_empties_pool(self):
+        self.context.find_repo(self.root)
+        self.context.close()
+        assert_equal({}, self.context._repos.handles)
+
+
+class TestParallelReading(TempDirTestCase):
+
+    def setup(self):
+        super(TestParallelReading, self).setup()
+        Repo.init(self.root).close()
+        self.env = Mock()
+        self.settings = BuildSettings(
+            doctreedir=os.path.join(self.root, 'doctrees'), cache=True,
+            cache_size=100)
+        self.context = BuildContext(self.settings)
+        set_context(self.env, self.context)
+
+    def teardown(self):
+        self.context.close()
+        super(TestParallelReading, self).teardown()
+
+    def test_worker_gets_own_repositories(self):
+        parent_repo = self.context.find_repo(self.root)
+        with patch('os.getpid', return_value=self.context.pid + 1):
+            worker = get_context(self.env)
+            assert_is(worker, get_context(self.env))
+            worker_repo = worker.find_repo(self.root)
+        assert_is_not(self.context, worker)
+        assert_is_not(parent_repo, worker_repo)
+        assert_is(self.context.changelog_cache(), worker.changelog_cache())
+
+    def test_worker_cache_updates_merged(self):
+        with patch('os.getpid', return_value=self.context.pid + 1):
+            worker = get_context(self.env)
+        worker._cache_commits('key', [])
+        other_env = Mock(
+            sphinx_git_cache_updates=worker.indexes.changelog_updates)
+        parent_env = Mock()
+        parent = BuildContext(self.settings)
+        set_context(parent_env, parent)
+        env_merge_info(Mock(), parent_env, [], other_env)
+        assert_in('key', parent.changelog_cache())
+
+
+class TestCommitGraph(TempDirTestCase):
+
+    def setup(self):
+        super(TestCommitGraph, self).setup()
+        repo = init_repo(self.root)
+        repo.index.commit('root')
+        repo.close()
+        self.graphs = os.path.join(self.root, '.git', 'objects', 'info',
+                                   'commit-graphs')
+
+    def test_disabled_by_default(self):
+        context = BuildContext()
+        context.find_repo(self.root)
+        context.close()
+        assert not os.path.exists(self.graphs)
+
+    def test_written_when_repository_opened(self):
+        context = BuildContext(BuildSettings(commit_graph=True))
+        context.find_repo(self.root)
+        context.close()
+        assert_in('commit-graph-chain', os.listdir(self.graphs))
+
+    def test_worker_does_not_write(self):
+        context = BuildContext(BuildSettings(commit_graph=True))
+        worker = context.for_worker(Mock())
+        worker.find_repo(self.root)
+        worker.close()
+        assert not os.path.exists(self.graphs)
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+import os
+import pickle
+
+from docutils import nodes
+from mock import Mock, patch
+from nose.tools import assert_equal, assert_is_instance
+
+from sphinx_git import GitChangelog
+from sphinx_git.config import BuildSettings
+from sphinx_git.context import BuildContext, set_context
+from sphinx_git.deferred import (
+    _findall,
+    changelog_placeholder,
+    doctree_resolved,
+)
+from sphinx_git.query import ChangelogQuery
+
+from . import MakeTestableMixin, RepoTestCase, init_repo
+
+
+class DeferredGitChangelog(MakeTestableMixin, GitChangelog):
+
+    pass
+
+
+class TestDeferredChangelog(RepoTestCase):
+
+    def setup(self):
+        super(TestDeferredChangelog, self).setup()
+        for message in ['first', 'second\n\nDetails.', 'third']:
+            self.repo.index.commit(message)
+        self.env = Mock(srcdir=self.root)
+        self.settings = BuildSettings(
+            doctreedir=os.path.join(self.root, 'doctrees'), cache=True,
+            cache_size=100)
+        self._new_build()
+
+    def teardown(self):
+        self.context.close()
+        super(TestDeferredChangelog, self).teardown()
+
+    def _new_build(self):
+        self.context = BuildContext(self.settings)
+        set_context(self.env, self.context)
+
+    def _run(self, options):
+        changelog = DeferredGitChangelog()
+        changelog.state.document.settings.env = self.env
+        changelog.options.update(options)
+        return changelog.run()
+
+    def _resolve(self, markup):
+        document = nodes.section()
+        document.extend(markup)
+        doctree_resolved(Mock(env=self.env), document, 'index')
+        return document
+
+    def test_placeholder_holds_query(self):
+        markup = self._run({'deferred': None, 'revisions': 2,
+                            'hide_author': True})
+        assert_equal(1, len(markup))
+        node = markup[0]
+        assert_is_instance(node, changelog_placeholder)
+        assert_equal(ChangelogQuery.from_options({'revisions': 2}),
+                     node['query'])
+        assert_equal([(self.repo.working_tree_dir,
+                       (self.repo.head.commit.hexsha,))], node['sources'])
+        assert_equal({'hide_author': True}, node['options'])
+        assert_equal(0, len(node.children))
+
+    def test_expanded_like_immediate_output(self):
+        options = {'revisions': 2, 'hide_date': True}
+        expected = nodes.section()
+        expected.extend(self._run(options))
+        options['deferred'] = None
+        resolved = self._resolve(self._run(options))
+        assert_equal(expected.pformat(), resolved.pformat())
+
+    def test_expanded_from_cache_in_later_build(self):
+        markup = pickle.loads(pickle.dumps(self._run({'deferred': None})))
+        self.context.close()
+        self.repo.index.commit('fourth')
+        self._new_build()
+        with patch.object(ChangelogQuery, 'load') as load:
+            resolved = self._resolve(markup)
+        assert_equal(0, load.call_count)
+        assert_equal(3, len(_findall(resolved, nodes.list_item)))
+
+    def test_expanded_from_stored_shas_without_cache(self):
+        self.settings = BuildSettings()
+        for options in [{}, {'rev-list': 'HEAD~2..HEAD'}]:
+            self._new_build()
+            expected = nodes.section()
+            expected.extend(self._run(options))
+            options['deferred'] = None
+            markup = self._run(options)
+            self.context.close()
+            self.repo.index.commit('later')
+            self._new_build()
+            assert_equal(expected.pformat(), self._resolve(markup).pformat())
+
+    def test_relative_dates_stored_absolute(self):
+        markup = self._run({'deferred': None, 'since': '1 week ago'})
+        since = ChangelogQuery(*markup[0]['query']).since
+        assert since.startswith('@'), since
+
+    def test_several_repositories(self):
+        other = init_repo(os.path.join(self.root, 'other'))
+        other.index.commit('elsewhere')
+        other.close()
+        options = {'extra-repo-dirs': os.path.join(self.root, 'other')}
+        expected = nodes.section()
+        expected.extend(self._run(options))
+        options['deferred'] = None
+        markup = self._run(options)
+        assert_equal(2, len(markup[0]['sources']))
+        assert_equal(expected.pformat(), self._resolve(markup).pformat())
+        assert_equal(4, len(_findall(expected, nodes.list_item)))
+
+    def test_grouped_by_tag(self):
+        self.repo.create_tag('v1', 'HEAD~1')
+        options = {'group-by-tag': None}
+        expected = nodes.section()
+        expected.extend(self._run(options))
+        options['deferred'] = None
+        resolved = self._resolve(self._run(options))
+        assert_equal(expected.pformat(), resolved.pformat())
+        assert_equal(['Unreleased', 'v1'],
+                     [node.astext()
+                      for node in _findall(expected, nodes.rubric)])
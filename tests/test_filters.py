@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+from nose.tools import assert_equal, assert_is_none
+
+from sphinx_git.backends import GitBackend
+from sphinx_git.commits import iter_commit_records
+from sphinx_git.filters import FilenameFilter, literal_prefix, pathspecs_for
+
+from . import RepoTestCase, commit_files
+
+
+class TestLiteralPrefix(object):
+
+    def test_plain_path(self):
+        assert_equal('docs/index.rst', literal_prefix(r'docs/index\.rst'))
+
+    def test_stops_at_metacharacter(self):
+        assert_equal('doc/', literal_prefix(r'doc/.*\.rst'))
+
+    def test_escaped_characters_are_literal(self):
+        assert_equal('a.b', literal_prefix(r'a\.b[cd]'))
+
+    def test_optional_character_is_dropped(self):
+        assert_equal('doc', literal_prefix('docs?/'))
+        assert_equal('doc', literal_prefix('docs*/'))
+
+    def test_repeated_character_is_kept(self):
+        assert_equal('docs', literal_prefix('docs+/'))
+
+    def test_leading_anchor_is_ignored(self):
+        assert_equal('src', literal_prefix('^src'))
+
+    def test_character_class_escape(self):
+        assert_equal('v', literal_prefix(r'v\d'))
+
+    def test_alternation_has_no_prefix(self):
+        assert_equal('', literal_prefix('docs/|src/'))
+
+    def test_flags_have_no_prefix(self):
+        assert_equal('', literal_prefix('(?i)docs'))
+
+
+class TestPathspecsFor(object):
+
+    def test_no_prefix(self):
+        assert_is_none(pathspecs_for('.*'))
+
+    def test_prefix(self):
+        assert_equal([':(glob)doc*', ':(glob)doc*/**'],
+                     pathspecs_for(r'docs?/.*\.rst'))
+
+    def test_directory_prefix(self):
+        assert_equal(['doc'], pathspecs_for(r'doc/.*\.rst'))
+        assert_equal(['doc/api'], pathspecs_for(r'doc/api/index'))
+
+    def test_directory_with_glob_characters(self):
+        assert_equal([':(literal)a*b'], pathspecs_for(r'a\*b/c'))
+
+    def test_glob_characters_are_escaped(self):
+        assert_equal([r':(glob)a\*b*', r':(glob)a\*b*/**'],
+                     pathspecs_for(r'a\*b'))
+
+
+class TestFilenameFilterSelect(RepoTestCase):
+
+    def setup(self):
+        super(TestFilenameFilterSelect, self).setup()
+
+    def _select(self, pattern):
+        commits = iter_commit_records(self.root, ['--all'])
+        selected = FilenameFilter(pattern).select(GitBackend(self.repo),
+                                                  commits)
+        return [commit.message.strip() for commit in selected]
+
+    def test_root_commit_compared_with_empty_tree(self):
+        commit_files(self.repo, ['docs/index.rst'])
+        commit_files(self.repo, ['setup.py'])
+        assert_equal(['docs/index.rst'], self._select(r'docs/.*\.rst'))
+
+    def test_regex_applied_after_pathspec(self):
+        commit_files(self.repo, ['docs/index.rst'])
+        commit_files(self.repo, ['docs/conf.py'])
+        assert_equal(['docs/index.rst'], self._select(r'docs/.*\.rst'))
+
+    def test_pattern_without_prefix(self):
+        commit_files(self.repo, ['abc.txt'])
+        commit_files(self.repo, ['abc.other'])
+        commit_files(self.repo, ['sub/atxt'])
+        assert_equal(['abc.txt'], self._select('a.*txt'))
+        assert_equal(['sub/atxt', 'abc.txt'], self._select('.*a.*txt'))
+
+    def test_empty_commits_are_not_selected(self):
+        commit_files(self.repo, ['docs/index.rst'])
+        self.repo.index.commit('empty')
+        assert_equal(['docs/index.rst'], self._select('docs'))
+
+    def test_merge_compared_with_first_parent(self):
+        root = commit_files(self.repo, ['base'])
+        master = self.repo.active_branch
+        side = self.repo.create_head('side', root)
+        side.checkout()
+        commit_files(self.repo, ['side.txt'])
+        master.checkout()
+        commit_files(self.repo, ['main.txt'])
+        self.repo.git.merge('side', '--no-edit', '-m', 'merge side')
+        assert_equal(['merge side', 'side.txt'], self._select('side'))
+        assert_equal(['main.txt'], self._select('main'))
@@ -5,7 +5,7 @@ from datetime import datetime
 import six
 from bs4 import BeautifulSoup
 from git import InvalidGitRepositoryError, Repo
-from mock import ANY, call
+from mock import ANY, call, patch
 from nose.tools import (
     assert_equal,
     assert_greater,
@@ -16,8 +16,12 @@ from nose.tools import (
 )
 
 from sphinx_git import GitChangelog
+from sphinx_git.cache import ChangelogCache
+from sphinx_git.config import BuildSettings
+from sphinx_git.context import BuildContext, set_context
+from sphinx_git.query import ChangelogQuery
 
-from . import MakeTestableMixin, TempDirTestCase
+from . import MakeTestableMixin, TempDirTestCase, commit_files, init_repo
 
 
 class TestableGitChangelog(MakeTestableMixin, GitChangelog):
@@ -161,6 +165,33 @@ class TestWithRepository(ChangelogTestCase):
             assert_in('commit #{0}'.format(n), child.text)
         assert_not_in('commit #9', bullet_list.text)
 
+    def test_zero_revisions(self):
+        self.repo.index.commit('my root commit')
+        self.changelog.options.update({'revisions': 0})
+        nodes = self.changelog.run()
+        list_markup = BeautifulSoup(str(nodes[0]), features='xml')
+        assert_equal(0, len(list_markup.findAll('list_item')))
+
+    def test_revisions_limit_walk_before_name_filter(self):
+        self.repo.index.commit('initial')
+        for file_name in ['abc.txt', 'other', 'other2']:
+            full_path = os.path.join(self.repo.working_tree_dir, file_name)
+            open(full_path, 'w+').close()
+            self.repo.index.add([full_path])
+            self.repo.index.commit('commit with file {}'.format(file_name))
+
+        self.changelog.options.update(
+            {'revisions': 2, 'filename_filter': 'abc'})
+        nodes = self.changelog.run()
+        list_markup = BeautifulSoup(str(nodes[0]), features='xml')
+        assert_equal(0, len(list_markup.findAll('list_item')))
+
+        self.changelog.options.update({'revisions': 3})
+        nodes = self.changelog.run()
+        list_markup = BeautifulSoup(str(nodes[0]), features='xml')
+        assert_equal(1, len(list_markup.findAll('list_item')))
+        assert_in('abc.txt', list_markup.text)
+
     def test_specifying_a_rev_list(self):
         self.repo.index.commit('before tag')
         commit = self.repo.index.commit('at tag')
@@ -235,6 +266,101 @@ class TestWithRepository(ChangelogTestCase):
         bullet_list = list_markup.bullet_list
         assert_equal(2, len(bullet_list.findAll('list_item')), nodes)
 
+    def test_name_filter_with_rev_list(self):
+        self.repo.index.commit('initial')
+        for file_name in ['docs/a.rst', 'docs/b.py', 'src/c.rst']:
+            full_path = os.path.join(self.repo.working_tree_dir, file_name)
+            if not os.path.isdir(os.path.dirname(full_path)):
+                os.makedirs(os.path.dirname(full_path))
+            open(full_path, 'w+').close()
+            self.repo.index.add([full_path])
+            self.repo.index.commit('commit with file {}'.format(file_name))
+
+        self.changelog.options.update(
+            {'rev-list': 'HEAD', 'filename_filter': r'docs/.*\.rst'})
+        nodes = self.changelog.run()
+        list_markup = BeautifulSoup(str(nodes[0]), features='xml')
+        items = list_markup.findAll('list_item')
+        assert_equal(1, len(items))
+        assert_in('docs/a.rst', items[0].text)
+
+    def _commit_files(self, file_names):
+        for file_name in file_names:
+            commit_files(self.repo, [file_name])
+
+    def _messages(self, nodes):
+        list_markup = BeautifulSoup(str(nodes[0]), features='xml')
+        return [item.paragraph.strong.text
+                for item in list_markup.findAll('list_item')]
+
+    def _warnings(self):
+        reporter = self.changelog.state.document.reporter
+        return [args[0] for args, _ in reporter.warning.call_args_list]
+
+    def test_max_scan(self):
+        self._commit_files(['docs/a', 'src/b', 'src/c', 'src/d'])
+        self.changelog.options.update(
+            {'rev-list': 'HEAD', 'filename_filter': 'docs/', 'max-scan': 3})
+        assert_equal([], self._messages(self.changelog.run()))
+        warnings = self._warnings()
+        assert_equal(1, len(warnings))
+        assert_in('Only the 3 most recent commits', warnings[0])
+
+    def test_max_scan_covering_range(self):
+        self._commit_files(['docs/a', 'src/b'])
+        self.changelog.options.update(
+            {'rev-list': 'HEAD', 'filename_filter': 'docs/', 'max-scan': 2})
+        assert_equal(['docs/a'], self._messages(self.changelog.run()))
+        assert_equal([], self._warnings())
+
+    def test_max_matches(self):
+        self._commit_files(['docs/a', 'docs/b', 'src/c', 'docs/d'])
+        self.changelog.options.update(
+            {'rev-list': 'HEAD', 'filename_filter': 'docs/',
+             'max-matches': 2})
+        assert_equal(['docs/d', 'docs/b'],
+                     self._messages(self.changelog.run()))
+        warnings = self._warnings()
+        assert_equal(1, len(warnings))
+        assert_in('Only the 2 most recent matching commits', warnings[0])
+
+    def test_max_matches_without_filter(self):
+        self._commit_files(['a', 'b', 'c'])
+        self.changelog.options.update({'rev-list': 'HEAD', 'max-matches': 2})
+        assert_equal(['c', 'b'], self._messages(self.changelog.run()))
+        assert_equal(1, len(self._warnings()))
+
+    def test_max_matches_all_found(self):
+        self._commit_files(['src/a', 'docs/b', 'docs/c'])
+        self.changelog.options.update(
+            {'rev-list': 'HEAD', 'filename_filter': 'docs/',
+             'max-matches': 2})
+        assert_equal(['docs/c', 'docs/b'],
+                     self._messages(self.changelog.run()))
+        # The walk may stop here, but nothing older matches.
+        assert_equal([], self._warnings())
+
+    def test_max_matches_across_batches(self):
+        self._commit_files(['docs/{0}'.format(n) if n % 10 == 0
+                            else 'src/{0}'.format(n) for n in range(100)])
+        self.changelog.options.update(
+            {'rev-list': 'HEAD', 'filename_filter': 'docs/',
+             'max-matches': 8})
+        assert_equal(['docs/{0}'.format(n) for n in range(90, 10, -10)],
+                     self._messages(self.changelog.run()))
+        assert_equal(1, len(self._warnings()))
+
+    def test_since_and_until(self):
+        for day in range(1, 6):
+            date = '2020-01-0{0}T12:00:00'.format(day)
+            self.repo.index.commit('day {0}'.format(day), author_date=date,
+                                   commit_date=date)
+        self.changelog.options.update(
+            {'rev-list': 'HEAD', 'since': '2020-01-02T00:00:00',
+             'until': '2020-01-04T00:00:00'})
+        assert_equal(['day 3', 'day 2'],
+                     self._messages(self.changelog.run()))
+
     def test_single_commit_hide_details(self):
         self.repo.index.commit(
             'Another commit\n\nToo much information'
@@ -280,6 +406,83 @@ class TestWithRepository(ChangelogTestCase):
         assert_not_in(' at ', par_children[1].text)
         assert_in(' by ', par_children[1].text)
 
+    def test_collapse_after(self):
+        for n in range(5):
+            self.repo.index.commit(str(n))
+        self.changelog.options.update({'collapse-after': 2})
+        nodes = self.changelog.run()
+        assert_equal(2, len(nodes))
+        list_markup = BeautifulSoup(str(nodes[0]), features='xml')
+        assert_equal(['4', '3'], [item.paragraph.strong.text for item
+                                  in list_markup.findAll('list_item')])
+        assert_equal('3 older commits not shown.', nodes[1].astext())
+        assert_in('sphinx-git-collapsed', nodes[1]['classes'])
+
+    def test_collapse_after_more_than_displayed(self):
+        for n in range(3):
+            self.repo.index.commit(str(n))
+        self.changelog.options.update({'collapse-after': 5})
+        nodes = self.changelog.run()
+        assert_equal(1, len(nodes))
+        list_markup = BeautifulSoup(str(nodes[0]), features='xml')
+        assert_equal(3, len(list_markup.findAll('list_item')))
+
+    def test_collapse_after_one_older_commit(self):
+        for n in range(3):
+            self.repo.index.commit(str(n))
+        self.changelog.options.update({'collapse-after': 2})
+        nodes = self.changelog.run()
+        assert_equal('1 older commit not shown.', nodes[1].astext())
+
+    def _merge_side_branch(self, name, file_names):
+        # Commit file_names on a side branch, then merge it into master.
+        config_writer = self.repo.config_writer()
+        config_writer.set_value('user', 'email', 'test@example.com')
+        config_writer.release()
+        master = self.repo.active_branch
+        base = self.repo.head.commit
+        side = self.repo.create_head(name, base)
+        side.checkout()
+        self._commit_files(file_names)
+        master.checkout()
+        self.repo.git.merge(name, '--no-ff', '-m', 'merge ' + name)
+
+    def test_first_parent(self):
+        self._commit_files(['root'])
+        self._merge_side_branch('one', ['docs/a', 'src/b'])
+        self._merge_side_branch('two', ['src/c'])
+        self.changelog.options.update({'first-parent': None, 'revisions': 2})
+        assert_equal(['merge two', 'merge one'],
+                     self._messages(self.changelog.run()))
+        self.changelog.options.update(
+            {'rev-list': 'HEAD', 'filename_filter': 'docs/'})
+        assert_equal(['merge one'], self._messages(self.changelog.run()))
+
+    def test_merges_only(self):
+        self._commit_files(['root'])
+        self._merge_side_branch('one', ['docs/a'])
+        self._commit_files(['docs/b'])
+        self._merge_side_branch('two', ['src/c'])
+        self.changelog.options.update({'merges-only': None})
+        assert_equal(['merge two', 'merge one'],
+                     self._messages(self.changelog.run()))
+        self.changelog.options.update(
+            {'rev-list': 'HEAD~1', 'filename_filter': 'docs/'})
+        assert_equal(['merge one'], self._messages(self.changelog.run()))
+
+    def test_group_by_tag(self):
+        self._commit_files(['a', 'b'])
+        self.repo.create_tag('v1')
+        self._commit_files(['c'])
+        self.repo.create_tag('v2')
+        self._commit_files(['d'])
+        self.changelog.options.update({'group-by-tag': None})
+        nodes = self.changelog.run()
+        assert_equal(['Unreleased', 'v2', 'v1'],
+                     [node[0].astext() for node in nodes])
+        assert_equal([['d'], ['c'], ['b', 'a']],
+                     [self._messages([node[1]]) for node in nodes])
+
 
 class TestWithOtherRepository(TestWithRepository):
     """
@@ -289,3 +492,150 @@ class TestWithOtherRepository(TestWithRepository):
         super(TestWithOtherRepository, self).setup()
         self.changelog.state.document.settings.env.srcdir = os.getcwd()
         self.changelog.options.update({'repo-dir': self.root})
+
+
+class TestWithCache(ChangelogTestCase):
+
+    def setup(self):
+        super(TestWithCache, self).setup()
+        self.repo = init_repo(self.root)
+        self.settings = BuildSettings(
+            doctreedir=os.path.join(self.root, '.doctrees'), cache=True,
+            cache_size=100)
+
+    def _messages(self):
+        # Each call stands in for a separate build sharing the cache.
+        context = BuildContext(self.settings)
+        set_context(self.changelog.state.document.settings.env, context)
+        nodes = self.changelog.run()
+        context.close()
+        list_markup = BeautifulSoup(str(nodes[0]), features='xml')
+        return [item.paragraph.strong.text
+                for item in list_markup.findAll('list_item')]
+
+    def test_cache_hit_does_not_walk_history(self):
+        self.repo.index.commit('first')
+        assert_equal(['first'], self._messages())
+        with patch.object(ChangelogQuery, 'load') as load:
+            assert_equal(['first'], self._messages())
+        assert_equal(0, load.call_count)
+
+    def test_new_commit_invalidates(self):
+        self.repo.index.commit('first')
+        self._messages()
+        self.repo.index.commit('second')
+        assert_equal(['second', 'first'], self._messages())
+
+    def test_options_are_part_of_key(self):
+        for n in range(3):
+            self.repo.index.commit('commit #{0}'.format(n))
+        assert_equal(3, len(self._messages()))
+        self.changelog.options.update({'revisions': 1})
+        assert_equal(['commit #2'], self._messages())
+        self.changelog.options.update({'filename_filter': 'nothing'})
+        assert_equal([], self._messages())
+        assert_equal(3, len(ChangelogCache.load(
+            os.path.join(self.root, '.doctrees', 'sphinx_git.cache'), 100)))
+
+    def test_rev_list_resolved_in_key(self):
+        self.repo.index.commit('first')
+        self.repo.create_tag('start')
+        self.repo.index.commit('second')
+        self.changelog.options.update({'rev-list': 'start..'})
+        assert_equal(['second'], self._messages())
+        self.repo.index.commit('third')
+        assert_equal(['third', 'second'], self._messages())
+
+
+class TestMultipleRepositories(ChangelogTestCase):
+
+    def setup(self):
+        super(TestMultipleRepositories, self).setup()
+        self.repos = {}
+        for name in ['main', 'other']:
+            self.repos[name] = init_repo(os.path.join(self.root, name))
+        self.changelog.state.document.settings.env.srcdir = os.path.join(
+            self.root, 'main')
+
+    def teardown(self):
+        for repo in self.repos.values():
+            repo.close()
+        super(TestMultipleRepositories, self).teardown()
+
+    def _commit(self, name, day, authored_day=None):
+        date = '2020-01-{0:02}T12:00:00'
+        self.repos[name].index.commit(
+            '{0} {1}'.format(name, day),
+            author_date=date.format(authored_day or day),
+            commit_date=date.format(day))
+
+    def _items(self):
+        nodes = self.changelog.run()
+        list_markup = BeautifulSoup(str(nodes[0]), features='xml')
+        return [(item.paragraph.strong.text,
+                 item.paragraph.findAll('emphasis')[-1].text)
+                for item in list_markup.findAll('list_item')]
+
+    def test_merged_by_date(self):
+        for name, day in [('main', 1), ('other', 2), ('main', 3),
+                          ('other', 4), ('other', 5)]:
+            self._commit(name, day)
+        self.changelog.options.update({
+            'extra-repo-dirs': os.path.join(self.root, 'other'),
+            'revisions': 4})
+        assert_equal([('other 5', 'other'), ('other 4', 'other'),
+                      ('main 3', 'main'), ('other 2', 'other')],
+                     self._items())
+
+    def test_merged_by_committer_date(self):
+        # As after a rebase, the newest commit was authored first.
+        for name, day, authored_day in [('main', 5, 4), ('other', 6, 6),
+                                        ('main', 7, 1)]:
+            self._commit(name, day, authored_day)
+        self.changelog.options.update({
+            'extra-repo-dirs': os.path.join(self.root, 'other')})
+        assert_equal([('main 7', 'main'), ('other 6', 'other'),
+                      ('main 5', 'main')], self._items())
+
+    def test_repository_listed_twice(self):
+        self._commit('main', 1)
+        self.changelog.options.update({
+            'extra-repo-dirs': os.path.join(self.root, 'main')})
+        # Commits from a single repository aren't labelled with its name.
+        assert_equal([('main 1', '2020-01-01 12:00:00')], self._items())
+
+    def test_submodules(self):
+        self._commit('other', 1)
+        self._commit('main', 2)
+        main = self.repos['main']
+        main.git.execute(['git', '-c', 'protocol.file.allow=always',
+                          'submodule', '--quiet', 'add',
+                          os.path.join(self.root, 'other'), 'lib/other'])
+        main.index.commit('add submodule')
+        self.changelog.options.update({'submodules': None})
+        assert_equal(['add submodule', 'main 2', 'other 1'],
+                     [message for message, _ in self._items()])
+
+    def test_max_matches_over_all_repositories(self):
+        for name, day in [('main', 1), ('other', 2), ('main', 3)]:
+            self._commit(name, day)
+        self.changelog.options.update({
+            'extra-repo-dirs': os.path.join(self.root, 'other'),
+            'rev-list': 'HEAD', 'max-matches': 2})
+        assert_equal(['main 3', 'other 2'],
+                     [message for message, _ in self._items()])
+        reporter = self.changelog.state.document.reporter
+        assert_equal(1, reporter.warning.call_count)
+
+    def test_each_walk_limited(self):
+        for day in range(1, 10):
+            self._commit('main', day)
+            self._commit('other', day)
+        self.changelog.options.update({
+            'extra-repo-dirs': os.path.join(self.root, 'other'),
+            'revisions': 3})
+        context = BuildContext(BuildSettings(timing=True))
+        set_context(self.changelog.state.document.settings.env, context)
+        assert_equal(3, len(self._items()))
+        assert_equal(6, context.timings[0].counts['scanned'])
+        context.close()
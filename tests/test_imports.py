@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+import os
+import subprocess
+import sys
+import textwrap
+
+from git import Repo
+from nose.tools import assert_equal, assert_in
+
+from . import TempDirTestCase
+
+# Modules which are slow to import, and only needed once a directive runs.
+LAZY_MODULES = ['git', 'pygit2', 'six']
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+REPORT = textwrap.dedent("""\
+    import sys
+    print(' '.join(sorted(set(name.split('.')[0] for name in sys.modules
+                              if name.split('.')[0] in {0!r}))))
+""").format(LAZY_MODULES)
+
+
+def _imported(script):
+    # Run in a fresh interpreter, as this one has imported everything.
+    env = dict(os.environ, PYTHONPATH=PACKAGE_DIR)
+    output = subprocess.check_output([sys.executable, '-c', script + REPORT],
+                                     env=env)
+    return output.decode('utf-8').split()
+
+
+class TestLazyImports(TempDirTestCase):
+
+    def test_importing_extension(self):
+        assert_equal([], _imported('import sphinx_git\n'))
+
+    def test_build_without_directives(self):
+        with open(os.path.join(self.root, 'conf.py'), 'w') as conf:
+            conf.write("extensions = ['sphinx_git']\n")
+        with open(os.path.join(self.root, 'index.rst'), 'w') as index:
+            index.write('Title\n=====\n\nNo git here.\n')
+        assert_equal([], _imported(textwrap.dedent("""\
+            from sphinx.cmd.build import build_main
+            assert build_main(['-q', '-b', 'dummy', {0!r}, {1!r}]) == 0
+        """).format(self.root, os.path.join(self.root, '_build'))))
+
+    def test_directive_imports_git(self):
+        repo = Repo.init(self.root)
+        repo.index.commit('first')
+        repo.close()
+        with open(os.path.join(self.root, 'conf.py'), 'w') as conf:
+            conf.write("extensions = ['sphinx_git']\n")
+        with open(os.path.join(self.root, 'index.rst'), 'w') as index:
+            index.write('.. git_changelog::\n')
+        # Checks that the report would catch an import.
+        assert_in('git', _imported(textwrap.dedent("""\
+            from sphinx.cmd.build import build_main
+            assert build_main(['-q', '-b', 'dummy', {0!r}, {1!r}]) == 0
+        """).format(self.root, os.path.join(self.root, '_build'))))
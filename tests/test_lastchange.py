@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+import os
+
+from mock import Mock, patch
+from nose.tools import assert_equal, assert_is_none
+
+from sphinx_git import GitLastUpdated
+from sphinx_git.backends import GitBackend
+from sphinx_git.config import BuildSettings
+from sphinx_git.context import BuildContext, set_context
+from sphinx_git.lastchange import LastChangeIndex
+from sphinx_git.tracking import LastUpdatedInput
+
+from . import MakeTestableMixin, RepoTestCase, commit_files
+
+
+class LastChangeTestCase(RepoTestCase):
+
+    def _commit_files(self, message, *file_names):
+        return commit_files(self.repo, file_names, message).hexsha
+
+
+class TestLastChangeIndex(LastChangeTestCase):
+
+    def setup(self):
+        super(TestLastChangeIndex, self).setup()
+        self.backend = GitBackend(self.repo)
+        self.index_file = os.path.join(self.root, 'index')
+
+    def teardown(self):
+        self.backend.close()
+        super(TestLastChangeIndex, self).teardown()
+
+    def _index(self):
+        index = LastChangeIndex.load(self.index_file)
+        index.update(self.backend)
+        return index
+
+    def _last(self, index):
+        return dict((path, index.get(path).hexsha)
+                    for path in ['index.rst', 'docs/a.rst', 'docs/b.rst'])
+
+    def test_newest_commit_wins(self):
+        first = self._commit_files('first', 'index.rst', 'docs/a.rst')
+        second = self._commit_files('second', 'docs/a.rst', 'docs/b.rst')
+        index = self._index()
+        assert_equal({'index.rst': first, 'docs/a.rst': second,
+                      'docs/b.rst': second}, self._last(index))
+        assert_equal(3, len(index))
+        assert_equal('Test User', index.get('index.rst').author)
+        assert_is_none(index.get('missing.rst'))
+
+    def test_only_new_commits_walked(self):
+        first = self._commit_files('first', 'index.rst', 'docs/a.rst',
+                                   'docs/b.rst')
+        self._index().save()
+        second = self._commit_files('second', 'docs/b.rst')
+        with patch.object(self.backend, 'log',
+                          wraps=self.backend.log) as log:
+            index = self._index()
+        assert_equal({'index.rst': first, 'docs/a.rst': first,
+                      'docs/b.rst': second}, self._last(index))
+        # The first walk checks that no commits were lost.
+        assert_equal(['{0}..{1}'.format(second, first),
+                      '{0}..{1}'.format(first, second)],
+                     [call[0][0] for call in log.call_args_list])
+
+    def test_rewritten_history_rebuilt(self):
+        self._commit_files('first', 'index.rst', 'docs/a.rst', 'docs/b.rst')
+        self._commit_files('second', 'docs/b.rst')
+        self._index().save()
+        self.repo.git.reset('--hard', 'HEAD~1')
+        index = self._index()
+        assert_equal(self.repo.head.commit.hexsha,
+                     index.get('docs/b.rst').hexsha)
+
+    def test_merged_changes_attributed_to_their_commits(self):
+        root = self._commit_files('root', 'index.rst', 'docs/a.rst',
+                                  'docs/b.rst')
+        master = self.repo.active_branch
+        side = self.repo.create_head('side', root)
+        side.checkout()
+        side_commit = self._commit_files('side', 'docs/a.rst')
+        master.checkout()
+        main_commit = self._commit_files('main', 'docs/b.rst')
+        self.repo.git.merge('side', '--no-edit', '-m', 'merge side')
+        assert_equal({'index.rst': root, 'docs/a.rst': side_commit,
+                      'docs/b.rst': main_commit}, self._last(self._index()))
+
+    def _commit_dated(self, date, message, *file_names):
+        with patch.dict(os.environ, {'GIT_AUTHOR_DATE': date,
+                                     'GIT_COMMITTER_DATE': date}):
+            return self._commit_files(message, *file_names)
+
+    def test_older_merged_change_kept_out(self):
+        root = self._commit_dated('2020-01-01T00:00:00', 'root',
+                                  'index.rst', 'docs/a.rst', 'docs/b.rst')
+        master = self.repo.active_branch
+        side = self.repo.create_head('side', root)
+        side.checkout()
+        side_commit = self._commit_dated('2020-01-05T00:00:00', 'side',
+                                         'docs/a.rst', 'docs/b.rst')
+        master.checkout()
+        main_commit = self._commit_dated('2020-01-10T00:00:00', 'main',
+                                         'docs/a.rst')
+        self._index().save()
+        self.repo.git.merge('side', '--no-ff', '--no-edit', '-m',
+                            'merge side')
+        index = self._index()
+        assert_equal({'index.rst': root, 'docs/a.rst': main_commit,
+                      'docs/b.rst': side_commit}, self._last(index))
+        os.remove(self.index_file)
+        assert_equal(self._last(self._index()), self._last(index))
+
+    def test_unchanged_head_not_walked(self):
+        self._commit_files('first', 'index.rst')
+        self._index().save()
+        with patch.object(self.backend, 'log') as log:
+            self._index()
+        assert_equal(0, log.call_count)
+
+
+class TestableGitLastUpdated(MakeTestableMixin, GitLastUpdated):
+
+    pass
+
+
+class TestLastUpdatedDirective(LastChangeTestCase):
+
+    def setup(self):
+        super(TestLastUpdatedDirective, self).setup()
+        self.env = Mock(srcdir=self.root, docname='docs/a')
+        self.env.doc2path.side_effect = lambda docname: os.path.join(
+            self.root, docname + '.rst')
+        self.env.relfn2path.side_effect = lambda filename, docname: (
+            filename, os.path.join(self.root, 'docs', filename))
+        self.context = BuildContext(BuildSettings(track_changes=True))
+        set_context(self.env, self.context)
+        self.env.sphinx_git_inputs = {}
+
+    def teardown(self):
+        self.context.close()
+        super(TestLastUpdatedDirective, self).teardown()
+
+    def _run(self, options=None):
+        directive = TestableGitLastUpdated()
+        directive.state.document.settings.env = self.env
+        directive.options = options or {}
+        return directive.run()
+
+    def test_document_source(self):
+        self._commit_files('first', 'docs/a.rst', 'docs/b.rst')
+        hexsha = self._commit_files('second', 'docs/a.rst')
+        nodes = self._run({'commit': True, 'sha_length': 10})
+        assert_equal(1, len(nodes))
+        text = nodes[0].astext()
+        assert text.startswith('Last updated at '), text
+        assert text.endswith(' by Test User in ' + hexsha[:10]), text
+        assert_equal(set([LastUpdatedInput(self.repo.working_dir,
+                                           'docs/a.rst', hexsha)]),
+                     self.env.sphinx_git_inputs['docs/a'])
+
+    def test_file_option(self):
+        hexsha = self._commit_files('first', 'docs/a.rst', 'docs/b.rst')
+        self._commit_files('second', 'docs/a.rst')
+        nodes = self._run({'file': 'b.rst', 'hide_author': True})
+        assert not nodes[0].astext().endswith('Test User')
+        assert_equal(set([LastUpdatedInput(self.repo.working_dir,
+                                           'docs/b.rst', hexsha)]),
+                     self.env.sphinx_git_inputs['docs/a'])
+
+    def test_uncommitted_file(self):
+        self._commit_files('first', 'docs/b.rst')
+        assert_equal([], self._run())
+
+    def _is_outdated(self, git_input):
+        context = BuildContext()
+        try:
+            return git_input.is_outdated(context)
+        finally:
+            context.close()
+
+    def test_outdated_after_commit(self):
+        self._commit_files('first', 'docs/a.rst', 'docs/b.rst')
+        self._run()
+        git_input, = self.env.sphinx_git_inputs['docs/a']
+        assert not self._is_outdated(git_input)
+        self._commit_files('second', 'docs/b.rst')
+        assert not self._is_outdated(git_input)
+        self._commit_files('third', 'docs/a.rst')
+        assert self._is_outdated(git_input)
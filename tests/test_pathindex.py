@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+import os
+
+from mock import Mock, patch
+from nose.tools import assert_equal, assert_in, assert_not_in
+
+from sphinx_git import backends
+from sphinx_git.backends import GitBackend
+from sphinx_git.commits import CommitRecord, iter_commit_records
+from sphinx_git.config import BuildSettings
+from sphinx_git.context import BuildContext, env_merge_info, set_context
+from sphinx_git.filters import FilenameFilter
+from sphinx_git.pathindex import (
+    MAX_CHANGED_PATHS,
+    ChangedPathIndex,
+    index_path,
+)
+
+from . import RepoTestCase, TempDirTestCase, commit_files
+
+
+def commit(hexsha):
+    return CommitRecord(hexsha, (), u'Test User', 0, 0, u'message')
+
+
+def starts_with(prefix):
+    return lambda path: path.startswith(prefix)
+
+
+class TestChangedPathIndex(TempDirTestCase):
+
+    def setup(self):
+        super(TestChangedPathIndex, self).setup()
+        self.path = os.path.join(self.root, 'doctrees', 'sphinx_git.paths')
+        self.index = ChangedPathIndex(self.path)
+        self.index.add('a', ['docs/index.rst', 'setup.py'])
+        self.index.add('b', ['setup.py'])
+        self.index.add('c', [])
+
+    def _lookup(self, prefix, index=None):
+        matched, unknown = (index or self.index).lookup(
+            [commit('a'), commit('b'), commit('c')], starts_with(prefix))
+        return sorted(matched), [record.hexsha for record in unknown]
+
+    def test_lookup(self):
+        assert_equal((['a'], []), self._lookup('docs/'))
+        assert_equal((['a', 'b'], []), self._lookup('setup'))
+        assert_equal(([], []), self._lookup('src/'))
+
+    def test_contains(self):
+        assert_in('a', self.index)
+        assert_not_in('d', self.index)
+
+    def test_too_many_paths_are_unknown(self):
+        paths = ['file{0}'.format(n) for n in range(MAX_CHANGED_PATHS + 1)]
+        self.index.add('d', paths)
+        matched, unknown = self.index.lookup([commit('d')], starts_with('x'))
+        assert_equal(set(), matched)
+        assert_equal([commit('d')], unknown)
+
+    def test_save_and_load(self):
+        self.index.save()
+        loaded = ChangedPathIndex.load(self.path)
+        assert_equal(3, len(loaded))
+        assert_equal((['a', 'b'], []), self._lookup('setup', loaded))
+        loaded.add('d', ['setup.py', 'new'])
+        matched, _ = loaded.lookup([commit('b'), commit('d')],
+                                   starts_with('new'))
+        assert_equal(set(['d']), matched)
+
+    def test_load_missing_file(self):
+        assert_equal(0, len(ChangedPathIndex.load(self.path)))
+
+    def test_journal(self):
+        self.index.journal = []
+        self.index.add('a', ['ignored'])
+        self.index.add('d', ['new'])
+        assert_equal([('d', ['new'])], self.index.journal)
+
+    def test_index_path_per_repository(self):
+        assert index_path('x', '/one/.git') != index_path('x', '/two/.git')
+
+
+class TestFilterWithIndex(RepoTestCase):
+
+    def setup(self):
+        super(TestFilterWithIndex, self).setup()
+        self.index = ChangedPathIndex(os.path.join(self.root, 'index'))
+        for file_name in ['docs/index.rst', 'setup.py', 'docs/conf.py']:
+            commit_files(self.repo, [file_name])
+
+    def _select(self, pattern, index):
+        commits = iter_commit_records(self.root, ['HEAD'])
+        selected = FilenameFilter(pattern).select(GitBackend(self.repo),
+                                                  commits, index)
+        return [record.message.strip() for record in selected]
+
+    def test_same_result_as_diffing(self):
+        for pattern in [r'docs/.*\.rst', 'docs', 'setup', 'nothing']:
+            assert_equal(self._select(pattern, None),
+                         self._select(pattern, self.index))
+
+    def test_indexed_commits_are_not_diffed(self):
+        self._select('docs', self.index)
+        assert_equal(3, len(self.index))
+        with patch.object(backends, 'iter_git_records') as iter_records:
+            assert_equal(['docs/conf.py', 'docs/index.rst'],
+                         self._select('docs', self.index))
+        assert_equal(0, iter_records.call_count)
+
+    def test_new_commits_are_added(self):
+        self._select('docs', self.index)
+        commit_files(self.repo, ['docs/new.rst'])
+        assert_equal(['docs/new.rst', 'docs/conf.py', 'docs/index.rst'],
+                     self._select('docs', self.index))
+        assert_equal(4, len(self.index))
+
+
+class TestContextPathIndex(RepoTestCase):
+
+    def setup(self):
+        super(TestContextPathIndex, self).setup()
+        self.settings = BuildSettings(
+            doctreedir=os.path.join(self.root, 'doctrees'), path_index=True)
+
+    def test_disabled_by_default(self):
+        context = BuildContext()
+        assert context.path_index(self.repo) is None
+
+    def test_saved_on_close(self):
+        context = BuildContext(self.settings)
+        context.path_index(self.repo).add('a', ['file'])
+        context.close()
+        context = BuildContext(self.settings)
+        assert_in('a', context.path_index(self.repo))
+
+    def test_worker_updates_merged(self):
+        context = BuildContext(self.settings)
+        worker_env = Mock()
+        worker = context.for_worker(worker_env)
+        worker.path_index(self.repo).add('a', ['file'])
+        parent_env = Mock()
+        parent = BuildContext(self.settings._replace(
+            doctreedir=os.path.join(self.root, 'other')))
+        set_context(parent_env, parent)
+        env_merge_info(Mock(), parent_env, [], worker_env)
+        assert_in('a', parent.path_index(self.repo))
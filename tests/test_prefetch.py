@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+import os
+import threading
+
+from docutils.parsers.rst import directives
+from mock import Mock, patch
+from nose.tools import assert_equal, assert_false, assert_in
+
+from sphinx_git import GitChangelog, GitCommitDetail
+from sphinx_git.config import BuildSettings
+from sphinx_git.context import BuildContext, set_context
+from sphinx_git.prefetch import prefetch, scan_source
+from sphinx_git.query import ChangelogQuery
+
+from . import MakeTestableMixin, RepoTestCase
+
+OPTION_SPECS = {
+    'git_changelog': GitChangelog.option_spec,
+    'git_commit_detail': GitCommitDetail.option_spec,
+}
+
+SOURCE = u"""\
+Title
+=====
+
+.. git_changelog::
+    :revisions: 5
+    :filename_filter: docs/.*
+
+    Not an option
+
+.. note::
+
+   .. git_commit_detail::
+      :untracked:
+
+.. git_changelog::
+   :revisions: -1
+
+.. git_changelog::
+
+:revisions: 3
+"""
+
+
+class TestableGitCommitDetail(MakeTestableMixin, GitCommitDetail):
+    pass
+
+
+class TestScanSource(object):
+
+    def test_directives_and_options(self):
+        assert_equal([
+            ('git_changelog', {'revisions': 5, 'filename_filter': 'docs/.*'}),
+            ('git_commit_detail', {'untracked': False}),
+            ('git_changelog', {}),
+        ], list(scan_source(SOURCE, OPTION_SPECS)))
+
+    def test_unknown_options_end_the_options(self):
+        source = u'.. git_changelog::\n   :unknown: 1\n   :revisions: 2\n'
+        assert_equal([('git_changelog', {})],
+                     list(scan_source(source, OPTION_SPECS)))
+
+    def test_other_directives_ignored(self):
+        assert_equal([], list(scan_source(
+            u'.. image:: picture.png\n   :width: 20\n',
+            {'git_changelog': {'revisions': directives.nonnegative_int}})))
+
+
+class TestPrefetch(RepoTestCase):
+
+    def setup(self):
+        super(TestPrefetch, self).setup()
+        for message in ['first', 'second', 'third']:
+            self.repo.index.commit(message)
+        with open(os.path.join(self.root, 'index.rst'), 'w') as source:
+            source.write(SOURCE)
+        self.env = Mock(srcdir=self.root)
+        self.env.config.source_encoding = 'utf-8-sig'
+        self.env.doc2path.side_effect = lambda docname: os.path.join(
+            self.root, docname + '.rst')
+        self.context = BuildContext(BuildSettings(prefetch=True))
+        set_context(self.env, self.context)
+
+    def teardown(self):
+        self.context.close()
+        super(TestPrefetch, self).teardown()
+
+    def test_results_are_waiting(self):
+        prefetch(Mock(parallel=0), self.env, set(['index']), OPTION_SPECS)
+        repo = self.context.find_repo(self.root)
+        assert_in(('commits', repo.git_dir, ChangelogQuery.from_options({})),
+                  self.context._prefetch.pending)
+        with patch.object(ChangelogQuery, 'load') as load:
+            commits = self.context.find_commits(
+                ChangelogQuery.from_options({}), repo)
+            status = self.context.working_tree_status(repo, True)
+        assert_equal(0, load.call_count)
+        assert_equal(['third', 'second', 'first'],
+                     [commit.message for commit in commits])
+        # index.rst itself is untracked.
+        assert_equal((False, True), tuple(status))
+
+    def test_disabled_for_parallel_builds(self):
+        prefetch(Mock(parallel=4), self.env, set(['index']), OPTION_SPECS)
+        assert_equal({}, self.context._prefetch.pending)
+
+    def test_disabled_by_configuration(self):
+        self.context.settings = self.context.settings._replace(
+            prefetch=False)
+        prefetch(Mock(parallel=0), self.env, set(['index']), OPTION_SPECS)
+        assert_equal({}, self.context._prefetch.pending)
+
+    def test_missing_repository(self):
+        with open(os.path.join(self.root, 'other.rst'), 'w') as source:
+            source.write(u'.. git_changelog::\n   :repo-dir: /nonexistent\n')
+        prefetch(Mock(parallel=0), self.env, set(['other']), OPTION_SPECS)
+        assert_equal({}, self.context._prefetch.pending)
+
+    def test_directives_run_while_prefetching(self):
+        repo = self.context.find_repo(self.root)
+        queries = [ChangelogQuery.from_options({'revisions': revisions})
+                   for revisions in range(1, 50)]
+        for query in queries:
+            self.context.prefetch_commits(query, repo)
+        commit_detail = TestableGitCommitDetail()
+        commit_detail.state.document.settings.env = self.env
+        commit_detail.options = {'commit': True, 'branch': True}
+
+        def build():
+            self.context.start_prefetching()
+            for query in queries:
+                commit_detail.run()
+                self.context.find_commits(query, repo)
+
+        # The prefetching threads and the directives share the repository,
+        # so must not deadlock.
+        thread = threading.Thread(target=build)
+        thread.daemon = True
+        thread.start()
+        thread.join(60)
+        assert_false(thread.is_alive())
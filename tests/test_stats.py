@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+
+from mock import Mock, patch
+from nose.tools import assert_equal, assert_in, assert_true
+
+from sphinx_git import GitChangelog
+from sphinx_git import context as context_module
+from sphinx_git import stats
+from sphinx_git.config import BuildSettings
+from sphinx_git.context import BuildContext, report_timings, set_context
+
+from . import MakeTestableMixin, RepoTestCase
+
+
+class TimedGitChangelog(MakeTestableMixin, GitChangelog):
+
+    pass
+
+
+class TestTiming(object):
+
+    def test_phases_and_counts_outside_timing_are_ignored(self):
+        timing = stats.DirectiveTiming.create('GitChangelog', 'index', 12)
+        with stats.phase('walk'):
+            stats.count('scanned', 3)
+        with stats.activate(timing):
+            pass
+        with stats.phase('walk'):
+            stats.count('scanned', 3)
+        assert_equal({}, timing.phases)
+        assert_equal(0, timing.counts['scanned'])
+        data = timing.as_dict()
+        assert_equal(({}, 0, 0, 0), (data['phases'], data['scanned'],
+                                     data['displayed'], data['processes']))
+        assert_equal(['-'] * len(stats.PHASES) + ['0', '0', '0'],
+                     stats.format_report([timing])[1].split()[3:])
+
+    def test_phases_and_counts(self):
+        timing = stats.DirectiveTiming.create('GitChangelog', 'index', 12)
+        with stats.activate(timing):
+            with stats.phase('walk'):
+                stats.count('scanned', 3)
+            with stats.phase('walk'):
+                stats.count('scanned', 2)
+            stats.count('processes')
+        assert_equal(['walk'], list(timing.phases))
+        assert_equal(5, timing.counts['scanned'])
+        assert_equal(1, timing.counts['processes'])
+        assert_true(timing.total >= timing.phases['walk'])
+
+    def test_report_is_sorted_slowest_first(self):
+        fast = stats.DirectiveTiming.create('GitChangelog', 'fast', 1)
+        slow = stats.DirectiveTiming.create('GitCommitDetail', 'slow', 2)
+        fast.counts['total'], slow.counts['total'] = 0.001, 0.5
+        slow.phases['status'] = 0.25
+        lines = stats.format_report([fast, slow])
+        assert_equal(3, len(lines))
+        assert_in('location', lines[0])
+        assert_true(lines[1].startswith('slow:2'))
+        assert_in('250.0', lines[1])
+        assert_true(lines[2].startswith('fast:1'))
+
+
+class TestDirectiveTiming(RepoTestCase):
+
+    def setup(self):
+        super(TestDirectiveTiming, self).setup()
+        for n in range(3):
+            self.repo.index.commit('commit #{0}'.format(n))
+        self.changelog = TimedGitChangelog()
+        env = self.changelog.state.document.settings.env
+        env.srcdir = self.root
+        env.docname = 'index'
+        self.context = BuildContext(BuildSettings(timing=True))
+        set_context(env, self.context)
+
+    def teardown(self):
+        self.context.close()
+        super(TestDirectiveTiming, self).teardown()
+
+    def test_directive_is_timed(self):
+        self.changelog.options.update({'revisions': 2,
+                                       'filename_filter': 'x'})
+        self.changelog.run()
+        assert_equal(1, len(self.context.timings))
+        timing = self.context.timings[0]
+        assert_equal(('index', 123), (timing.docname, timing.lineno))
+        assert_equal(['open', 'resolve', 'walk', 'filter', 'markup'],
+                     list(timing.phases))
+        # cat-file (resolving HEAD), log and diff-tree.
+        assert_equal((2, 0, 3), (timing.counts['scanned'],
+                                 timing.counts['displayed'],
+                                 timing.counts['processes']))
+
+    def test_json(self):
+        self.changelog.run()
+        path = os.path.join(self.root, 'timings.json')
+        stats.write_json(path, self.context.timings)
+        with open(path) as json_file:
+            data = json.load(json_file)
+        assert_equal(1, len(data))
+        assert_equal(3, data[0]['displayed'])
+
+    def test_no_report_without_directives(self):
+        app = Mock(outdir=self.root)
+        app.config.sphinx_git_timing = True
+        app.config.sphinx_git_timing_json = None
+        with patch.object(context_module, 'logger') as logger:
+            report_timings(app, [])
+        assert_equal(0, logger.info.call_count)
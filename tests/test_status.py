@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+import os
+
+from git import Repo
+from mock import patch
+from nose.tools import assert_equal
+
+from sphinx_git.context import BuildContext
+from sphinx_git.status import WorkingTreeStatus, probe_status
+
+from . import RepoTestCase
+
+
+class TestProbeStatus(RepoTestCase):
+
+    def setup(self):
+        super(TestProbeStatus, self).setup()
+        self.tracked = os.path.join(self.root, 'tracked')
+        self._write(self.tracked)
+        self.repo.index.add([self.tracked])
+        self.repo.index.commit('root')
+
+    def _write(self, path):
+        with open(path, 'a') as f:
+            f.write('change\n')
+
+    def test_clean(self):
+        assert_equal(WorkingTreeStatus(False, False),
+                     probe_status(self.root, True))
+
+    def test_modified(self):
+        self._write(self.tracked)
+        assert_equal(WorkingTreeStatus(True, False),
+                     probe_status(self.root, True))
+
+    def test_staged(self):
+        self._write(self.tracked)
+        self.repo.index.add([self.tracked])
+        assert_equal(WorkingTreeStatus(True, None),
+                     probe_status(self.root, False))
+
+    def test_modified_untracked_not_requested(self):
+        self._write(self.tracked)
+        with patch('sphinx_git.status.iter_git_records') as status:
+            assert_equal(WorkingTreeStatus(True, None),
+                         probe_status(self.root, False))
+        assert_equal(0, status.call_count)
+
+    def test_touched_file_is_clean(self):
+        os.utime(self.tracked, (0, 0))
+        assert_equal(WorkingTreeStatus(False, None),
+                     probe_status(self.root, False))
+
+    def test_staged_before_first_commit(self):
+        repo = Repo.init(os.path.join(self.root, 'new'))
+        path = os.path.join(repo.working_tree_dir, 'file')
+        self._write(path)
+        repo.index.add([path])
+        assert_equal(WorkingTreeStatus(True, None),
+                     probe_status(repo.working_tree_dir, False))
+
+    def test_untracked(self):
+        os.makedirs(os.path.join(self.root, 'new', 'dir'))
+        self._write(os.path.join(self.root, 'new', 'dir', 'file'))
+        assert_equal(WorkingTreeStatus(False, True),
+                     probe_status(self.root, True))
+
+    def test_untracked_not_requested(self):
+        self._write(os.path.join(self.root, 'untracked'))
+        assert_equal(WorkingTreeStatus(False, None),
+                     probe_status(self.root, False))
+
+    def test_ignored_files_are_not_untracked(self):
+        with open(os.path.join(self.root, '.git', 'info', 'exclude'),
+                  'w') as exclude:
+            exclude.write('ignored\n')
+        self._write(os.path.join(self.root, 'ignored'))
+        assert_equal(WorkingTreeStatus(False, False),
+                     probe_status(self.root, True))
+
+    def test_dirty_and_untracked(self):
+        self._write(self.tracked)
+        self._write(os.path.join(self.root, 'untracked'))
+        assert_equal(WorkingTreeStatus(True, True),
+                     probe_status(self.root, True))
+
+
+class TestSharedStatus(RepoTestCase):
+
+    def setup(self):
+        super(TestSharedStatus, self).setup()
+        self.context = BuildContext()
+
+    def test_probed_once_per_build(self):
+        with patch('sphinx_git.backends.probe_status',
+                   return_value=WorkingTreeStatus(False, False)) as probe:
+            for _ in range(3):
+                self.context.working_tree_status(self.repo, True)
+                self.context.working_tree_status(self.repo, False)
+        assert_equal(1, probe.call_count)
+
+    def test_untracked_probe_after_dirty_probe(self):
+        with patch('sphinx_git.backends.probe_status',
+                   return_value=WorkingTreeStatus(False, None)) as probe:
+            self.context.working_tree_status(self.repo, False)
+            self.context.working_tree_status(self.repo, True)
+        assert_equal([(self.root, False), (self.root, True)],
+                     [args for args, _ in probe.call_args_list])
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+import os
+
+from mock import patch
+from nose.tools import assert_equal, assert_not_equal
+
+from sphinx_git import tags
+from sphinx_git.tags import TagIndex, read_tags
+
+from . import RepoTestCase
+
+
+class TestTagIndex(RepoTestCase):
+
+    def setup(self):
+        super(TestTagIndex, self).setup()
+        self.index_file = os.path.join(self.root, 'index')
+        self.day = 0
+
+    def _commit(self, message, parents=None):
+        self.day += 1
+        date = '2020-01-{0:02}T12:00:00'.format(self.day)
+        return self.repo.index.commit(message, parent_commits=parents,
+                                      author_date=date,
+                                      commit_date=date).hexsha
+
+    def _index(self):
+        index = TagIndex.load(self.index_file)
+        index.update(self.root)
+        return index
+
+    def _releases(self, index, commits):
+        return [index.release(hexsha) for hexsha in commits]
+
+    def test_oldest_tag_containing_commit(self):
+        commits = [self._commit('first'), self._commit('second')]
+        self.repo.create_tag('v1')
+        commits.append(self._commit('third'))
+        self.repo.create_tag('v2', message='Release 2')
+        self.repo.create_tag('also-v2')
+        commits.append(self._commit('unreleased'))
+        index = self._index()
+        assert_equal(['v1', 'v1', 'also-v2', None],
+                     self._releases(index, commits))
+        assert_equal(3, len(index))
+
+    def test_branch_released_when_merged(self):
+        root = self._commit('root')
+        self.repo.create_tag('v1')
+        side = self._commit('side')
+        self.repo.head.reset(root, index=True)
+        main = self._commit('main')
+        self.repo.create_tag('v2')
+        merge = self._commit('merge', parents=[self.repo.commit(main),
+                                               self.repo.commit(side)])
+        self.repo.create_tag('v3')
+        assert_equal(['v1', 'v3', 'v2', 'v3'],
+                     self._releases(self._index(), [root, side, main, merge]))
+
+    def test_only_new_history_walked(self):
+        first = self._commit('first')
+        self.repo.create_tag('v1')
+        self._index().save()
+        second = self._commit('second')
+        self.repo.create_tag('v2')
+        with patch.object(tags, 'iter_git_records',
+                          wraps=tags.iter_git_records) as records:
+            index = self._index()
+        assert_equal(['v1', 'v2'], self._releases(index, [first, second]))
+        walk = records.call_args_list[-1]
+        assert_equal([second, '^' + first], walk[1]['stdin_lines'])
+
+    def test_unchanged_tags_not_walked(self):
+        self._commit('first')
+        self.repo.create_tag('v1')
+        self._index().save()
+        with patch.object(TagIndex, '_walk') as walk:
+            self._index()
+        assert_equal(0, walk.call_count)
+
+    def test_moved_tag_rebuilds(self):
+        first = self._commit('first')
+        self.repo.create_tag('v1')
+        second = self._commit('second')
+        self.repo.create_tag('v2')
+        index = self._index()
+        index.save()
+        digest = index.digest()
+        self.repo.create_tag('v1', second, force=True)
+        self.repo.delete_tag(self.repo.tags['v2'])
+        index = self._index()
+        assert_equal(['v1', 'v1'], self._releases(index, [first, second]))
+        assert_not_equal(digest, index.digest())
+
+    def test_older_new_tag_rebuilds(self):
+        first = self._commit('first')
+        second = self._commit('second')
+        self.repo.create_tag('v2')
+        self._index().save()
+        self.repo.create_tag('v1', first)
+        assert_equal(['v1', 'v2'],
+                     self._releases(self._index(), [first, second]))
+
+    def test_tags_of_other_objects_ignored(self):
+        self._commit('first')
+        self.repo.create_tag('tree', self.repo.head.commit.tree)
+        self.repo.create_tag('v1')
+        assert_equal(['v1'], list(read_tags(self.root)))
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+import os
+
+from mock import Mock, patch
+from nose.tools import assert_equal
+
+from sphinx_git import context as context_module
+from sphinx_git import tracking
+from sphinx_git.config import BuildSettings
+from sphinx_git.context import BuildContext, set_context
+from sphinx_git.query import ChangelogQuery
+from sphinx_git.tracking import (
+    ChangelogInput,
+    CommitDetailInput,
+    TagsInput,
+    note_input,
+)
+
+from . import RepoTestCase, commit_files
+
+
+class FakeEnv(object):
+
+    def __init__(self):
+        self.sphinx_git_inputs = {}
+        self.docname = None
+
+
+class TestTracking(RepoTestCase):
+
+    def setup(self):
+        super(TestTracking, self).setup()
+        self.repo.index.commit('first')
+        self.env = FakeEnv()
+        self._new_build()
+
+    def teardown(self):
+        self.context.close()
+        super(TestTracking, self).teardown()
+
+    def _new_build(self):
+        self.context = BuildContext(BuildSettings(track_changes=True))
+        set_context(self.env, self.context)
+
+    def _read(self, docname, options):
+        self.env.docname = docname
+        query = ChangelogQuery.from_options(options)
+        commits = self.context.find_commits(query, self.repo)
+        note_input(self.env, ChangelogInput.create(
+            self.context, self.root, query, commits))
+
+    def _outdated(self, changed=()):
+        self._new_build()
+        return sorted(tracking.env_get_outdated(
+            Mock(), self.env, set(), set(changed), set()))
+
+    def test_nothing_changed(self):
+        self._read('index', {})
+        assert_equal([], self._outdated())
+
+    def test_new_commit(self):
+        self._read('index', {})
+        commit_files(self.repo, ['a.txt'])
+        assert_equal(['index'], self._outdated())
+
+    def test_new_commit_outside_filter(self):
+        self._read('all', {})
+        self._read('docs', {'filename_filter': 'docs/'})
+        commit_files(self.repo, ['a.txt'])
+        assert_equal(['all'], self._outdated())
+
+    def test_rev_list_not_moved(self):
+        self.repo.create_tag('v1')
+        self._read('release', {'rev-list': 'v1'})
+        commit_files(self.repo, ['a.txt'])
+        assert_equal([], self._outdated())
+
+    def test_new_tag(self):
+        self._read('release', {'rev-list': 'HEAD'})
+        self.env.docname = 'grouped'
+        note_input(self.env, TagsInput.create(self.context, self.repo))
+        self.repo.create_tag('v1')
+        assert_equal(['grouped'], self._outdated())
+
+    def test_missing_revision(self):
+        tag = self.repo.create_tag('v1')
+        self._read('release', {'rev-list': 'v1'})
+        self.repo.delete_tag(tag)
+        assert_equal(['release'], self._outdated())
+
+    def test_relative_dates_moved(self):
+        self._read('recent', {'since': '1 week ago'})
+        self._read('old', {'until': '1 week ago'})
+        later = '@{0}'.format(self.repo.head.commit.committed_date + 1)
+        with patch.object(context_module, 'absolute_dates',
+                          return_value=(later, later)):
+            assert_equal(['recent'], self._outdated())
+
+    def test_changed_documents_skipped(self):
+        self._read('index', {})
+        commit_files(self.repo, ['a.txt'])
+        assert_equal([], self._outdated(changed=['index']))
+
+    def test_commit_detail(self):
+        self.env.docname = 'index'
+        note_input(self.env,
+                   CommitDetailInput.create(self.context, self.repo, False,
+                                            False))
+        assert_equal([], self._outdated())
+        self.repo.index.commit('second')
+        assert_equal(['index'], self._outdated())
+
+    def test_commit_detail_untracked(self):
+        self.env.docname = 'index'
+        note_input(self.env, CommitDetailInput.create(
+            self.context, self.repo, False, True))
+        open(os.path.join(self.root, 'new'), 'w+').close()
+        assert_equal(['index'], self._outdated())
+
+    def test_purge(self):
+        self._read('index', {})
+        tracking.env_purge_doc(Mock(), self.env, 'index')
+        assert_equal({}, self.env.sphinx_git_inputs)
+
+    def test_merge(self):
+        other = FakeEnv()
+        other.sphinx_git_inputs = {'a': set(['input']), 'b': set(['input'])}
+        tracking.env_merge_info(Mock(), self.env, ['a'], other)
+        assert_equal({'a': set(['input'])}, self.env.sphinx_git_inputs)